@@ -1,8 +1,24 @@
+import functools
+import hashlib
+import os
+import stat
+import time
+
 from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.staticfiles import NotModifiedResponse
+
+from app.config import get_config
+from app.core import metrics
 
-from app.models.exceptions import InternalServerError, NotFoundError, ValidationError
+from app.models.exceptions import (
+    InternalServerError,
+    NotFoundError,
+    TooManyRequestsError,
+    ValidationError,
+)
 
 
 class GlobalExceptionMiddleware(BaseHTTPMiddleware):
@@ -22,11 +38,106 @@ class GlobalExceptionMiddleware(BaseHTTPMiddleware):
                 return JSONResponse(
                     content={"error": str(e)}, status_code=e.status_code
                 )
+            elif isinstance(e, TooManyRequestsError):
+                return JSONResponse(
+                    content={"error": str(e)},
+                    status_code=e.status_code,
+                    headers={"Retry-After": "1"},
+                )
             else:
                 return JSONResponse(content={"error": str(e)}, status_code=500)
 
 
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Times every request and reports its stages in a Server-Timing header."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        config = get_config()
+        self.server_timing = bool(config.get("metrics.server_timing", True))
+        self.in_flight = 0
+        self.durations = metrics.registry.histogram(
+            "http_request_duration_seconds",
+            "Time to handle a request, by route and status",
+            config.get("metrics.buckets", metrics.DEFAULT_BUCKETS),
+        )
+        metrics.registry.callback(
+            "http_requests_in_flight",
+            "Requests being handled",
+            lambda: self.in_flight,
+        )
+
+    async def dispatch(self, request, call_next):
+        start = time.perf_counter()
+        self.in_flight += 1
+        try:
+            with metrics.request_timings() as timings:
+                response = await call_next(request)
+        finally:
+            self.in_flight -= 1
+        elapsed = time.perf_counter() - start
+        # the route template, so path parameters don't explode the series
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        self.durations.observe(
+            elapsed,
+            method=request.method,
+            route=route,
+            status=response.status_code,
+        )
+        if self.server_timing:
+            response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+        return response
+
+
+@functools.lru_cache(maxsize=8192)
+def content_etag(path: str, mtime_ns: int, size: int) -> str:
+    # keyed on mtime and size so a rewritten file is hashed again, while a
+    # rewrite with identical bytes (e.g. re-indexing) keeps its ETag
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()}"'
+
+
 class StaticFilesHandler(StaticFiles):
+    """Static files with content-hash ETags and Cache-Control.
+
+    Conditional requests (If-None-Match, If-Modified-Since) are answered
+    with 304 by StaticFiles; the 304 keeps the ETag and Cache-Control.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        max_age = int(get_config().get("static.cache_max_age", 86400))
+        self.cache_control = f"public, max-age={max_age}"
+
+    def lookup_path(self, path: str):
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+            # StaticFiles runs this on a worker thread, so hash the file here
+            # and leave file_response, which runs on the event loop, a cache hit
+            content_etag(full_path, stat_result.st_mtime_ns, stat_result.st_size)
+        return full_path, stat_result
+
+    def file_response(
+        self,
+        full_path: str | os.PathLike,
+        stat_result: os.stat_result,
+        scope,
+        status_code: int = 200,
+    ):
+        response = FileResponse(
+            full_path, status_code=status_code, stat_result=stat_result
+        )
+        response.headers["ETag"] = content_etag(
+            str(full_path), stat_result.st_mtime_ns, stat_result.st_size
+        )
+        response.headers["Cache-Control"] = self.cache_control
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
     async def get_response(self, path, scope):
         response = await super().get_response(path, scope)
         if isinstance(response, FileResponse):
@@ -35,6 +146,8 @@ class StaticFilesHandler(StaticFiles):
                 response.headers["Content-Type"] = "image/jpeg"
             elif path.endswith(".png"):
                 response.headers["Content-Type"] = "image/png"
+            elif path.endswith(".webp"):
+                response.headers["Content-Type"] = "image/webp"
             elif path.endswith(".gif"):
                 response.headers["Content-Type"] = "image/gif"
             elif path.endswith(".svg"):
@@ -1,17 +1,20 @@
 import logging
+from typing import TYPE_CHECKING
 
 from fastapi import APIRouter, Depends
 
 from app.services import get_embedder
-from app.services.embedder import Embedder
 from app.core.logger import get_logger
 
+if TYPE_CHECKING:
+    from app.services.embedder import Embedder
+
 health_router = APIRouter()
 
 
 @health_router.get("/health")
 async def health(
-    embedder: Embedder = Depends(get_embedder),
+    embedder: "Embedder" = Depends(get_embedder),
     logger: logging.Logger = Depends(get_logger),
 ):
     logger.info("Health check")
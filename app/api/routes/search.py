@@ -1,72 +1,356 @@
+import asyncio
+import base64
+import binascii
+import json
 import logging
 import time
 from http.client import HTTPException
+from typing import Any, Dict, List, Literal
 
-from fastapi import APIRouter, Depends, File, UploadFile
-from fastapi.responses import JSONResponse
-from PIL import Image
+from fastapi import APIRouter, Depends, File, Form, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from app.core.llm import llm
+from app.config import get_config
+from app.core import metrics
 from app.core.logger import get_logger
-from app.models.exceptions import InternalServerError, ValidationError
-from app.models.search import AdditionalWeaviateParams, TextSearchRequest
-from app.services import get_weaviate
-from app.services.search import WeaviateSearch
+from app.core.tags import TagExtractor
+from app.models.exceptions import (
+    InternalServerError,
+    NotFoundError,
+    TooManyRequestsError,
+    ValidationError,
+)
+from app.models.search import (
+    AdditionalWeaviateParams,
+    BatchSearchQuery,
+    BatchSearchRequest,
+    CrossModalFusion,
+    TextSearchRequest,
+)
+from app.services import (
+    get_executor,
+    get_image_decoder,
+    get_pager,
+    get_tag_extractor,
+    get_weaviate,
+)
+from app.services.executor import InferenceExecutor
+from app.services.image_decoder import ImageDecoder
+from app.services.pagination import ResultPager, decode_cursor
+from app.services.search import Search
+from app.utils import ImageDecodeError
 
 search_router = APIRouter()
 
 
-knowldege_graph = {
-    # exhaustive list of tags for the search space
-    # query -> extract tags (what tags are there in the query)
-    # while searching in weaviate, use the tags to filter the results
-}
+def search_response(
+    results: List[Dict[str, Any]],
+    next_cursor: str | None,
+    start_time: float,
+    stream: bool,
+):
+    """The page as one JSON document, or with `stream` as NDJSON lines.
+
+    The page is fetched in full before either is sent; streaming only lets
+    clients handle each result as its line arrives instead of parsing the
+    whole body.
+    """
+    query_time = (time.time() - start_time) * 1000
+    if not stream:
+        with metrics.stage("serialization"):
+            return JSONResponse(
+                content={
+                    "results": results,
+                    "next_cursor": next_cursor,
+                    "query_time": query_time,
+                }
+            )
+
+    def lines():
+        for result in results:
+            yield json.dumps({"result": result}) + "\n"
+        yield json.dumps({"next_cursor": next_cursor, "query_time": query_time}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 @search_router.post("/search-text")
 async def search_text(
     body: TextSearchRequest,
-    weaviate: WeaviateSearch = Depends(get_weaviate),
+    weaviate: Search = Depends(get_weaviate),
+    executor: InferenceExecutor = Depends(get_executor),
+    tag_extractor: TagExtractor = Depends(get_tag_extractor),
+    pager: ResultPager = Depends(get_pager),
     logger: logging.Logger = Depends(get_logger),
 ):
     start_time = time.time()
-    query = body.query.strip()
-    if not query:
-        raise ValidationError(message="query is required")
-
     top_k = body.top_k
     if top_k < 1:
         raise ValidationError(message="top_k must be greater than 0")
 
+    query = body.query.strip()
+    if not query and body.cursor is None:
+        raise ValidationError(message="query is required")
+    if body.cursor is None:
+        pager.check_page(body.offset, top_k)
+
     try:
-        tags = llm.generate_tags(query)
-        results = weaviate.search(
-            query, top_k, additional_params=AdditionalWeaviateParams(tags=tags)
-        )
-        end_time = time.time()
-        logger.debug(f"time taken to search: {end_time - start_time} seconds")
-        return JSONResponse(
-            content={
-                "results": results,
-                "query_time": (end_time - start_time) * 1000,
-            }
-        )
+        if body.cursor is not None:
+            session_id, offset = decode_cursor(body.cursor)
+        else:
+            # keyword and hybrid queries match tags through bm25 instead of
+            # paying for tag extraction up front
+            tags = None
+            if body.mode == "vector":
+                tags = await executor.run(
+                    metrics.timed("tag_extraction", tag_extractor.extract), query
+                )
+            params = AdditionalWeaviateParams(
+                tags=tags,
+                mode=body.mode,
+                alpha=body.alpha,
+                group_by_image=body.group_by_image,
+                fusion=body.fusion,
+                cross_modal_fusion=body.cross_modal_fusion,
+                image_weight=body.image_weight,
+                min_similarity=body.min_similarity,
+                image_min_similarity=body.cross_modal_min_similarity,
+                rerank=body.rerank,
+            )
+            # embed once; every later page of this query reuses the vector
+            query_vector = None
+            if body.mode != "keyword":
+                query_vector = await executor.run(weaviate.embed_query, query)
+            session_id = pager.create(
+                lambda n: weaviate.search(query, n, params, query_vector=query_vector)
+            )
+            offset = body.offset
+
+        results, next_cursor = await executor.run(pager.page, session_id, offset, top_k)
+        logger.debug(f"time taken to search: {time.time() - start_time} seconds")
+        return search_response(results, next_cursor, start_time, body.stream)
+    except (TooManyRequestsError, NotFoundError, ValidationError):
+        raise
     except Exception as e:
         raise InternalServerError(message=str(e))
 
 
 @search_router.post("/search-image")
 async def search_image(
-    file: UploadFile = File(...),
-    weaviate: WeaviateSearch = Depends(get_weaviate),
+    file: UploadFile | None = File(None),
+    top_k: int = Form(10),
+    offset: int = Form(0),
+    cursor: str | None = Form(None),
+    stream: bool = Form(False),
+    min_similarity: float | None = Form(None),
+    # cross_modal also matches the image against captions, thresholded by
+    # cross_modal_min_similarity
+    mode: Literal["vector", "cross_modal"] = Form("vector"),
+    cross_modal_min_similarity: float | None = Form(None),
+    cross_modal_fusion: CrossModalFusion = Form("rrf"),
+    image_weight: float = Form(0.5),
+    weaviate: Search = Depends(get_weaviate),
+    executor: InferenceExecutor = Depends(get_executor),
+    decoder: ImageDecoder = Depends(get_image_decoder),
+    pager: ResultPager = Depends(get_pager),
+    logger: logging.Logger = Depends(get_logger),
+):
+    start_time = time.time()
+    if top_k < 1:
+        raise ValidationError(message="top_k must be greater than 0")
+
+    if offset < 0:
+        raise ValidationError(message="offset must not be negative")
+
+    if cursor is None:
+        pager.check_page(offset, top_k)
+
+    for name, threshold in (
+        ("min_similarity", min_similarity),
+        ("cross_modal_min_similarity", cross_modal_min_similarity),
+    ):
+        if threshold is not None and not -1 <= threshold <= 1:
+            raise ValidationError(message=f"{name} must be between -1 and 1")
+
+    if not 0 <= image_weight <= 1:
+        raise ValidationError(message="image_weight must be between 0 and 1")
+
+    if cursor is None:
+        if file is None:
+            raise ValidationError(message="file is required")
+        if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
+            raise ValidationError(message="file must be an image")
+
+    try:
+        if cursor is not None:
+            session_id, offset = decode_cursor(cursor)
+        else:
+            # one byte over the limit is enough for the decoder to reject it
+            limit = -1 if decoder.max_bytes is None else decoder.max_bytes + 1
+            # read first, so a slow upload isn't counted as decode time
+            data = await file.read(limit)
+            with metrics.stage("decode"):
+                image = await decoder.decode_async(data)
+            query_vector = await executor.run(weaviate.embed_image_query, image)
+            if mode == "cross_modal":
+                params = AdditionalWeaviateParams(
+                    mode=mode,
+                    cross_modal_fusion=cross_modal_fusion,
+                    image_weight=image_weight,
+                    min_similarity=cross_modal_min_similarity,
+                    image_min_similarity=min_similarity,
+                )
+                session_id = pager.create(
+                    lambda n: weaviate.cross_modal_search(query_vector, n, params)
+                )
+            else:
+                session_id = pager.create(
+                    lambda n: weaviate.image_search_by_vector(
+                        query_vector, n, min_similarity
+                    )
+                )
+
+        results, next_cursor = await executor.run(pager.page, session_id, offset, top_k)
+        return search_response(results, next_cursor, start_time, stream)
+    except ImageDecodeError as e:
+        raise ValidationError(message=str(e))
+    except (TooManyRequestsError, NotFoundError, ValidationError):
+        raise
+    except Exception as e:
+        raise InternalServerError(message=str(e))
+
+
+def decode_base64(data: str) -> bytes:
+    try:
+        return base64.b64decode(data, validate=True)
+    except binascii.Error:
+        raise ValidationError(message="image must be base64 encoded")
+
+
+@search_router.post("/search-batch")
+async def search_batch(
+    body: BatchSearchRequest,
+    weaviate: Search = Depends(get_weaviate),
+    executor: InferenceExecutor = Depends(get_executor),
+    decoder: ImageDecoder = Depends(get_image_decoder),
+    tag_extractor: TagExtractor = Depends(get_tag_extractor),
+    pager: ResultPager = Depends(get_pager),
     logger: logging.Logger = Depends(get_logger),
 ):
-    if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
-        raise ValidationError(message="file must be an image")
+    start_time = time.time()
+    config = get_config()
+    max_queries = int(config.get("search.batch.max_queries", 64))
+    if len(body.queries) > max_queries:
+        raise ValidationError(message=f"at most {max_queries} queries per batch")
+
+    for query in body.queries:
+        if query.top_k > pager.max_results:
+            raise ValidationError(message=f"top_k must not exceed {pager.max_results}")
+        if (query.query is None) == (query.image is None):
+            raise ValidationError(
+                message="each query needs exactly one of query or image"
+            )
+        if query.query is not None and not query.query.strip():
+            raise ValidationError(message="query is required")
+
+    text_indices = [
+        i for i, q in enumerate(body.queries) if q.query and q.mode != "keyword"
+    ]
+    image_indices = [i for i, q in enumerate(body.queries) if q.image is not None]
+    semaphore = asyncio.Semaphore(int(config.get("search.batch.max_concurrency", 8)))
+
+    async def decode(i: int):
+        # bounded like the queries, so a batch of large images can't occupy
+        # every decode worker at once
+        async with semaphore:
+            return await decoder.decode_async(decode_base64(body.queries[i].image))
 
-    image = Image.open(file.file)
     try:
-        results = weaviate.image_search(image)
-        return JSONResponse(content={"results": results}, status_code=200)
+        with metrics.stage("decode"):
+            images = await asyncio.gather(*(decode(i) for i in image_indices))
+        # one forward pass per modality for the whole batch
+        text_vectors, image_vectors = await asyncio.gather(
+            executor.run(
+                weaviate.embed_queries,
+                [body.queries[i].query.strip() for i in text_indices],
+            ),
+            executor.run(weaviate.embed_image_queries, list(images)),
+        )
+    except ImageDecodeError as e:
+        raise ValidationError(message=str(e))
+    except (TooManyRequestsError, ValidationError):
+        raise
     except Exception as e:
         raise InternalServerError(message=str(e))
+
+    vectors: Dict[int, List[float]] = dict(zip(text_indices, text_vectors))
+    vectors.update(zip(image_indices, image_vectors))
+
+    async def run_query(i: int, query: BatchSearchQuery) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                tags = None
+                if query.image is None and query.mode == "vector":
+                    tags = await executor.run(
+                        metrics.timed("tag_extraction", tag_extractor.extract),
+                        query.query.strip(),
+                    )
+                # min_similarity thresholds matches of the query's own modality
+                caption_threshold = query.min_similarity
+                image_threshold = query.cross_modal_min_similarity
+                if query.image is not None:
+                    caption_threshold, image_threshold = (
+                        image_threshold,
+                        caption_threshold,
+                    )
+                params = AdditionalWeaviateParams(
+                    tags=tags,
+                    mode=query.mode,
+                    alpha=query.alpha,
+                    group_by_image=query.group_by_image,
+                    fusion=query.fusion,
+                    cross_modal_fusion=query.cross_modal_fusion,
+                    image_weight=query.image_weight,
+                    min_similarity=caption_threshold,
+                    image_min_similarity=image_threshold,
+                    rerank=query.rerank,
+                )
+                if query.image is None:
+                    results = await executor.run(
+                        weaviate.search,
+                        query.query.strip(),
+                        query.top_k,
+                        params,
+                        query_vector=vectors.get(i),
+                    )
+                elif query.mode == "cross_modal":
+                    results = await executor.run(
+                        weaviate.cross_modal_search, vectors[i], query.top_k, params
+                    )
+                else:
+                    results = await executor.run(
+                        weaviate.image_search_by_vector,
+                        vectors[i],
+                        query.top_k,
+                        query.min_similarity,
+                    )
+                return {"results": results}
+            except TooManyRequestsError:
+                # an overloaded server fails the whole batch with a 429, so
+                # the caller backs off instead of reading partial results
+                raise
+            except Exception as e:
+                # one failing query shouldn't discard the rest of the batch
+                logger.error(f"batch query {i} failed: {e}")
+                return {"results": [], "error": str(e)}
+
+    responses = await asyncio.gather(
+        *(run_query(i, query) for i, query in enumerate(body.queries))
+    )
+    with metrics.stage("serialization"):
+        return JSONResponse(
+            content={
+                "responses": responses,
+                "query_time": (time.time() - start_time) * 1000,
+            }
+        )
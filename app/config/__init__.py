@@ -11,7 +11,7 @@ class AppConfig:
         self.env = dict(os.environ)
         self.config = {}
         config_file = config_path or os.environ.get(
-            "APP_CONFIG_PATH", "configs/config.yaml"
+            "APP_CONFIG_PATH", "configs/config.yml"
         )
         if os.path.exists(config_file):
             with open(config_file, "r") as f:
@@ -22,7 +22,7 @@ class AppConfig:
         self._initialized = True
 
     def get(self, key: str, default: Any = None) -> Any:
-        # Priority: env > config.yaml > default
+        # Priority: env > config.yml > default
         if key in self.env:
             return self.env.get(key)
         value = self._get_nested_config(key)
@@ -0,0 +1,56 @@
+import json
+import re
+from typing import Any, List
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "extract", "find", "following",
+    "for", "from", "her", "his", "in", "into", "is", "it", "its", "me", "of", "on",
+    "or", "show", "some", "tags", "the", "their", "there", "these", "this", "to",
+    "two", "while", "with",
+}  # fmt: skip
+
+
+def _keywords(text: str) -> List[str]:
+    words = re.findall(r"[a-z0-9][a-z0-9-]*", text.lower())
+    return list(dict.fromkeys(word for word in words if word not in _STOPWORDS))
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModels:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, model: str, contents: str, config: Any) -> FakeResponse:
+        self.calls += 1
+        try:
+            items = json.loads(contents)
+        except json.JSONDecodeError:
+            items = None
+        if isinstance(items, list):
+            return FakeResponse(
+                json.dumps(
+                    [
+                        {
+                            "id": item["id"],
+                            "tags": _keywords(" ".join(item["captions"])),
+                        }
+                        for item in items
+                    ]
+                )
+            )
+        return FakeResponse(json.dumps({"tags": _keywords(contents)}))
+
+
+class FakeLLMClient:
+    """Offline stand-in for `genai.Client` that tags by keyword extraction.
+
+    Selected with `llm.provider: fake`; handy for tests and for indexing
+    without a Gemini API key.
+    """
+
+    def __init__(self):
+        self.models = FakeModels()
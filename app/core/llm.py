@@ -1,12 +1,19 @@
+import concurrent.futures
+import hashlib
 import json
 import os
-from typing import List
+import random
+import threading
+import time
+from typing import Any, Dict, List
 
 from google import genai
 from google.genai import types
 from pydantic import BaseModel
 
+from app.config import get_config
 from app.core.logger import get_logger
+from app.core.tag_cache import TagCache
 
 SYSTEM_PROMPT = """
 You are a highly skilled AI agent specializing in extracting key attributes and entities from user queries. Your task is to identify the most descriptive and relevant words or phrases that define the object or concept the user is interested in. You should return the extracted attributes as a list of strings.
@@ -55,23 +62,96 @@ Now, respond to the following input with a Python list of strings:
 """
 
 
+BATCH_SYSTEM_PROMPT = """
+You are a highly skilled AI agent specializing in extracting key attributes and entities from image captions. Each input item is one image, given as an id and the captions written for that image. For every item, identify the most descriptive and relevant words or phrases that define what the image shows.
+
+**Input:** A JSON list of objects of the form {"id": "<image id>", "captions": ["caption", ...]}.
+
+**Output:** A JSON list of objects of the form {"id": "<image id>", "tags": ["tag", ...]}, with exactly one object per input item and the same ids.
+
+**Rules:**
+
+1.  **Focus on core attributes:** Extract words that directly describe the objects, people, actions and setting in the image. Adjectives, nouns, and key verbs are important.
+2.  **Per image:** Tags for an item must come only from that item's captions.
+3.  **Handle compound nouns:** Treat compound nouns (e.g., "coffee table", "fire truck") as single tags when they represent a distinct entity.
+4.  **Omit irrelevant words:** Exclude articles (a, an, the), prepositions (of, in, on) and other words that don't contribute to the core meaning.
+5.  **Stemming/Lemmatization:** Do *not* perform stemming or lemmatization. Return the words exactly as they appear in the captions.
+6.  **No duplicates:** Each tag appears at most once per item.
+7.  **Empty captions:** If an item has no useful captions, return an empty list of tags for it.
+8.  **Output Format:** The output *must* be valid JSON. Do not include any introductory or explanatory text before or after it, or any backticks.
+
+**Example:**
+
+Input: [{"id": "1", "captions": ["A brown dog runs on the beach.", "A dog playing near the ocean."]}, {"id": "2", "captions": ["Two men repair a red car."]}]
+Output: [{"id": "1", "tags": ["brown", "dog", "runs", "beach", "playing", "ocean"]}, {"id": "2", "tags": ["men", "repair", "red", "car"]}]
+"""
+
+
 class Tags(BaseModel):
     tags: List[str]
 
 
+class ImageTags(BaseModel):
+    id: str
+    tags: List[str]
+
+
+class BatchTags(BaseModel):
+    items: List[ImageTags]
+
+
 class LLMAdapter:
-    def __init__(self):
-        self._client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
-        self._model = "gemini-2.0-flash-001"
+    def __init__(self, client: Any = None, cache: TagCache | None = None):
+        config = get_config()
+        self._client = client or create_llm_client()
+        self._model = config.get("llm.model", "gemini-2.0-flash-001")
         self._config = types.GenerateContentConfig(
             system_instruction=SYSTEM_PROMPT,
             temperature=0.3,
             response_mime_type="application/json",
             response_schema=Tags,
         )
+        self._batch_config = types.GenerateContentConfig(
+            system_instruction=BATCH_SYSTEM_PROMPT,
+            temperature=0.3,
+            response_mime_type="application/json",
+            response_schema=list[ImageTags],
+        )
         self._logger = get_logger("llm")
+        # cached tags are only valid for the prompt and model that produced them
+        self._version = hashlib.sha1(
+            f"{self._model}\n{SYSTEM_PROMPT}".encode()
+        ).hexdigest()[:12]
+        self._batch_version = hashlib.sha1(
+            f"{self._model}\n{BATCH_SYSTEM_PROMPT}".encode()
+        ).hexdigest()[:12]
+        self._batch_max_items = int(config.get("llm.batch.max_items", 50))
+        self._batch_max_chars = int(config.get("llm.batch.max_chars", 24000))
+        self._max_retries = int(config.get("llm.batch.max_retries", 3))
+        self._backoff = float(config.get("llm.batch.backoff_seconds", 1))
+        self._timeout = float(config.get("llm.timeout_seconds", 2))
+        if cache is None and config.get("llm.cache.enabled", True):
+            cache = TagCache(
+                max_entries=int(config.get("llm.cache.max_entries", 10000)),
+                path=config.get("llm.cache.path"),
+            )
+        self._cache = cache
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=int(config.get("llm.max_concurrency", 8)),
+            thread_name_prefix="llm",
+        )
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._inflight_lock = threading.Lock()
 
-    def generate_tags(self, query: str) -> List[str]:
+    @property
+    def cache(self) -> TagCache | None:
+        return self._cache
+
+    def _cache_key(self, query: str) -> str:
+        normalized = " ".join(query.lower().split())
+        return f"{self._version}:{hashlib.sha1(normalized.encode()).hexdigest()}"
+
+    def _request_tags(self, query: str) -> List[str]:
         response = self._client.models.generate_content(
             model=self._model,
             contents=query,
@@ -82,13 +162,157 @@ class LLMAdapter:
 
         # assuming return ["list", "of", "strings"]
         # convert response.text to the Tags model
+        return Tags.model_validate_json(response.text).tags
+
+    def _fetch_tags(self, key: str, query: str) -> List[str]:
+        tags = self._pool.submit(self._request_tags, query).result(
+            timeout=self._timeout
+        )
+        if self._cache is not None:
+            self._cache.put(key, tags)
+        return tags
+
+    def generate_tags(self, query: str) -> List[str]:
+        """Extract tags for `query`, returning [] (no filtering) on failure.
+
+        Identical concurrent queries share a single LLM request, and results
+        are cached per prompt/model version.
+        """
+        key = self._cache_key(query)
+        if self._cache is not None:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._inflight[key] = future
+
+        if leader:
+            try:
+                future.set_result(self._fetch_tags(key, query))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._inflight_lock:
+                    self._inflight.pop(key, None)
+
         try:
-            return Tags.model_validate_json(response.text).tags
+            return future.result()
+        except concurrent.futures.TimeoutError:
+            self._logger.warning(
+                "tag extraction timed out after %.1fs, searching without tags",
+                self._timeout,
+            )
+            return []
         except json.JSONDecodeError:
             return []
         except Exception as e:
             self._logger.error("error generating tags: %s", e)
             return []
 
+    def _batch_cache_key(self, captions: List[str]) -> str:
+        normalized = json.dumps([" ".join(c.lower().split()) for c in captions])
+        return f"{self._batch_version}:{hashlib.sha1(normalized.encode()).hexdigest()}"
+
+    def _chunk(self, items: Dict[str, List[str]]) -> List[Dict[str, List[str]]]:
+        # keep each request under the item and prompt size limits; the
+        # character budget is a cheap stand-in for the model's token limit
+        chunks: List[Dict[str, List[str]]] = []
+        current: Dict[str, List[str]] = {}
+        size = 0
+        for img_id, captions in items.items():
+            item_size = len(img_id) + sum(len(caption) for caption in captions)
+            if current and (
+                len(current) >= self._batch_max_items
+                or size + item_size > self._batch_max_chars
+            ):
+                chunks.append(current)
+                current, size = {}, 0
+            current[img_id] = captions
+            size += item_size
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _request_batch_tags(self, chunk: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        contents = json.dumps(
+            [{"id": img_id, "captions": captions} for img_id, captions in chunk.items()]
+        )
+        for attempt in range(self._max_retries + 1):
+            try:
+                response = self._client.models.generate_content(
+                    model=self._model,
+                    contents=contents,
+                    config=self._batch_config,
+                )
+                items = BatchTags.model_validate_json(
+                    f'{{"items": {response.text}}}'
+                ).items
+                return {item.id: item.tags for item in items if item.id in chunk}
+            except Exception as e:
+                if attempt == self._max_retries:
+                    raise
+                delay = self._backoff * 2**attempt * (1 + random.random())
+                self._logger.warning(
+                    "batch tag request failed (attempt %d), retrying in %.1fs: %s",
+                    attempt + 1,
+                    delay,
+                    e,
+                )
+                time.sleep(delay)
+
+    def generate_tags_batch(self, items: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Extract tags for many images at once, keyed by image id.
+
+        `items` maps an image id to its captions. Images are sent in chunks
+        of one structured request each, chunks run concurrently on the
+        adapter's pool, and failed requests are retried with exponential
+        backoff. Images whose tags could not be extracted map to [].
+        """
+        results: Dict[str, List[str]] = {}
+        pending: Dict[str, List[str]] = {}
+        for img_id, captions in items.items():
+            cached = (
+                self._cache.get(self._batch_cache_key(captions))
+                if self._cache is not None
+                else None
+            )
+            if cached is not None:
+                results[img_id] = cached
+            else:
+                pending[img_id] = captions
+
+        futures = {
+            self._pool.submit(self._request_batch_tags, chunk): chunk
+            for chunk in self._chunk(pending)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            chunk = futures[future]
+            try:
+                tags_by_id = future.result()
+            except Exception as e:
+                self._logger.error(
+                    "error generating tags for %d images: %s", len(chunk), e
+                )
+                continue
+            for img_id, tags in tags_by_id.items():
+                results[img_id] = tags
+                if self._cache is not None:
+                    self._cache.put(self._batch_cache_key(chunk[img_id]), tags)
+
+        return {img_id: results.get(img_id, []) for img_id in items}
+
+
+def create_llm_client() -> Any:
+    if get_config().get("llm.provider", "gemini") == "fake":
+        from app.core.fake_llm import FakeLLMClient
+
+        return FakeLLMClient()
+    return genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+
 
 llm = LLMAdapter()
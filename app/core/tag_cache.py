@@ -0,0 +1,71 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.core.logger import get_logger
+
+
+class TagCache:
+    """LRU cache of extracted tags with an optional SQLite backing store.
+
+    Lookups hit the in-memory LRU first and fall back to SQLite when `path`
+    is set; entries found on disk are promoted back into memory.
+    """
+
+    def __init__(self, max_entries: int = 10000, path: Optional[str] = None):
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, List[str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self.hits = 0
+        self.misses = 0
+        self._logger = get_logger("tag_cache")
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tags (key TEXT PRIMARY KEY, tags TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            tags = self._entries.get(key)
+            if tags is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return tags
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT tags FROM tags WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    tags = json.loads(row[0])
+                    self._remember(key, tags)
+                    self.hits += 1
+                    return tags
+            self.misses += 1
+            return None
+
+    def put(self, key: str, tags: List[str]):
+        with self._lock:
+            self._remember(key, tags)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO tags (key, tags) VALUES (?, ?)",
+                    (key, json.dumps(tags)),
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, tags: List[str]):
+        self._entries[key] = tags
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
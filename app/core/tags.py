@@ -0,0 +1,111 @@
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List
+
+from app.core.logger import get_logger
+from app.core.tag_cache import TagCache
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_TERMINAL = "$"
+
+
+def tokenize(text: str) -> List[str]:
+    # mirrors Weaviate's "word" tokenization used on the tags property
+    return _TOKEN_RE.findall(text.lower())
+
+
+class TagExtractor(ABC):
+    @abstractmethod
+    def extract(self, query: str) -> List[str]:
+        pass
+
+
+class LLMTagExtractor(TagExtractor):
+    def __init__(self):
+        # imported lazily so the local extractor works without a Gemini client
+        from app.core.llm import llm
+
+        self._llm = llm
+
+    @property
+    def cache(self) -> TagCache | None:
+        return self._llm.cache
+
+    def extract(self, query: str) -> List[str]:
+        return self._llm.generate_tags(query)
+
+
+class VocabularyTagExtractor(TagExtractor):
+    """Matches query phrases against the tags already stored in the index.
+
+    Known tags are held in a token trie, so a query is scanned once with
+    greedy longest-match and no network call ("sports car" wins over "car").
+    """
+
+    def __init__(self, tags: Iterable[str] = ()):
+        self._trie: Dict[str, Any] = {}
+        self._size = 0
+        self._logger = get_logger("tag_extractor")
+        for tag in tags:
+            self.add(tag)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, tag: str):
+        tokens = tokenize(tag)
+        if not tokens:
+            return
+        node = self._trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        if _TERMINAL not in node:
+            self._size += 1
+        node[_TERMINAL] = " ".join(tokens)
+
+    def extract(self, query: str) -> List[str]:
+        tokens = tokenize(query)
+        found: Dict[str, None] = {}
+        i = 0
+        while i < len(tokens):
+            node = self._trie
+            match, match_end = None, i
+            for j in range(i, len(tokens)):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if _TERMINAL in node:
+                    match, match_end = node[_TERMINAL], j + 1
+            if match is None:
+                i += 1
+            else:
+                found[match] = None
+                i = match_end
+        return list(found)
+
+    def tags(self) -> List[str]:
+        result: List[str] = []
+        stack = [self._trie]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key == _TERMINAL:
+                    result.append(child)
+                else:
+                    stack.append(child)
+        return sorted(result)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # replaced atomically, so a running API never reads half a file
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.tags(), f)
+        os.replace(f"{path}.tmp", path)
+        self._logger.info("saved tag vocabulary of %d tags to %s", self._size, path)
+
+    @classmethod
+    def load(cls, path: str) -> "VocabularyTagExtractor":
+        with open(path, "r") as f:
+            return cls(json.load(f))
@@ -0,0 +1,19 @@
+import glob
+import os
+from typing import List
+
+
+def shard_paths(path: str) -> List[str]:
+    """The per-shard checkpoints written next to the one at `path`."""
+    root, ext = os.path.splitext(path)
+    return glob.glob(f"{root}-*-of-*{ext}")
+
+
+def last_indexed_at(path: str) -> float | None:
+    """When the checkpoint at `path` or one of its shards last changed."""
+    times = [
+        os.path.getmtime(checkpoint)
+        for checkpoint in [path] + shard_paths(path)
+        if os.path.exists(checkpoint)
+    ]
+    return max(times, default=None)
@@ -1,9 +1,12 @@
+import copy
+from typing import Any, Dict
+
+from app.config import get_config
+
 Image = {
     "class": "Image",
     "description": "Stores image URL and its precomputed vector.",
     "vectorizer": "none",
-    "vectorIndexType": "hnsw",
-    "vectorIndexConfig": {"distance": "cosine"},
     "properties": [
         {
             "name": "imageUrl",
@@ -14,7 +17,7 @@ Image = {
         },
         {
             "name": "tags",
-            "dataType": ["text"],
+            "dataType": ["text[]"],
             "description": "The tags associated with the image.",
             "indexFilterable": True,
             "indexSearchable": True,
@@ -28,8 +31,6 @@ Caption = {
     "class": "Caption",
     "description": "Stores individual caption text, its precomputed vector, and a link to the parent image.",
     "vectorizer": "none",
-    "vectorIndexType": "hnsw",
-    "vectorIndexConfig": {"distance": "cosine"},
     "properties": [
         {
             "name": "captionText",
@@ -39,6 +40,14 @@ Caption = {
             "indexSearchable": True,
             "tokenization": "word",
         },
+        {
+            "name": "tags",
+            "dataType": ["text[]"],
+            "description": "The tags of the parent image, copied here for filtering and keyword search.",
+            "indexFilterable": True,
+            "indexSearchable": True,
+            "tokenization": "word",
+        },
         {
             "name": "forImage",
             "dataType": ["Image"],
@@ -46,3 +55,86 @@ Caption = {
         },
     ],
 }
+
+
+def _hnsw_config(settings: Dict[str, Any]) -> Dict[str, Any]:
+    config: Dict[str, Any] = {
+        "distance": "cosine",
+        "ef": int(settings.get("ef", -1)),
+        "efConstruction": int(settings.get("ef_construction", 128)),
+        "maxConnections": int(settings.get("max_connections", 32)),
+    }
+    compression = settings.get("compression", "none")
+    if compression == "pq":
+        pq = settings.get("pq", {})
+        config["pq"] = {
+            "enabled": True,
+            # 0 lets Weaviate pick segments from the vector dimensions
+            "segments": int(pq.get("segments", 0)),
+            "centroids": int(pq.get("centroids", 256)),
+            "trainingLimit": int(pq.get("training_limit", 100000)),
+        }
+    elif compression == "sq":
+        sq = settings.get("sq", {})
+        config["sq"] = {
+            "enabled": True,
+            "trainingLimit": int(sq.get("training_limit", 100000)),
+            "rescoreLimit": int(sq.get("rescore_limit", 20)),
+        }
+    elif compression == "bq":
+        config["bq"] = {"enabled": True}
+    elif compression != "none":
+        raise ValueError(f"unknown vector compression {compression}")
+    return config
+
+
+def _flat_config(settings: Dict[str, Any]) -> Dict[str, Any]:
+    config: Dict[str, Any] = {"distance": "cosine"}
+    compression = settings.get("compression", "none")
+    if compression == "bq":
+        config["bq"] = {"enabled": True}
+    elif compression != "none":
+        # flat indexes only support binary quantization
+        raise ValueError(f"flat index does not support {compression} compression")
+    return config
+
+
+def vector_index(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """The vectorIndexType and vectorIndexConfig schema fields for `settings`."""
+    index_type = settings.get("type", "hnsw")
+    if index_type == "hnsw":
+        config = _hnsw_config(settings)
+    elif index_type == "flat":
+        config = _flat_config(settings)
+    elif index_type == "dynamic":
+        # starts flat and switches to hnsw once the collection outgrows
+        # `dynamic_threshold` objects; flat only supports bq
+        flat_settings = dict(settings)
+        if flat_settings.get("compression") != "bq":
+            flat_settings["compression"] = "none"
+        config = {
+            "distance": "cosine",
+            "threshold": int(settings.get("dynamic_threshold", 10000)),
+            "hnsw": _hnsw_config(settings),
+            "flat": _flat_config(flat_settings),
+        }
+    else:
+        raise ValueError(f"unknown vector index type {index_type}")
+    return {"vectorIndexType": index_type, "vectorIndexConfig": config}
+
+
+def index_settings(collection: str) -> Dict[str, Any]:
+    """`vector_index.default` from config, overridden by `vector_index.<collection>`."""
+    config = get_config()
+    settings = dict(config.get("vector_index.default", {}) or {})
+    settings.update(config.get(f"vector_index.{collection}", {}) or {})
+    return settings
+
+
+def collection_schema(
+    collection: Dict[str, Any], settings: Dict[str, Any] | None = None
+) -> Dict[str, Any]:
+    """`collection` with its vector index configured from `settings` or config."""
+    if settings is None:
+        settings = index_settings(collection["class"])
+    return {**copy.deepcopy(collection), **vector_index(settings)}
@@ -1,55 +1,144 @@
+import glob
+import itertools
 import os
+from abc import ABC, abstractmethod
 from os import path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from datasets import Dataset, load_dataset
-
+from app.config import get_config
 from app.core.logger import get_logger
 
 logger = get_logger(__name__)
 
-# data_files = [
-#     "test-00000-of-00009.parquet",
-#     "test-00001-of-00009.parquet",
-#     "test-00002-of-00009.parquet",
-#     "test-00003-of-00009.parquet",
-#     "test-00004-of-00009.parquet",
-#     "test-00005-of-00009.parquet",
-#     "test-00006-of-00009.parquet",
-#     "test-00007-of-00009.parquet",
-#     "test-00008-of-00009.parquet",
-# ]
-# logger.info("loading dataset")
-# image_dataset: Dataset = load_dataset(
-#     "parquet",
-#     data_files=[path.join("flickr30k/data", f) for f in data_files],
-#     split="train",
-# )
-# logger.info("dataset loaded with %d rows", image_dataset.num_rows)
-
-
-image_dataset = load_dataset("lmms-lab/flickr30k")
-
-
-# def get_image_dataset_dict() -> dict:
-#     image_dataset = {
-#         "image": [],
-#         "caption": [],
-#         "img_id": [],
-#         "filename": [],
-#         "sentids": [],
-#     }
-#     for file in os.listdir("images"):
-#         logger.info("processing image: %s", file)
-#         with open(path.join("images", file), "rb") as f:
-#             image_bytes = f.read()
-#             image_dataset["image"].append({"bytes": image_bytes})
-#             caption = file.split("-")[0]
-#             image_dataset["caption"].append([caption])
-#             image_dataset["img_id"].append(file)
-#             image_dataset["filename"].append(file)
-#             image_dataset["sentids"].append([file])
-#     logger.info("dataset created with %d rows", len(image_dataset["image"]))
-#     return image_dataset
-
-
-# image_dataset: Dataset = Dataset.from_dict(get_image_dataset_dict())
+Row = Dict[str, Any]
+Batch = Dict[str, List[Any]]
+# (index, count): this process handles slice `index` of `count` disjoint slices
+Shard = Tuple[int, int]
+
+COLUMNS = ["image", "caption", "img_id", "filename", "sentids"]
+
+
+def parse_shard(value: str) -> Shard:
+    index, count = (int(part) for part in value.split("/"))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"invalid shard {value}, expected i/n with 0 <= i < n")
+    return index, count
+
+
+def _take(rows: Iterator[Row], limit: Optional[int], shard: Shard) -> Iterator[Row]:
+    # limit applies to the dataset as a whole, so every shard sees the same
+    # first `limit` rows and keeps its own share of them
+    if limit is not None:
+        rows = itertools.islice(rows, limit)
+    index, count = shard
+    return itertools.islice(rows, index, None, count)
+
+
+def _batched(rows: Iterator[Row], batch_size: int) -> Iterator[Batch]:
+    while True:
+        chunk = list(itertools.islice(rows, batch_size))
+        if not chunk:
+            return
+        yield {column: [row[column] for row in chunk] for column in COLUMNS}
+
+
+class DataSource(ABC):
+    """A lazily read dataset of images and their captions.
+
+    Rows are only read as batches are requested, so memory stays bounded
+    by the batch size rather than the size of the dataset.
+    """
+
+    @abstractmethod
+    def rows(self, limit: Optional[int] = None, shard: Shard = (0, 1)) -> Iterator[Row]:
+        pass
+
+    def batches(
+        self,
+        batch_size: int,
+        limit: Optional[int] = None,
+        shard: Shard = (0, 1),
+    ) -> Iterator[Batch]:
+        return _batched(self.rows(limit, shard), batch_size)
+
+
+class HuggingFaceSource(DataSource):
+    def __init__(self, name: str, split: str = "test", streaming: bool = True):
+        self._name = name
+        self._split = split
+        self._streaming = streaming
+
+    def rows(self, limit: Optional[int] = None, shard: Shard = (0, 1)) -> Iterator[Row]:
+        from datasets import Image, load_dataset
+
+        logger.info("loading dataset %s (streaming=%s)", self._name, self._streaming)
+        dataset = load_dataset(self._name, split=self._split, streaming=self._streaming)
+        # keep the encoded bytes; decoding happens in the indexer's decode stage
+        dataset = dataset.cast_column("image", Image(decode=False))
+        index, count = shard
+        if (
+            count > 1
+            and limit is None
+            and self._streaming
+            and count <= dataset.n_shards
+        ):
+            # split by underlying files so each process only downloads its part
+            return iter(dataset.shard(num_shards=count, index=index))
+        return _take(iter(dataset), limit, shard)
+
+
+class ParquetSource(DataSource):
+    def __init__(self, directory: str, read_batch_size: int = 256):
+        self._files = sorted(glob.glob(path.join(directory, "*.parquet")))
+        self._read_batch_size = read_batch_size
+
+    def _read(self, files: List[str]) -> Iterator[Row]:
+        import pyarrow.parquet as pq
+
+        for file in files:
+            logger.info("reading %s", file)
+            for record_batch in pq.ParquetFile(file).iter_batches(
+                batch_size=self._read_batch_size
+            ):
+                yield from record_batch.to_pylist()
+
+    def rows(self, limit: Optional[int] = None, shard: Shard = (0, 1)) -> Iterator[Row]:
+        index, count = shard
+        if count > 1 and limit is None and count <= len(self._files):
+            return self._read(self._files[index::count])
+        return _take(self._read(self._files), limit, shard)
+
+
+class ImageDirectorySource(DataSource):
+    """Image files named `<caption>-<anything>.<ext>` in a single directory."""
+
+    def __init__(self, directory: str):
+        self._directory = directory
+
+    def rows(self, limit: Optional[int] = None, shard: Shard = (0, 1)) -> Iterator[Row]:
+        files = iter(sorted(os.listdir(self._directory)))
+        for file in _take(files, limit, shard):
+            logger.info("processing image: %s", file)
+            with open(path.join(self._directory, file), "rb") as f:
+                image_bytes = f.read()
+            yield {
+                "image": {"bytes": image_bytes},
+                "caption": [file.split("-")[0]],
+                "img_id": file,
+                "filename": file,
+                "sentids": [file],
+            }
+
+
+def get_data_source() -> DataSource:
+    config = get_config()
+    source = config.get("dataset.source", "huggingface")
+    if source == "parquet":
+        return ParquetSource(config.get("dataset.path", "flickr30k/data"))
+    if source == "images":
+        return ImageDirectorySource(config.get("dataset.path", "images"))
+    return HuggingFaceSource(
+        config.get("dataset.name", "lmms-lab/flickr30k"),
+        split=config.get("dataset.split", "test"),
+        streaming=config.get("dataset.streaming", True),
+    )
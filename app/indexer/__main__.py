@@ -1,134 +1,342 @@
 import argparse
-import concurrent.futures
-import io
 import logging
-from typing import Any, Dict, List
-
-import weaviate
-from datasets import Dataset
-from PIL import Image
+import os
+from typing import Any, Callable, Dict, Iterator, List
 
 from app.config import get_config
 from app.core.llm import llm
 from app.core.logger import get_logger
-from app.data.images import image_dataset
-from app.services import get_embedder
-from app.services.embedder import Embedder
-from app.services.search import IndexableDoc, WeaviateSearch
+from app.data.checkpoints import shard_paths
+from app.data.images import DataSource, Shard, get_data_source, parse_shard
+from app.indexer.checkpoint import Checkpoint, content_hash
+from app.indexer.pipeline import Pipeline, Stage
+from app.services import build_vocabulary, get_embedder
+from app.services.derivatives import derivative_sizes, write_derivatives
+from app.services.embedding_store import EmbeddingStore
+from app.services.image_decoder import ImageDecoder, create_image_decoder
+from app.services.numpy_search import NumpySearch
+from app.services.projection import load_projection
+from app.services.search import (
+    IndexableDoc,
+    Search,
+    WeaviateSearch,
+    caption_uuid,
+    image_uuid,
+)
+from app.services.weaviate_pool import WeaviateClientPool, connect_to_weaviate
 
 BATCH_SIZE = get_config().get("indexer.batch_size", 100)
 MAX_COUNT = 31783
+STATIC_DIR = "static"
 
 
-def generate_captions_query(captions: List[str]) -> str:
-    return "For the following captions, extract the tags: " + "\n".join(captions)
+class IndexBatch:
+    """A slice of the dataset as it moves through the indexing pipeline."""
 
+    def __init__(self, index: int, rows: Dict[str, List[Any]]):
+        self.index = index
+        self.image_data: List[Dict] = rows["image"]
+        self.captions: List[List[str]] = rows["caption"]
+        self.img_ids: List[str] = rows["img_id"]
+        self.filenames: List[str] = rows["filename"]
+        self.hashes: List[str] = []
+        self.failed_ids: set[str] = set()
+        self.tags: List[List[str]] = []
+        self.documents: List[IndexableDoc] = []
+        self.image_embeddings: List[List[float]] = []
+        self.text_embeddings: List[List[List[float]]] = []
 
-def index_batch(
-    batch_index: int,
-    batch: Dataset,
-    search: WeaviateSearch,
-    logger: logging.Logger,
-):
-    logger.info("indexing batch %d", batch_index)
-    image_data_list: List[Dict] = batch["image"]
-    captions_list: List[List[str]] = batch["caption"]
-    img_ids: List[str] = batch["img_id"]
-    filenames: List[str] = batch["filename"]
-    sent_ids_list: List[List[str]] = batch["sentids"]
-
-    num_items = len(image_data_list)
-    if num_items == 0:
-        logger.info(f"Batch {batch_index} is empty, skipping.")
-        return
-
-    # make the llm call to extract tags from captions
-    tags_list = llm.generate_tags(generate_captions_query(captions_list))
-
-    for i in range(num_items):
-        img_data = image_data_list[i]
-        filename = filenames[i]
-        img_id = img_ids[i]
-        sent_ids = sent_ids_list[i]
-        captions = captions_list[i]
-
-        current_image = Image.open(io.BytesIO(img_data["bytes"]))
-        index_row(
-            {
-                "image": current_image,
-                "caption": captions,
-                "img_id": img_id,
-                "filename": filename,
-                "sentids": sent_ids,
-                "tags": tags_list,
-            },
-            search,
-            logger,
+    def __len__(self) -> int:
+        return len(self.img_ids)
+
+    def keep(self, indices: List[int]):
+        self.image_data = [self.image_data[i] for i in indices]
+        self.captions = [self.captions[i] for i in indices]
+        self.img_ids = [self.img_ids[i] for i in indices]
+        self.filenames = [self.filenames[i] for i in indices]
+        self.hashes = [self.hashes[i] for i in indices]
+        if self.tags:
+            self.tags = [self.tags[i] for i in indices]
+
+
+class Indexer:
+    """Stage functions for the indexing pipeline.
+
+    Each method takes an IndexBatch, does one kind of work on it and hands
+    it on; the pipeline runs every stage with its own workers.
+    """
+
+    def __init__(
+        self,
+        search: Search,
+        decoder: ImageDecoder,
+        checkpoint: Checkpoint,
+        logger: logging.Logger,
+    ):
+        self.search = search
+        self.decoder = decoder
+        self.checkpoint = checkpoint
+        self.logger = logger
+        self.derivative_sizes = derivative_sizes()
+
+    def stages(self, workers: Callable[[str, int], int]) -> List[Stage]:
+        """The pipeline stages in order, sized by `workers(stage, default)`."""
+        return [
+            Stage("diff", self.diff, workers("diff", 1)),
+            Stage("tag", self.tag, workers("tag", 4)),
+            Stage("decode", self.decode, workers("decode", 4)),
+            Stage("embed", self.embed, workers("embed", 1)),
+            Stage("write", self.write, workers("write", 2)),
+            Stage("derive", self.derive, workers("derive", 2)),
+            Stage("save", self.save, workers("save", 2)),
+        ]
+
+    def diff(self, batch: IndexBatch) -> IndexBatch | None:
+        model = self.search.embedder.model_name
+        batch.hashes = [
+            content_hash(data["bytes"], captions, model)
+            for data, captions in zip(batch.image_data, batch.captions)
+        ]
+        changed = [
+            i
+            for i, (img_id, digest) in enumerate(zip(batch.img_ids, batch.hashes))
+            if not self.checkpoint.is_current(img_id, digest)
+        ]
+        if len(changed) < len(batch):
+            self.logger.info(
+                "batch %d: skipping %d already indexed images",
+                batch.index,
+                len(batch) - len(changed),
+            )
+            batch.keep(changed)
+        if len(batch) == 0:
+            self.logger.info("batch %d is empty, skipping", batch.index)
+            return None
+        return batch
+
+    def tag(self, batch: IndexBatch) -> IndexBatch:
+        # one structured llm call per chunk of images, tags kept per image
+        tags_by_id = llm.generate_tags_batch(dict(zip(batch.img_ids, batch.captions)))
+        batch.tags = [tags_by_id[img_id] for img_id in batch.img_ids]
+        return batch
+
+    def decode(self, batch: IndexBatch) -> IndexBatch | None:
+        images = self.decoder.decode_many([data["bytes"] for data in batch.image_data])
+        decoded = []
+        for i, image in enumerate(images):
+            if isinstance(image, Exception):
+                # not checkpointed, so a later --resume retries it
+                self.logger.warning("skipping image %s: %s", batch.img_ids[i], image)
+            else:
+                decoded.append(i)
+        if len(decoded) < len(batch):
+            batch.keep(decoded)
+            images = [images[i] for i in decoded]
+        if len(batch) == 0:
+            return None
+        for i, image in enumerate(images):
+            batch.documents.append(
+                IndexableDoc(
+                    batch.img_ids[i],
+                    image,
+                    batch.captions[i],
+                    f"{STATIC_DIR}/{batch.filenames[i]}",
+                    batch.tags[i],
+                    image_bytes=batch.image_data[i]["bytes"],
+                )
+            )
+        return batch
+
+    def embed(self, batch: IndexBatch) -> IndexBatch:
+        batch.image_embeddings, batch.text_embeddings = (
+            self.search.generate_embeddings_many(batch.documents)
+        )
+        return batch
+
+    def write(self, batch: IndexBatch) -> IndexBatch:
+        errors = self.search.write_many(
+            batch.documents, batch.image_embeddings, batch.text_embeddings
+        )
+        failed_uuids = {error["uuid"] for error in errors}
+        for document in batch.documents:
+            uuids = [image_uuid(document.id)] + [
+                caption_uuid(document.id, i) for i in range(len(document.captions))
+            ]
+            if any(str(uuid) in failed_uuids for uuid in uuids):
+                batch.failed_ids.add(document.id)
+        self.logger.info(
+            "indexed batch %d: %d images, %d errors",
+            batch.index,
+            len(batch.documents),
+            len(errors),
+        )
+        # vectors and decoded pixels are not needed past this point
+        batch.documents = []
+        batch.image_embeddings = []
+        batch.text_embeddings = []
+        return batch
+
+    def derive(self, batch: IndexBatch) -> IndexBatch:
+        # thumbnails and previews for result pages; results fall back to the
+        # original when one is missing, so a failure here isn't fatal. The
+        # documents are gone by now, so work from the batch rows like `save`
+        for img_id, filename, data in zip(
+            batch.img_ids, batch.filenames, batch.image_data
+        ):
+            try:
+                write_derivatives(
+                    data["bytes"], f"{STATIC_DIR}/{filename}", self.derivative_sizes
+                )
+            except Exception as e:
+                self.logger.warning("failed to write derivatives of %s: %s", img_id, e)
+        return batch
+
+    def save(self, batch: IndexBatch) -> IndexBatch:
+        # the dataset already holds encoded bytes, so write them as-is
+        # instead of re-encoding the decoded image
+        for filename, data in zip(batch.filenames, batch.image_data):
+            with open(os.path.join(STATIC_DIR, filename), "wb") as f:
+                f.write(data["bytes"])
+        # only now is the item fully indexed and safe to skip on resume
+        self.checkpoint.record(
+            batch.index,
+            [
+                (img_id, digest)
+                for img_id, digest in zip(batch.img_ids, batch.hashes)
+                if img_id not in batch.failed_ids
+            ],
         )
+        return batch
 
 
-def index_row(
-    row: Dict[str, Any],
-    search: WeaviateSearch,
+def read_batches(
+    source: DataSource,
+    limit: int | None,
+    shard: Shard,
     logger: logging.Logger,
-):
-    image: Image.Image = row["image"]
-    captions = row["caption"]
-    sentids = row["sentids"]
-    img_id = row["img_id"]
-    filename = row["filename"]
-    tags = row["tags"]
-    try:
-        path = f"static/{filename}"
-        image.save(path)
-        search.index(IndexableDoc(img_id, image, captions, path, tags))
-    except Exception as e:
-        logger.error("error embedding image %s: error: %s", img_id, e)
+) -> Iterator[IndexBatch]:
+    # trailing captions kept out of the index as evaluation queries; every
+    # image keeps at least one
+    held_out = int(get_config().get("indexer.held_out_captions", 0))
+    for i, rows in enumerate(source.batches(BATCH_SIZE, limit=limit, shard=shard)):
+        if held_out:
+            rows["caption"] = [
+                captions[: max(len(captions) - held_out, 1)]
+                for captions in rows["caption"]
+            ]
+        logger.info("queueing batch %d", i)
+        yield IndexBatch(i, rows)
 
-    logger.info("indexed image %s", img_id)
 
+def index(
+    logger: logging.Logger,
+    source: DataSource,
+    limit: int | None = None,
+    shard: Shard = (0, 1),
+    full: bool = True,
+    recreate_only: bool = False,
+):
+    """Index `source` into Weaviate.
 
-def index(logger: logging.Logger, dataset: Dataset):
+    With `full` the collections and checkpoints are wiped and everything is
+    rebuilt; otherwise images already recorded in the checkpoint with the
+    same content are skipped and only new or changed ones are upserted.
+    `recreate_only` stops after the wipe, ready for sharded resumed runs.
+    """
     config = get_config()
-    logger.info("Indexing dataset")
+    logger.info(
+        "Indexing dataset (%s, shard %d/%d)",
+        "full" if full else "incremental",
+        *shard,
+    )
     # ['image', 'caption', 'sentids', 'img_id', 'filename']
-    # logger.debug("dataset columns: %s", image_dataset.column_names)
-    batched_dataset = dataset.batch(min(BATCH_SIZE, len(dataset)))
-    logger.info("batching complete: created %d batches", len(batched_dataset))
 
-    client = weaviate.connect_to_local(
-        host=config.get("weaviate.host", "localhost"),
-        port=config.get("weaviate.port", 8080),
-    )
     embedder = get_embedder()
+    os.makedirs(STATIC_DIR, exist_ok=True)
+
+    def workers(stage: str, default: int) -> int:
+        return int(config.get(f"indexer.workers.{stage}", default))
+
+    backend = config.get("search.backend", "weaviate")
+    if backend == "numpy" and shard[1] > 1:
+        # segments are numbered per process, so shards would overwrite each other
+        raise ValueError("the numpy search backend can't be indexed in shards")
+
+    checkpoint_path = config.get(
+        "indexer.checkpoint_path", ".cache/index_checkpoint.jsonl"
+    )
+    shard_checkpoints = shard_paths(checkpoint_path)
+    if shard[1] > 1:
+        # one manifest per shard so concurrent processes never share a file.
+        # They do share the embedding store, whose segments are uniquely
+        # named per flush
+        root, ext = os.path.splitext(checkpoint_path)
+        checkpoint_path = f"{root}-{shard[0]}-of-{shard[1]}{ext}"
+    checkpoint = Checkpoint(checkpoint_path)
+
+    embedding_store = None
+    if config.get("embedding_store.enabled", True):
+        embedding_store = EmbeddingStore(
+            config.get("embedding_store.path", ".cache/embeddings"),
+            embedder.model_name,
+            dtype=config.get("embedding_store.dtype", "float16"),
+        )
+
+    # stored vectors stay at full dimension, so changing the projection only
+    # needs a full reindex, not re-embedding
+    projection = load_projection(embedder.model_name)
+    clients = None
+    if backend == "numpy":
+        search = NumpySearch.from_config(
+            embedder, embedding_store=embedding_store, projection=projection
+        )
+    else:
+        # each write worker streams its batches over its own client
+        clients = WeaviateClientPool(connect_to_weaviate, size=workers("write", 2))
+        search = WeaviateSearch(
+            clients, embedder, embedding_store=embedding_store, projection=projection
+        )
 
     try:
-        search = WeaviateSearch(client, embedder)
-        search.create_collections_if_not_exists(force_recreate=True)
-
-        # for row in image_dataset:
-        #     tags_list = llm.generate_tags(generate_captions_query(row["caption"]))
-        #     row["tags"] = tags_list
-        #     index_row(row, search, logger)
-        # logger.info("all rows indexed")
-
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = []
-            for i, batch in enumerate(batched_dataset):
-                logger.info("indexing batch %d of %d", i, len(batched_dataset))
-                futures.append(executor.submit(index_batch, i, batch, search, logger))
-
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    future.result()
-                except Exception as e:
-                    logger.error("Error processing batch: %s", e)
+        if full:
+            checkpoint.reset()
+            # the collections are dropped below, so what sharded runs
+            # recorded no longer holds either
+            for path in shard_checkpoints:
+                os.remove(path)
+        else:
+            logger.info("resuming with %d images already indexed", len(checkpoint))
+        search.create_collections_if_not_exists(force_recreate=full)
+        if recreate_only:
+            logger.info("recreated the collections")
+            return
+
+        decoder = create_image_decoder(workers("decode", 4), processes=True)
+        try:
+            indexer = Indexer(search, decoder, checkpoint, logger)
+            pipeline = Pipeline(
+                indexer.stages(workers),
+                logger,
+                queue_size=int(config.get("indexer.queue_size", 4)),
+                report_interval=float(config.get("indexer.report_interval", 10)),
+            )
+            pipeline.run(read_batches(source, limit, shard, logger))
+        finally:
+            decoder.close()
         logger.info("all batches indexed")
+        if config.get("tags.extractor", "llm") == "local":
+            # the API reuses a vocabulary newer than the last indexed batch
+            build_vocabulary(search)
 
     except Exception as e:
         logger.error("Error indexing dataset: %s", e)
     finally:
-        client.close()
+        if embedding_store is not None:
+            embedding_store.flush()
+        checkpoint.close()
+        search.close()
+        if clients is not None:
+            clients.close()
 
 
 if __name__ == "__main__":
@@ -140,17 +348,49 @@ if __name__ == "__main__":
         default=None,
         help="Number of images to index (default: all)",
     )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--full",
+        action="store_true",
+        help="Recreate the collections and reindex everything (default)",
+    )
+    mode.add_argument(
+        "--resume",
+        action="store_true",
+        help="Keep existing collections and only index new or changed images",
+    )
+    mode.add_argument(
+        "--recreate-only",
+        action="store_true",
+        help="Only recreate the collections and reset the checkpoints, "
+        "e.g. before sharded --resume runs",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=(0, 1),
+        help="Index only slice i of n of the dataset, given as i/n (default: 0/1)",
+    )
     args = parser.parse_args()
+    if args.shard[1] > 1 and not args.resume:
+        # every shard would drop the collections the others are writing to
+        parser.error(
+            "--shard requires --resume; recreate the collections first with "
+            "--recreate-only"
+        )
     logger = get_logger("indexer")
-    if args.count is not None:
-        if args.count > MAX_COUNT:
-            logger.warning(
-                "count is greater than the maximum number of images to index, setting count to %d",
-                MAX_COUNT,
-            )
-            args.count = MAX_COUNT
+    if args.count is not None and args.count > MAX_COUNT:
+        logger.warning(
+            "count is greater than the maximum number of images to index, setting count to %d",
+            MAX_COUNT,
+        )
+        args.count = MAX_COUNT
 
-        dataset = image_dataset.select(range(min(args.count, len(image_dataset))))
-        index(logger, dataset)
-    else:
-        index(logger, image_dataset)
+    index(
+        logger,
+        get_data_source(),
+        limit=args.count,
+        shard=args.shard,
+        full=not args.resume,
+        recreate_only=args.recreate_only,
+    )
@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+
+def content_hash(image_bytes: bytes, captions: List[str], model: str) -> str:
+    digest = hashlib.sha1(image_bytes)
+    digest.update(json.dumps([captions, model]).encode())
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """Append-only manifest of indexed items and the content they were built from.
+
+    Every completed item is written as one JSON line holding its img_id,
+    content hash and batch index, and flushed to disk straight away, so a
+    crash loses at most the batches that were still in flight.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._entries: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a torn last line from an interrupted run
+                        continue
+                    self._entries[entry["img_id"]] = entry["hash"]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def is_current(self, img_id: str, digest: str) -> bool:
+        return self._entries.get(img_id) == digest
+
+    def record(self, batch_index: int, items: Iterable[Tuple[str, str]]):
+        with self._lock:
+            for img_id, digest in items:
+                self._entries[img_id] = digest
+                self._file.write(
+                    json.dumps({"img_id": img_id, "hash": digest, "batch": batch_index})
+                    + "\n"
+                )
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
+            self._file.close()
+            self._file = open(self._path, "w")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
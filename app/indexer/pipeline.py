@@ -0,0 +1,151 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, busy_seconds: float, failed: bool = False):
+        with self._lock:
+            self.busy_seconds += busy_seconds
+            if failed:
+                self.errors += 1
+            else:
+                self.items += 1
+
+    @property
+    def throughput(self) -> float:
+        elapsed = time.monotonic() - self._started_at
+        return self.items / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def utilization(self) -> float:
+        # share of worker time spent inside the stage function; a stage close
+        # to 1.0 is the bottleneck and the one worth adding workers to
+        elapsed = time.monotonic() - self._started_at
+        return self.busy_seconds / (elapsed * self.workers) if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.items} items ({self.errors} errors), "
+            f"{self.throughput:.2f} items/s, {self.utilization:.0%} busy "
+            f"across {self.workers} workers"
+        )
+
+
+class Stage:
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int = 1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+
+
+class Pipeline:
+    """Streams items through stages connected by bounded queues.
+
+    Each stage runs its own worker threads. A stage function returns the
+    item to hand to the next stage, or None to drop it. The bounded queues
+    apply backpressure, so the slowest stage sets the pace and at most
+    `queue_size` items wait between any two stages.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        logger: logging.Logger,
+        queue_size: int = 4,
+        report_interval: float = 10.0,
+    ):
+        self._stages = stages
+        self._logger = logger
+        self._queues: List[queue.Queue] = [
+            queue.Queue(maxsize=queue_size) for _ in stages
+        ]
+        self._report_interval = report_interval
+        self.stats: Dict[str, StageStats] = {
+            stage.name: StageStats(stage.name, stage.workers) for stage in stages
+        }
+
+    def run(self, source: Iterable[Any]) -> Dict[str, StageStats]:
+        threads: List[threading.Thread] = []
+        for index, stage in enumerate(self._stages):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(index, stage, remaining, lock),
+                    name=f"{stage.name}-{n}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        finished = threading.Event()
+        reporter = threading.Thread(
+            target=self._report, args=(finished,), name="reporter", daemon=True
+        )
+        reporter.start()
+
+        try:
+            for item in source:
+                self._queues[0].put(item)
+        finally:
+            for _ in range(self._stages[0].workers):
+                self._queues[0].put(_DONE)
+            for thread in threads:
+                thread.join()
+            finished.set()
+            reporter.join()
+
+        self.log_stats()
+        return self.stats
+
+    def _work(self, index: int, stage: Stage, remaining: List[int], lock):
+        inbox = self._queues[index]
+        outbox: Optional[queue.Queue] = (
+            self._queues[index + 1] if index + 1 < len(self._queues) else None
+        )
+        stats = self.stats[stage.name]
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            start = time.monotonic()
+            try:
+                result = stage.fn(item)
+            except Exception as e:
+                stats.record(time.monotonic() - start, failed=True)
+                self._logger.error("stage %s failed: %s", stage.name, e)
+                continue
+            stats.record(time.monotonic() - start)
+            if result is not None and outbox is not None:
+                outbox.put(result)
+
+        # the last worker out of a stage tells every worker of the next one
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last and outbox is not None:
+            for _ in range(self._stages[index + 1].workers):
+                outbox.put(_DONE)
+
+    def _report(self, finished: threading.Event):
+        while not finished.wait(self._report_interval):
+            self.log_stats()
+
+    def log_stats(self):
+        for stage in self._stages:
+            self._logger.info("%s", self.stats[stage.name])
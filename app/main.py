@@ -7,7 +7,11 @@ from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.api import router
-from app.api.middleware import GlobalExceptionMiddleware, StaticFilesHandler
+from app.api.middleware import (
+    GlobalExceptionMiddleware,
+    MetricsMiddleware,
+    StaticFilesHandler,
+)
 from app.services import close_services, init_services
 
 
@@ -45,6 +49,8 @@ def create_app() -> FastAPI:
 
     app.include_router(router)
     app.add_middleware(GlobalExceptionMiddleware)
+    # outermost, so it sees the status the exception middleware settles on
+    app.add_middleware(MetricsMiddleware)
     return app
 
 
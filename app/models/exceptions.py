@@ -32,3 +32,12 @@ class BadRequestError(Exception):
 
     def __str__(self):
         return self.message
+
+
+class TooManyRequestsError(Exception):
+    def __init__(self, message: str, status_code: int = 429):
+        self.message = message
+        self.status_code = status_code
+
+    def __str__(self):
+        return self.message
@@ -1,11 +1,71 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+# vector: CLIP similarity, keyword: BM25 only, hybrid: both fused by alpha,
+# cross_modal: CLIP similarity against both images and captions
+SearchMode = Literal["vector", "keyword", "hybrid", "cross_modal"]
+# how caption similarities are combined into one score per image
+Fusion = Literal["max", "mean", "sum"]
+# how cross_modal combines the image and caption rankings
+CrossModalFusion = Literal["rrf", "weighted"]
 
 
 class TextSearchRequest(BaseModel):
-    query: str
+    # not needed when continuing from a cursor
+    query: str = ""
     top_k: int = 10
+    # offset + top_k is capped at search.pagination.max_results
+    offset: int = Field(default=0, ge=0)
+    # returned as next_cursor by a previous page; the rest of the request
+    # except top_k is taken from the original search
+    cursor: Optional[str] = None
+    # respond with newline-delimited JSON, one result per line, once the
+    # page is resolved
+    stream: bool = False
+    mode: SearchMode = "vector"
+    # hybrid weighting: 0 is pure keyword, 1 is pure vector
+    alpha: float = Field(default=0.5, ge=0, le=1)
+    # return distinct images instead of one result per matching caption
+    group_by_image: bool = False
+    fusion: Fusion = "max"
+    cross_modal_fusion: CrossModalFusion = "rrf"
+    # cross_modal weight of the image ranking; captions get the rest
+    image_weight: float = Field(default=0.5, ge=0, le=1)
+    # drop results less similar than this (cosine similarity, -1 to 1);
+    # ignored in keyword mode, whose bm25 scores are unbounded
+    min_similarity: Optional[float] = Field(default=None, ge=-1, le=1)
+    # cross_modal threshold of the other modality's matches (images for a
+    # text query, captions for an image query), whose similarities run far
+    # lower than min_similarity's
+    cross_modal_min_similarity: Optional[float] = Field(default=None, ge=-1, le=1)
+    # re-score over-fetched vector candidates against their image vectors;
+    # defaults to search.rerank.enabled
+    rerank: Optional[bool] = None
+
+
+class BatchSearchQuery(BaseModel):
+    # exactly one of query and image
+    query: Optional[str] = None
+    # base64 encoded JPEG or PNG
+    image: Optional[str] = None
+    # capped at search.pagination.max_results
+    top_k: int = Field(default=10, ge=1)
+    # image queries search the Image collection unless mode is cross_modal,
+    # and ignore alpha, group_by_image and fusion
+    mode: SearchMode = "vector"
+    alpha: float = Field(default=0.5, ge=0, le=1)
+    group_by_image: bool = False
+    fusion: Fusion = "max"
+    cross_modal_fusion: CrossModalFusion = "rrf"
+    image_weight: float = Field(default=0.5, ge=0, le=1)
+    min_similarity: Optional[float] = Field(default=None, ge=-1, le=1)
+    cross_modal_min_similarity: Optional[float] = Field(default=None, ge=-1, le=1)
+    rerank: Optional[bool] = None
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchSearchQuery] = Field(min_length=1)
 
 
 class SearchResponse(BaseModel):
@@ -14,3 +74,14 @@ class SearchResponse(BaseModel):
 
 class AdditionalWeaviateParams(BaseModel):
     tags: Optional[List[str]] = None
+    mode: SearchMode = "vector"
+    alpha: float = 0.5
+    group_by_image: bool = False
+    fusion: Fusion = "max"
+    cross_modal_fusion: CrossModalFusion = "rrf"
+    image_weight: float = 0.5
+    min_similarity: Optional[float] = None
+    # cross_modal threshold of image matches; min_similarity applies to the
+    # caption matches
+    image_min_similarity: Optional[float] = None
+    rerank: Optional[bool] = None
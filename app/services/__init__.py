@@ -1,41 +1,218 @@
-import weaviate
+import os
+from typing import TYPE_CHECKING
 
 from app.config import get_config
-from app.services.embedder import Embedder
-from app.services.search import WeaviateSearch
+from app.core import metrics
+from app.core.logger import get_logger
+from app.core.tags import LLMTagExtractor, TagExtractor, VocabularyTagExtractor
+from app.data.checkpoints import last_indexed_at
+from app.services.cache import EmbeddingCache
+from app.services.executor import InferenceExecutor
+from app.services.image_decoder import ImageDecoder, create_image_decoder
+from app.services.pagination import ResultPager
+from app.services.projection import load_projection
+from app.services.numpy_search import NumpySearch
+from app.services.search import Search, WeaviateSearch
+from app.services.weaviate_pool import WeaviateClientPool, connect_to_weaviate
 
-_embedder: Embedder | None = None
-_client: weaviate.WeaviateClient = None
-_search: WeaviateSearch | None = None
+if TYPE_CHECKING:
+    # CLIP pulls in torch, so it is only imported once an embedder is built
+    from app.services.embedder import Embedder
 
+_embedder: "Embedder | None" = None
+_clients: WeaviateClientPool | None = None
+_search: Search | None = None
+_executor: InferenceExecutor | None = None
+_embedding_cache: EmbeddingCache | None = None
+_tag_extractor: TagExtractor | None = None
+_pager: ResultPager | None = None
+_decoder: ImageDecoder | None = None
 
-def get_weaviate() -> WeaviateSearch:
+
+def get_weaviate() -> Search:
     return _search
 
 
-def get_embedder() -> Embedder:
+def get_executor() -> InferenceExecutor:
+    return _executor
+
+
+def get_pager() -> ResultPager:
+    return _pager
+
+
+def get_image_decoder() -> ImageDecoder:
+    return _decoder
+
+
+def get_tag_extractor() -> TagExtractor:
+    return _tag_extractor
+
+
+def get_embedder() -> "Embedder":
+    from app.services.embedder import Embedder
+
     global _embedder
     if _embedder is None:
         _embedder = Embedder()
     return _embedder
 
 
+def build_vocabulary(search: Search) -> VocabularyTagExtractor:
+    """Read the tag vocabulary from the index and save it, if a path is set."""
+    extractor = VocabularyTagExtractor(search.iter_tags())
+    vocabulary_path = get_config().get("tags.vocabulary_path", ".cache/tags.json")
+    if vocabulary_path:
+        extractor.save(vocabulary_path)
+    return extractor
+
+
+def build_tag_extractor(search: Search) -> TagExtractor:
+    config = get_config()
+    if config.get("tags.extractor", "llm") != "local":
+        return LLMTagExtractor()
+
+    logger = get_logger("services")
+    vocabulary_path = config.get("tags.vocabulary_path", ".cache/tags.json")
+    indexed_at = last_indexed_at(
+        config.get("indexer.checkpoint_path", ".cache/index_checkpoint.jsonl")
+    )
+    if (
+        vocabulary_path
+        and os.path.exists(vocabulary_path)
+        and (indexed_at is None or os.path.getmtime(vocabulary_path) >= indexed_at)
+    ):
+        extractor = VocabularyTagExtractor.load(vocabulary_path)
+    else:
+        # missing, or written before the last indexer run
+        extractor = build_vocabulary(search)
+    logger.info("loaded local tag extractor with %d tags", len(extractor))
+    return extractor
+
+
+def register_metrics():
+    """Expose the live state of the services on /metrics."""
+    registry = metrics.registry
+    registry.callback(
+        "inference_in_flight",
+        "Calls running or queued on the inference executor",
+        lambda: _executor.in_flight,
+    )
+    registry.callback(
+        "inference_capacity",
+        "Calls the inference executor accepts before rejecting with 429",
+        lambda: _executor.capacity,
+    )
+    registry.callback(
+        "embedder_queue_depth",
+        "Items waiting for the next CLIP micro-batch",
+        _embedder.queue_depths,
+        label="modality",
+    )
+    if _clients is not None:
+        registry.callback(
+            "weaviate_clients_in_use",
+            "Pooled Weaviate clients checked out",
+            lambda: _clients.in_use,
+        )
+
+    caches = {}
+    if _embedding_cache is not None:
+        caches["embedding"] = _embedding_cache
+    tag_cache = getattr(_tag_extractor, "cache", None)
+    if tag_cache is not None:
+        caches["tags"] = tag_cache
+    # hit rate is rate(hits) / (rate(hits) + rate(misses))
+    registry.callback(
+        "cache_hits_total",
+        "Cache lookups answered from the cache",
+        lambda: {name: cache.hits for name, cache in caches.items()},
+        label="cache",
+        type="counter",
+    )
+    registry.callback(
+        "cache_misses_total",
+        "Cache lookups that missed",
+        lambda: {name: cache.misses for name, cache in caches.items()},
+        label="cache",
+        type="counter",
+    )
+
+
 async def init_services():
-    global _embedder, _client, _search
+    global _embedder, _clients, _search, _executor, _embedding_cache, _tag_extractor
+    global _pager, _decoder
+    from app.services.embedder import Embedder
+
     _embedder = Embedder()
     config = get_config()
-    _client = weaviate.connect_to_local(
-        host=config.get("weaviate.host", "weaviate"),
-        port=config.get("weaviate.port", 8080),
+    _decoder = create_image_decoder()
+    _pager = ResultPager(
+        ttl_seconds=float(config.get("search.pagination.ttl_seconds", 300)),
+        max_sessions=int(config.get("search.pagination.max_sessions", 1000)),
+        max_results=int(config.get("search.pagination.max_results", 1000)),
     )
-    _search = WeaviateSearch(client=_client, embedder=_embedder)
+    _executor = InferenceExecutor(
+        max_workers=int(config.get("inference.max_workers", 4)),
+        max_queue_depth=int(config.get("inference.max_queue_depth", 64)),
+    )
+    if config.get("embedding_cache.enabled", True):
+        _embedding_cache = EmbeddingCache(
+            max_bytes=int(config.get("embedding_cache.max_bytes", 64 * 1024 * 1024)),
+            ttl_seconds=config.get("embedding_cache.ttl_seconds"),
+            path=config.get("embedding_cache.path"),
+        )
+    projection = load_projection(_embedder.model_name)
+    if config.get("search.backend", "weaviate") == "numpy":
+        _search = NumpySearch.from_config(
+            _embedder,
+            executor=_executor,
+            embedding_cache=_embedding_cache,
+            projection=projection,
+        )
+    else:
+        # one client per inference worker so concurrent queries never queue
+        # behind a shared connection
+        _clients = WeaviateClientPool(
+            lambda: connect_to_weaviate(default_host="weaviate"),
+            size=int(
+                config.get("weaviate.pool_size", config.get("inference.max_workers", 4))
+            ),
+            health_check_interval=float(
+                config.get("weaviate.health_check_interval", 30)
+            ),
+        )
+        _search = WeaviateSearch(
+            clients=_clients,
+            embedder=_embedder,
+            executor=_executor,
+            embedding_cache=_embedding_cache,
+            projection=projection,
+        )
     _search.create_collections_if_not_exists()
+    _tag_extractor = build_tag_extractor(_search)
+    register_metrics()
 
 
 async def close_services():
-    global _embedder, _client, _search
+    global _embedder, _clients, _search, _executor, _embedding_cache, _decoder
+    # let queued and running requests finish before tearing anything down
+    if _executor is not None:
+        _executor.shutdown()
+
+    if _decoder is not None:
+        _decoder.close()
+
+    if _embedding_cache is not None:
+        _embedding_cache.save()
+
+    if _search is not None:
+        _search.close()
+
     if _embedder is not None:
         _embedder.__exit__(None, None, None)
 
-    if _client is not None:
-        _client.close()
+    if _clients is not None:
+        _clients.close(
+            drain_timeout=float(get_config().get("weaviate.drain_timeout", 10))
+        )
@@ -0,0 +1,101 @@
+import threading
+import time
+from concurrent.futures import Future
+from queue import Empty, Queue
+from typing import Any, Callable, Generic, List, Sequence, Tuple, TypeVar
+
+from app.core.logger import get_logger
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """Coalesces concurrent single-item calls into one batched call.
+
+    Callers block in `submit` while a background worker gathers up to
+    `max_batch_size` items, waiting at most `max_wait_ms` after the first one
+    arrives, and runs `batch_fn` over all of them at once.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[T]], Sequence[R]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        name: str = "batcher",
+    ):
+        self._batch_fn = batch_fn
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: Queue[Tuple[T, Future] | None] = Queue()
+        self._logger = get_logger(name)
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    @property
+    def depth(self) -> int:
+        """Items waiting for the worker to pick them up."""
+        return self._queue.qsize()
+
+    def submit(self, item: T) -> R:
+        return self.submit_async(item).result()
+
+    def submit_async(self, item: T) -> Future:
+        if self._closed:
+            raise RuntimeError("batcher is closed")
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect(self, first: Tuple[T, Future]) -> Tuple[List[Tuple[T, Future]], bool]:
+        pending = [first]
+        deadline = time.monotonic() + self._max_wait
+        while len(pending) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = (
+                    self._queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self._queue.get_nowait()
+                )
+            except Empty:
+                break
+            if entry is None:
+                return pending, True
+            pending.append(entry)
+        return pending, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            pending, stop = self._collect(first)
+            self._flush(pending)
+
+    def _flush(self, pending: List[Tuple[T, Future]]):
+        items = [item for item, _ in pending]
+        try:
+            results: Sequence[Any] = self._batch_fn(items)
+            if len(results) != len(pending):
+                # zip would leave the callers without a result blocked forever
+                raise RuntimeError(
+                    f"batch of {len(pending)} items returned {len(results)} results"
+                )
+        except Exception as e:
+            self._logger.error("error running batch of %d items: %s", len(items), e)
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(pending, results):
+            future.set_result(result)
@@ -0,0 +1,120 @@
+import os
+import pickle
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.logger import get_logger
+
+CacheKey = Tuple[str, str]
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    """LRU cache of query embeddings bounded by bytes and entry age.
+
+    Vectors are stored as packed float32 arrays keyed by (model name,
+    normalized text). When `path` is set the cache is loaded from disk on
+    start-up and written back by `save`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: Optional[float] = None,
+        path: Optional[str] = None,
+    ):
+        self._max_bytes = max_bytes
+        self._ttl = ttl_seconds
+        self._path = path
+        self._entries: OrderedDict[CacheKey, Tuple[float, array]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._logger = get_logger("embedding_cache")
+        if path:
+            self.load()
+
+    @staticmethod
+    def _size(key: CacheKey, vector: array) -> int:
+        return len(key[0]) + len(key[1]) + vector.itemsize * len(vector)
+
+    def _expired(self, created_at: float) -> bool:
+        return self._ttl is not None and time.time() - created_at > self._ttl
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = (model, normalize_query(text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[0]):
+                if entry is not None:
+                    self._evict(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1].tolist()
+
+    def put(self, model: str, text: str, vector: List[float]):
+        key = (model, normalize_query(text))
+        packed = array("f", vector)
+        size = self._size(key, packed)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (time.time(), packed)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: CacheKey):
+        _, vector = self._entries.pop(key)
+        self._bytes -= self._size(key, vector)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def load(self):
+        if not self._path or not os.path.exists(self._path):
+            return
+        try:
+            with open(self._path, "rb") as f:
+                entries = pickle.load(f)
+        except Exception as e:
+            self._logger.error("error loading embedding cache %s: %s", self._path, e)
+            return
+        with self._lock:
+            for key, (created_at, vector) in entries:
+                if self._expired(created_at):
+                    continue
+                self._entries[key] = (created_at, vector)
+                self._bytes += self._size(key, vector)
+            while self._bytes > self._max_bytes:
+                self._evict(next(iter(self._entries)))
+        self._logger.info("loaded %d cached embeddings", len(self._entries))
+
+    def save(self):
+        if not self._path:
+            return
+        with self._lock:
+            entries = list(self._entries.items())
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entries, f)
+        os.replace(tmp_path, self._path)
+        self._logger.info("saved %d cached embeddings", len(entries))
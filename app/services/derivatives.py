@@ -0,0 +1,77 @@
+import os
+import posixpath
+from typing import Dict, List, NamedTuple
+
+from PIL import Image
+
+from app.config import get_config
+from app.utils import decode_image
+
+# derivatives live next to the originals, under static/derived/<size>/
+DERIVED_DIR = "derived"
+
+FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+
+
+class DerivativeSize(NamedTuple):
+    name: str
+    # longest side in pixels; smaller images are never upscaled
+    max_side: int
+    format: str
+    quality: int
+
+
+def derivative_sizes() -> List[DerivativeSize]:
+    sizes = get_config().get(
+        "static.derivatives",
+        {
+            "thumbnail": {"max_side": 256, "format": "webp", "quality": 75},
+            "preview": {"max_side": 1024, "format": "webp", "quality": 80},
+        },
+    )
+    return [
+        DerivativeSize(
+            name,
+            int(size["max_side"]),
+            size.get("format", "webp"),
+            int(size.get("quality", 80)),
+        )
+        for name, size in sizes.items()
+    ]
+
+
+def derivative_url(image_url: str, size: DerivativeSize) -> str:
+    """`static/a.jpg` -> `static/derived/thumbnail/a.webp`"""
+    directory, filename = posixpath.split(image_url)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, DERIVED_DIR, size.name, f"{stem}.{size.format}")
+
+
+def derivative_urls(image_url: str) -> Dict[str, str]:
+    """URLs of the original and every configured derivative of an image."""
+    if not image_url:
+        return {}
+    urls = {"original": image_url}
+    for size in derivative_sizes():
+        urls[size.name] = derivative_url(image_url, size)
+    return urls
+
+
+def write_derivatives(data: bytes, image_url: str, sizes: List[DerivativeSize]):
+    """Write every derivative of the encoded image `data` stored at `image_url`.
+
+    The image is decoded once, at the reduced JPEG scale the largest size
+    allows, and downscaled from largest to smallest size. Files are
+    replaced atomically so the static handler never serves a partial one.
+    """
+    if not sizes:
+        return
+    sizes = sorted(sizes, key=lambda size: size.max_side, reverse=True)
+    image: Image.Image = decode_image(data, draft_size=sizes[0].max_side)
+    for size in sizes:
+        image.thumbnail((size.max_side, size.max_side), Image.Resampling.LANCZOS)
+        path = derivative_url(image_url, size)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        image.save(tmp_path, format=FORMATS[size.format], quality=size.quality)
+        os.replace(tmp_path, path)
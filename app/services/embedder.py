@@ -1,35 +1,84 @@
 import warnings
+from typing import Dict, List
 
 import clip
 import torch
 from PIL import Image
 
+from app.config import get_config
+from app.services.batcher import MicroBatcher
+
 
 class Embedder:
     def __init__(self):
+        config = get_config()
+        self.model_name = config.get("embedder.model", "ViT-B/32")
+        self.max_batch_size = int(config.get("embedder.batch.max_batch_size", 32))
+        max_wait_ms = float(config.get("embedder.batch.max_wait_ms", 5))
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore", category=ResourceWarning)
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
-            self.model, self.preprocess = clip.load("ViT-B/32", device=self.device)
+            self.model, self.preprocess = clip.load(self.model_name, device=self.device)
+
+        # concurrent single-item calls (e.g. from the API) are coalesced into
+        # one forward pass by these batchers
+        self._text_batcher = MicroBatcher(
+            self.embed_texts, self.max_batch_size, max_wait_ms, name="text_batcher"
+        )
+        self._image_batcher = MicroBatcher(
+            self.embed_images, self.max_batch_size, max_wait_ms, name="image_batcher"
+        )
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {
+            "text": self._text_batcher.depth,
+            "image": self._image_batcher.depth,
+        }
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if hasattr(self, "_text_batcher"):
+            self._text_batcher.close()
+            self._image_batcher.close()
         if hasattr(self, "model"):
             self.model = None
             self.preprocess = None
             torch.cuda.empty_cache()
 
     def embed_image(self, image: Image.Image) -> torch.Tensor:
-        with torch.no_grad():
-            image_input = self.preprocess(image).unsqueeze(0).to(self.device)
-            return self.model.encode_image(image_input)
+        return self._image_batcher.submit(image).unsqueeze(0)
 
     def embed_text(self, text: str) -> torch.Tensor:
+        return self._text_batcher.submit(text).unsqueeze(0)
+
+    def embed_images(self, images: List[Image.Image]) -> torch.Tensor:
+        if not images:
+            return torch.empty(0, 0)
+        chunks: List[torch.Tensor] = []
+        with torch.no_grad():
+            for start in range(0, len(images), self.max_batch_size):
+                image_input = torch.stack(
+                    [
+                        self.preprocess(image)
+                        for image in images[start : start + self.max_batch_size]
+                    ]
+                ).to(self.device)
+                chunks.append(self.model.encode_image(image_input))
+        return torch.cat(chunks)
+
+    def embed_texts(self, texts: List[str]) -> torch.Tensor:
+        if not texts:
+            return torch.empty(0, 0)
+        chunks: List[torch.Tensor] = []
         with torch.no_grad():
-            text_input = clip.tokenize(text).to(self.device)
-            return self.model.encode_text(text_input)
+            for start in range(0, len(texts), self.max_batch_size):
+                text_input = clip.tokenize(
+                    texts[start : start + self.max_batch_size], truncate=True
+                ).to(self.device)
+                chunks.append(self.model.encode_text(text_input))
+        return torch.cat(chunks)
 
 
 # with torch.no_grad():
@@ -0,0 +1,190 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.logger import get_logger
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(b"text:" + text.encode()).hexdigest()
+
+
+def image_key(image_bytes: bytes) -> str:
+    return hashlib.sha1(b"image:" + image_bytes).hexdigest()
+
+
+class EmbeddingStore:
+    """On-disk store of computed vectors keyed by content hash.
+
+    Vectors live under `<root>/<model>/` as immutable segments: a `.npy`
+    matrix that is memory-mapped on open plus a `.json` list of the keys
+    for its rows. New vectors are buffered and written as a fresh segment
+    by `flush`, so reads never contend with partially written files.
+    Segments get unique names, so a flush never replaces a segment that is
+    mapped, left incomplete by a crash, or written by another process
+    sharing the directory.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        model: str,
+        dtype: str = "float16",
+        flush_every: int = 4096,
+    ):
+        self._dir = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]", "_", model))
+        self._model = model
+        self._dtype = np.dtype(dtype)
+        self._flush_every = flush_every
+        # segment name -> matrix; the index maps a key to (segment, row)
+        self._segments: Dict[str, np.ndarray] = {}
+        self._index: Dict[str, Tuple[str, int]] = {}
+        self._pending: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._logger = get_logger("embedding_store")
+        os.makedirs(self._dir, exist_ok=True)
+        for path in sorted(glob.glob(os.path.join(self._dir, "segment-*.npy"))):
+            self._open_segment(path)
+        self._logger.info(
+            "opened embedding store %s with %d vectors", self._dir, len(self._index)
+        )
+
+    def __len__(self) -> int:
+        return len(self._index) + len(self._pending)
+
+    def _open_segment(self, path: str):
+        keys_path = path[: -len(".npy")] + ".json"
+        if not os.path.exists(keys_path):
+            # the keys file is written last, so its absence means the
+            # segment was never completed
+            return
+        with open(keys_path, "r") as f:
+            keys = json.load(f)
+        segment = os.path.basename(path)[: -len(".npy")]
+        self._segments[segment] = np.load(path, mmap_mode="r")
+        for row, key in enumerate(keys):
+            self._index[key] = (segment, row)
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            vectors: List[Optional[np.ndarray]] = []
+            for key in keys:
+                pending = self._pending.get(key)
+                if pending is not None:
+                    vectors.append(pending)
+                    continue
+                location = self._index.get(key)
+                if location is None:
+                    vectors.append(None)
+                    continue
+                segment, row = location
+                vectors.append(np.asarray(self._segments[segment][row], np.float32))
+            return vectors
+
+    def put_many(self, keys: Sequence[str], vectors: np.ndarray):
+        with self._lock:
+            for key, vector in zip(keys, np.asarray(vectors, dtype=np.float32)):
+                if key not in self._index:
+                    self._pending[key] = vector
+            full = len(self._pending) >= self._flush_every
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            keys = list(self._pending)
+            matrix = np.stack([self._pending[key] for key in keys]).astype(self._dtype)
+            segment = f"segment-{uuid.uuid4().hex}"
+            base = os.path.join(self._dir, segment)
+            np.save(base + ".npy", matrix)
+            with open(base + ".json.tmp", "w") as f:
+                json.dump(keys, f)
+            os.replace(base + ".json.tmp", base + ".json")
+            self._segments[segment] = np.load(base + ".npy", mmap_mode="r")
+            for row, key in enumerate(keys):
+                self._index[key] = (segment, row)
+            self._pending = {}
+        self._logger.info("flushed %d vectors to %s", len(keys), base)
+
+    def sample(self, count: int, seed: int = 0) -> np.ndarray:
+        """Up to `count` stored vectors drawn at random, as float32."""
+        self.flush()
+        with self._lock:
+            locations = list(self._index.values())
+        if not locations:
+            return np.empty((0, 0), dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        picked = rng.choice(len(locations), min(count, len(locations)), replace=False)
+        return np.stack(
+            [self._segments[locations[i][0]][locations[i][1]] for i in picked]
+        ).astype(np.float32)
+
+    def export(self, path: str):
+        """Write every stored vector to a single `.npz` file."""
+        self.flush()
+        with self._lock:
+            keys = list(self._index)
+            matrix = (
+                np.stack(
+                    [self._segments[seg][row] for seg, row in self._index.values()]
+                )
+                if keys
+                else np.empty((0, 0), dtype=self._dtype)
+            )
+        np.savez(path, keys=np.array(keys), vectors=matrix, model=self._model)
+        self._logger.info("exported %d vectors to %s", len(keys), path)
+
+    def import_(self, path: str) -> int:
+        """Load vectors from a file written by `export` for the same model."""
+        with np.load(path) as data:
+            model = str(data["model"])
+            if model != self._model:
+                raise ValueError(
+                    f"cannot import vectors for model {model} into store for {self._model}"
+                )
+            keys = [str(key) for key in data["keys"]]
+            with self._lock:
+                for key, vector in zip(keys, np.asarray(data["vectors"], np.float32)):
+                    if key not in self._index:
+                        self._pending[key] = vector
+        self.flush()
+        self._logger.info("imported %d vectors from %s", len(keys), path)
+        return len(keys)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.config import get_config
+
+    config = get_config()
+    parser = argparse.ArgumentParser(
+        description="Export or import stored embeddings between environments"
+    )
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("path", help="Path of the .npz file to write or read")
+    parser.add_argument(
+        "--model",
+        default=config.get("embedder.model", "ViT-B/32"),
+        help="Model whose vectors to export or import",
+    )
+    args = parser.parse_args()
+
+    store = EmbeddingStore(
+        config.get("embedding_store.path", ".cache/embeddings"),
+        args.model,
+        dtype=config.get("embedding_store.dtype", "float16"),
+    )
+    if args.action == "export":
+        store.export(args.path)
+    else:
+        store.import_(args.path)
@@ -0,0 +1,71 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from app.core import metrics
+from app.core.logger import get_logger
+from app.models.exceptions import TooManyRequestsError
+
+R = TypeVar("R")
+
+
+class InferenceExecutor:
+    """Runs blocking inference and vector queries off the event loop.
+
+    At most `max_workers` calls run at once and at most `max_queue_depth`
+    more wait for a worker; anything beyond that is rejected immediately
+    with a TooManyRequestsError instead of piling up behind the pool.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue_depth: int = 64):
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="inference"
+        )
+        self._capacity = max_workers + max_queue_depth
+        self._slots = threading.BoundedSemaphore(self._capacity)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._logger = get_logger("inference_executor")
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    async def run(self, fn: Callable[..., R], *args: Any, **kwargs: Any) -> R:
+        if not self._slots.acquire(blocking=False):
+            self._logger.warning("inference queue saturated, rejecting request")
+            raise TooManyRequestsError(message="server is busy, retry later")
+        with self._lock:
+            self._in_flight += 1
+        submitted = time.perf_counter()
+
+        def call() -> R:
+            metrics.record_stage("queue_wait", time.perf_counter() - submitted)
+            return fn(*args, **kwargs)
+
+        try:
+            # in the caller's context, so stages timed on the worker count
+            # towards the request that submitted them
+            future = self._pool.submit(contextvars.copy_context().run, call)
+        except Exception:
+            self._release(None)
+            raise
+        # release the slot when the work finishes, not when the awaiting
+        # request goes away, so cancelled requests still count against capacity
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
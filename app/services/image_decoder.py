@@ -0,0 +1,73 @@
+import asyncio
+import concurrent.futures
+import functools
+from typing import List
+
+from PIL import Image
+
+from app.config import get_config
+from app.utils import ImageDecodeError, decode_image
+
+
+class ImageDecoder:
+    """Decodes untrusted image bytes on a dedicated worker pool.
+
+    The API decodes on threads, since PIL releases the GIL while decoding;
+    the indexer passes `processes=True` to decode whole batches in parallel.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int | None = 20 * 1024 * 1024,
+        max_pixels: int | None = 50_000_000,
+        draft_size: int | None = 224,
+        workers: int = 4,
+        processes: bool = False,
+    ):
+        self.max_bytes = max_bytes
+        # a partial of a module-level function, so it pickles for processes
+        self._decode = functools.partial(
+            decode_image,
+            max_bytes=max_bytes,
+            max_pixels=max_pixels,
+            draft_size=draft_size,
+        )
+        if processes:
+            self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="image-decode"
+            )
+
+    def decode(self, data: bytes) -> Image.Image:
+        return self._pool.submit(self._decode, data).result()
+
+    async def decode_async(self, data: bytes) -> Image.Image:
+        return await asyncio.wrap_future(self._pool.submit(self._decode, data))
+
+    def decode_many(self, items: List[bytes]) -> List[Image.Image | ImageDecodeError]:
+        """Decode in parallel; images that can't be decoded come back as errors."""
+        futures = [self._pool.submit(self._decode, data) for data in items]
+        images: List[Image.Image | ImageDecodeError] = []
+        for future in futures:
+            try:
+                images.append(future.result())
+            except ImageDecodeError as e:
+                images.append(e)
+        return images
+
+    def close(self):
+        self._pool.shutdown()
+
+
+def create_image_decoder(
+    workers: int | None = None, processes: bool = False
+) -> ImageDecoder:
+    config = get_config()
+    return ImageDecoder(
+        max_bytes=config.get("image_decode.max_bytes", 20 * 1024 * 1024),
+        max_pixels=config.get("image_decode.max_pixels", 50_000_000),
+        draft_size=config.get("image_decode.draft_size", 224),
+        workers=workers or int(config.get("image_decode.workers", 4)),
+        processes=processes,
+    )
@@ -0,0 +1,617 @@
+import glob
+import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import get_config
+from app.core import metrics
+from app.core.logger import get_logger
+from app.models.exceptions import ValidationError
+from app.models.search import AdditionalWeaviateParams
+from app.services.cache import EmbeddingCache
+from app.services.derivatives import derivative_urls
+from app.services.embedding_store import EmbeddingStore
+from app.services.executor import InferenceExecutor
+from app.services.projection import Projection
+from app.services.ranking import rank
+from app.services.search import (
+    Document,
+    IndexableDoc,
+    Search,
+    caption_uuid,
+    image_uuid,
+)
+
+if TYPE_CHECKING:
+    from app.services.embedder import Embedder
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def dot(matrix: np.ndarray, query: np.ndarray, chunk: int = 4096) -> np.ndarray:
+    if matrix.dtype == np.float32:
+        return matrix @ query
+    # float16 has no BLAS path, so upcast cache-sized slices into one buffer
+    scores = np.empty(len(matrix), dtype=np.float32)
+    buffer = np.empty((min(chunk, len(matrix)), matrix.shape[1]), dtype=np.float32)
+    for start in range(0, len(matrix), chunk):
+        block = buffer[: len(matrix[start : start + chunk])]
+        block[...] = matrix[start : start + chunk]
+        np.dot(block, query, out=scores[start : start + len(block)])
+    return scores
+
+
+class IVFIndex:
+    """Inverted-file ANN index over the rows of a VectorTable.
+
+    Rows are bucketed by their nearest k-means centroid and a query only
+    scores the rows of its `n_probe` nearest buckets, trading a little
+    recall for touching a fraction of the matrix.
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, n_probe: int):
+        self.centroids = centroids
+        self.assignments = assignments
+        self.n_probe = n_probe
+
+    @classmethod
+    def train(
+        cls,
+        matrix: np.ndarray,
+        n_lists: int,
+        n_probe: int,
+        sample_size: int = 20000,
+        iterations: int = 8,
+    ) -> "IVFIndex":
+        rng = np.random.default_rng(0)
+        sample = np.asarray(
+            matrix[
+                rng.choice(len(matrix), min(sample_size, len(matrix)), replace=False)
+            ],
+            dtype=np.float32,
+        )
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            # empty lists keep their old centroid
+            filled = counts > 0
+            centroids[filled] = normalize(sums[filled])
+        index = cls(centroids, np.empty(0, dtype=np.int32), n_probe)
+        index.assign(np.arange(len(matrix)), matrix)
+        return index
+
+    def assign(self, rows: np.ndarray, vectors: np.ndarray):
+        if len(rows) == 0:
+            return
+        end = int(rows.max()) + 1
+        if end > len(self.assignments):
+            grown = np.zeros(max(end, 2 * len(self.assignments)), dtype=np.int32)
+            grown[: len(self.assignments)] = self.assignments
+            self.assignments = grown
+        for start in range(0, len(rows), 8192):
+            chunk = slice(start, start + 8192)
+            self.assignments[rows[chunk]] = np.argmax(
+                vectors[chunk].astype(np.float32) @ self.centroids.T, axis=1
+            )
+
+    def candidates(self, query: np.ndarray, size: int) -> np.ndarray:
+        probes = np.argpartition(
+            -(self.centroids @ query), min(self.n_probe, len(self.centroids)) - 1
+        )[: self.n_probe]
+        return np.flatnonzero(np.isin(self.assignments[:size], probes))
+
+
+class VectorTable:
+    """Unit-normalized vectors and their properties, addressed by uuid.
+
+    Rows live in one contiguous matrix that grows by doubling, so a query
+    is a single matmul; float16 halves its memory at the cost of upcasting
+    while scoring. A table opened from one segment serves from
+    the memory-mapped file until its first write. Tags are indexed as
+    packed bitmaps over rows, so a tag filter is an OR of a few bitmaps.
+    """
+
+    def __init__(self, name: str, dtype: str = "float32"):
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.ids: List[str] = []
+        self.properties: List[Dict[str, Any]] = []
+        self.rows: Dict[str, int] = {}
+        self.ann: Optional[IVFIndex] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._bitmaps: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._vectors is None:
+            return np.empty((0, 0), dtype=self.dtype)
+        return self._vectors[: len(self.ids)]
+
+    def _reserve(self, size: int, dim: int):
+        vectors = self._vectors
+        if vectors is not None and size <= len(vectors) and vectors.flags.writeable:
+            return
+        capacity = max(size, 2 * (0 if vectors is None else len(vectors)), 1024)
+        grown = np.zeros((capacity, dim), dtype=self.dtype)
+        if self.ids:
+            grown[: len(self.ids)] = vectors[: len(self.ids)]
+        self._vectors = grown
+        for tag, bitmap in self._bitmaps.items():
+            grown_bitmap = np.zeros((capacity + 7) // 8, dtype=np.uint8)
+            grown_bitmap[: len(bitmap)] = bitmap
+            self._bitmaps[tag] = grown_bitmap
+
+    def _set_tag_bits(self, row: int, tags: Sequence[str], value: bool):
+        for tag in tags or []:
+            bitmap = self._bitmaps.get(tag)
+            if bitmap is None:
+                bitmap = np.zeros((len(self._vectors) + 7) // 8, dtype=np.uint8)
+                self._bitmaps[tag] = bitmap
+            bit = np.uint8(0x80 >> (row & 7))
+            if value:
+                bitmap[row >> 3] |= bit
+            else:
+                bitmap[row >> 3] &= ~bit
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        properties: Sequence[Dict[str, Any]],
+    ):
+        if len(ids) == 0:
+            return
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            if self.ids and vectors.shape[1] != self.matrix.shape[1]:
+                raise ValueError(
+                    f"{self.name} holds {self.matrix.shape[1]}-dimensional "
+                    f"vectors, not {vectors.shape[1]}"
+                )
+            self._reserve(len(self.ids) + len(ids), vectors.shape[1])
+            rows = np.empty(len(ids), dtype=np.int64)
+            for i, (id, vector, props) in enumerate(zip(ids, vectors, properties)):
+                row = self.rows.get(id)
+                if row is None:
+                    row = len(self.ids)
+                    self.rows[id] = row
+                    self.ids.append(id)
+                    self.properties.append(props)
+                else:
+                    self._set_tag_bits(row, self.properties[row].get("tags"), False)
+                    self.properties[row] = props
+                self._vectors[row] = vector
+                self._set_tag_bits(row, props.get("tags"), True)
+                rows[i] = row
+            if self.ann is not None:
+                self.ann.assign(rows, vectors)
+
+    def delete(self, ids: Sequence[str]):
+        """Remove rows, moving the last row into each freed one."""
+        with self._lock:
+            if not any(id in self.rows for id in ids):
+                return
+            # a memory-mapped segment is copied before it is written to
+            self._reserve(len(self.ids), self.matrix.shape[1])
+            for id in ids:
+                row = self.rows.pop(id, None)
+                if row is None:
+                    continue
+                last = len(self.ids) - 1
+                self._set_tag_bits(row, self.properties[row].get("tags"), False)
+                if row != last:
+                    moved = self.ids[last]
+                    tags = self.properties[last].get("tags")
+                    self._set_tag_bits(last, tags, False)
+                    self._vectors[row] = self._vectors[last]
+                    self.ids[row] = moved
+                    self.properties[row] = self.properties[last]
+                    self.rows[moved] = row
+                    self._set_tag_bits(row, tags, True)
+                    if self.ann is not None:
+                        self.ann.assignments[row] = self.ann.assignments[last]
+                self.ids.pop()
+                self.properties.pop()
+
+    def load(
+        self, vectors: np.ndarray, ids: List[str], properties: List[Dict[str, Any]]
+    ):
+        """Open the first segment in place; later ones go through `upsert`."""
+        if self.ids:
+            self.upsert(ids, vectors, properties)
+            return
+        # a segment written with another dtype is converted in memory
+        self._vectors = np.asarray(vectors, dtype=self.dtype)
+        self.ids = list(ids)
+        self.properties = list(properties)
+        self.rows = {id: row for row, id in enumerate(self.ids)}
+        postings: Dict[str, List[int]] = {}
+        for row, props in enumerate(self.properties):
+            for tag in props.get("tags") or []:
+                postings.setdefault(tag, []).append(row)
+        for tag, rows in postings.items():
+            mask = np.zeros(len(vectors), dtype=bool)
+            mask[rows] = True
+            self._bitmaps[tag] = np.packbits(mask)
+
+    def tags(self) -> Iterator[str]:
+        return iter(list(self._bitmaps))
+
+    def _tag_mask(self, tags: Sequence[str], size: int) -> np.ndarray:
+        combined = np.zeros((size + 7) // 8, dtype=np.uint8)
+        for tag in tags:
+            bitmap = self._bitmaps.get(tag)
+            if bitmap is not None:
+                combined |= bitmap[: len(combined)]
+        return np.unpackbits(combined, count=size).astype(bool)
+
+    def vectors(self, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Stored vectors of the ids present in the table, as float32."""
+        with self._lock:
+            found = [id for id in ids if id in self.rows]
+            rows = [self.rows[id] for id in found]
+            matrix = self.matrix[rows].astype(np.float32)
+        return dict(zip(found, matrix))
+
+    def properties_of(self, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Properties of the ids present in the table."""
+        with self._lock:
+            return {id: self.properties[self.rows[id]] for id in ids if id in self.rows}
+
+    def top_k(
+        self,
+        query: Sequence[float],
+        k: int,
+        min_similarity: float | None = None,
+        tags: Sequence[str] | None = None,
+    ) -> List[Tuple[str, Dict[str, Any], float]]:
+        """Ids, properties and cosine similarities of the k rows most similar
+        to `query`.
+
+        Scored under the lock: writes overwrite and move rows in place, so
+        the matrix and the row ids are only consistent while it is held.
+        """
+        query = normalize(np.asarray(query, dtype=np.float32))
+        with self._lock:
+            matrix = self.matrix
+            if len(matrix) == 0:
+                return []
+            rows = None
+            if self.ann is not None:
+                rows = self.ann.candidates(query, len(matrix))
+            if tags:
+                mask = self._tag_mask(tags, len(matrix))
+                rows = np.flatnonzero(mask) if rows is None else rows[mask[rows]]
+            scores = dot(matrix if rows is None else matrix[rows], query)
+            if rows is None:
+                rows = np.arange(len(scores))
+            if min_similarity is not None:
+                keep = scores >= min_similarity
+                rows, scores = rows[keep], scores[keep]
+            k = min(k, len(scores))
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                (self.ids[row], self.properties[row], score)
+                for row, score in zip(rows[top].tolist(), scores[top].tolist())
+            ]
+
+
+class NumpySearch(Search):
+    """In-process search over vectors held in NumPy matrices.
+
+    Needs no Weaviate: every write is persisted under `path` as an
+    immutable segment (one `.npy` per table plus a `.json` of ids and
+    properties, written last) next to an `index.json` recording the vector
+    space, and `close` compacts the segments into one
+    and trains an IVF index for tables of at least `ann_min_rows` rows.
+    Only vector queries are supported; keyword and hybrid need bm25.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        embedder: "Embedder",
+        executor: InferenceExecutor | None = None,
+        embedding_cache: EmbeddingCache | None = None,
+        embedding_store: EmbeddingStore | None = None,
+        projection: Projection | None = None,
+        dtype: str = "float32",
+        ann_min_rows: int = 50000,
+        ann_n_probe: int = 16,
+    ):
+        super().__init__(
+            embedder, executor, embedding_cache, embedding_store, projection
+        )
+        self.logger = get_logger("numpy_search")
+        self._path = path
+        self._meta_path = os.path.join(path, "index.json")
+        self._dtype = dtype
+        self._ann_min_rows = ann_min_rows
+        self._ann_n_probe = ann_n_probe
+        self._write_lock = threading.Lock()
+        self._segments = 0
+        self._written = False
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def from_config(cls, embedder: "Embedder", **kwargs) -> "NumpySearch":
+        config = get_config()
+        return cls(
+            config.get("search.numpy.path", ".cache/vector_index"),
+            embedder,
+            dtype=config.get("search.numpy.dtype", "float32"),
+            ann_min_rows=int(config.get("search.numpy.ann.min_rows", 50000)),
+            ann_n_probe=int(config.get("search.numpy.ann.n_probe", 16)),
+            **kwargs,
+        )
+
+    def _segment_paths(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self._path, "segment-*.json")))
+
+    def _load(self):
+        self.images = VectorTable("images", self._dtype)
+        self.captions = VectorTable("captions", self._dtype)
+        paths = self._segment_paths()
+        for path in paths:
+            base = path[: -len(".json")]
+            with open(path, "r") as f:
+                meta = json.load(f)
+            for table in (self.images, self.captions):
+                table.load(
+                    np.load(f"{base}-{table.name}.npy", mmap_mode="r"),
+                    meta[table.name]["ids"],
+                    meta[table.name]["properties"],
+                )
+                table.delete(meta[table.name].get("deleted", []))
+        if paths:
+            self._segments = int(os.path.basename(paths[-1])[8:14])
+        if len(paths) == 1:
+            self._load_ann(paths[0][: -len(".json")])
+        self.logger.info(
+            "opened %s with %d images and %d captions in %d segments",
+            self._path,
+            len(self.images),
+            len(self.captions),
+            len(paths),
+        )
+
+    def _load_ann(self, base: str):
+        for table in (self.images, self.captions):
+            ann_path = f"{base}-{table.name}.ivf.npz"
+            if os.path.exists(ann_path):
+                with np.load(ann_path) as data:
+                    table.ann = IVFIndex(
+                        data["centroids"],
+                        data["assignments"].copy(),
+                        self._ann_n_probe,
+                    )
+
+    def _write_segment(
+        self,
+        tables: Dict[str, Tuple[List[str], np.ndarray, List[Dict[str, Any]]]],
+        deleted: Dict[str, List[str]] | None = None,
+    ) -> str:
+        self._segments += 1
+        base = os.path.join(self._path, f"segment-{self._segments:06d}")
+        for name, (_, vectors, _) in tables.items():
+            np.save(f"{base}-{name}.npy", np.asarray(vectors, dtype=self._dtype))
+        meta = {
+            name: {
+                "ids": ids,
+                "properties": properties,
+                "deleted": (deleted or {}).get(name, []),
+            }
+            for name, (ids, _, properties) in tables.items()
+        }
+        # the json is the commit marker, so it goes last
+        with open(f"{base}.json.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{base}.json.tmp", f"{base}.json")
+        return base
+
+    def _remove_segment(self, path: str):
+        base = path[: -len(".json")]
+        os.remove(path)
+        for file in glob.glob(f"{base}-*"):
+            os.remove(file)
+
+    def create_collections_if_not_exists(self, force_recreate: bool = False):
+        if force_recreate:
+            self.delete_collections()
+        if not os.path.exists(self._meta_path) and not self._segment_paths():
+            with open(f"{self._meta_path}.tmp", "w") as f:
+                json.dump({"vector_space": self.vector_space}, f)
+            os.replace(f"{self._meta_path}.tmp", self._meta_path)
+        self.check_vector_space()
+
+    def stored_vector_space(self) -> str | None:
+        if not os.path.exists(self._meta_path):
+            return None
+        with open(self._meta_path, "r") as f:
+            return json.load(f).get("vector_space")
+
+    def delete_collections(self):
+        with self._write_lock:
+            for path in self._segment_paths():
+                self._remove_segment(path)
+            if os.path.exists(self._meta_path):
+                os.remove(self._meta_path)
+            self._segments = 0
+            self.images = VectorTable("images", self._dtype)
+            self.captions = VectorTable("captions", self._dtype)
+
+    def iter_tags(self) -> Iterator[str]:
+        return self.images.tags()
+
+    def write_many(
+        self,
+        documents: List[IndexableDoc],
+        image_embeddings: List[List[float]],
+        text_embeddings: List[List[List[float]]],
+        batch_size: int | None = None,
+        concurrent_requests: int | None = None,
+    ) -> List[Dict[str, str]]:
+        """Upsert documents in memory and persist them as a new segment."""
+        if not documents:
+            return []
+        image_ids = [image_uuid(document.id) for document in documents]
+        image_properties = [
+            {"imageUrl": document.image_url, "tags": document.tags}
+            for document in documents
+        ]
+        caption_ids: List[str] = []
+        caption_properties: List[Dict[str, Any]] = []
+        caption_vectors: List[List[float]] = []
+        for document, image_id, vectors in zip(documents, image_ids, text_embeddings):
+            for i, caption in enumerate(document.captions):
+                caption_ids.append(caption_uuid(document.id, i))
+                caption_properties.append(
+                    {"captionText": caption, "tags": document.tags, "image": image_id}
+                )
+                caption_vectors.append(vectors[i])
+        # segments are opened without a copy, so they hold normalized rows
+        image_vectors = normalize(np.asarray(image_embeddings, dtype=np.float32))
+        text_vectors = normalize(np.asarray(caption_vectors, dtype=np.float32))
+
+        with self._write_lock:
+            # captions past an image's current ones, left from when it had more
+            orphans = []
+            for document in documents:
+                i = len(document.captions)
+                while caption_uuid(document.id, i) in self.captions.rows:
+                    orphans.append(caption_uuid(document.id, i))
+                    i += 1
+            self.images.upsert(image_ids, image_vectors, image_properties)
+            self.captions.upsert(caption_ids, text_vectors, caption_properties)
+            self.captions.delete(orphans)
+            self._write_segment(
+                {
+                    "images": (image_ids, image_vectors, image_properties),
+                    "captions": (caption_ids, text_vectors, caption_properties),
+                },
+                deleted={"captions": orphans},
+            )
+            self._written = True
+        self.logger.info("imported %d documents", len(documents))
+        return []
+
+    def compact(self):
+        """Merge all segments into one and rebuild the ANN indexes."""
+        with self._write_lock:
+            old = self._segment_paths()
+            tables = {}
+            for table in (self.images, self.captions):
+                table.ann = None
+                if len(table) >= self._ann_min_rows:
+                    table.ann = IVFIndex.train(
+                        table.matrix,
+                        n_lists=int(np.sqrt(len(table))),
+                        n_probe=self._ann_n_probe,
+                    )
+                tables[table.name] = (table.ids, table.matrix, table.properties)
+            base = self._write_segment(tables)
+            for table in (self.images, self.captions):
+                if table.ann is not None:
+                    np.savez(
+                        f"{base}-{table.name}.ivf.npz",
+                        centroids=table.ann.centroids,
+                        assignments=table.ann.assignments[: len(table)],
+                    )
+            for path in old:
+                self._remove_segment(path)
+        self.logger.info("compacted %d segments into %s", len(old), base)
+
+    def close(self):
+        super().close()
+        if self._written:
+            self.compact()
+
+    def _query_captions(
+        self,
+        query: str,
+        limit: int,
+        additional_params: AdditionalWeaviateParams,
+        group_by: Any = None,
+        query_vector: List[float] | None = None,
+    ) -> List[Document]:
+        if additional_params.mode in ("keyword", "hybrid"):
+            raise ValidationError(
+                message="keyword and hybrid search need the weaviate search backend"
+            )
+        if query_vector is None:
+            query_vector = self.embed_query(query)
+        with metrics.stage("vector_query"):
+            hits = self.captions.top_k(
+                query_vector,
+                limit,
+                min_similarity=additional_params.min_similarity,
+                tags=additional_params.tags,
+            )
+        start = time.perf_counter()
+        images = self.images.properties_of(
+            [caption.get("image", "") for _, caption, _ in hits]
+        )
+        results: List[Document] = []
+        for caption_id, caption, similarity in hits:
+            image_id = caption.get("image", "")
+            image_url = images.get(image_id, {}).get("imageUrl", "")
+            results.append(
+                {
+                    "image_url": image_url,
+                    "image_urls": derivative_urls(image_url),
+                    "caption": caption["captionText"],
+                    "score": similarity,
+                    "metadata": {
+                        "caption_id": caption_id,
+                        "image_id": image_id,
+                    },
+                }
+            )
+        metrics.record_stage("result_mapping", time.perf_counter() - start)
+        return results
+
+    def image_vectors(self, image_ids: List[str]) -> Dict[str, List[float]]:
+        return {
+            id: vector.tolist() for id, vector in self.images.vectors(image_ids).items()
+        }
+
+    def image_search_by_vector(
+        self,
+        query_vector: List[float],
+        top_k: int = 10,
+        min_similarity: float | None = None,
+    ) -> List[Document]:
+        with metrics.stage("vector_query"):
+            hits = self.images.top_k(query_vector, top_k, min_similarity)
+        start = time.perf_counter()
+        results: List[Document] = []
+        for image_id, image, similarity in hits:
+            image_url = image["imageUrl"]
+            results.append(
+                {
+                    "image_url": image_url,
+                    "image_urls": derivative_urls(image_url),
+                    "score": similarity,
+                    "metadata": {"image_id": image_id},
+                }
+            )
+        metrics.record_stage("result_mapping", time.perf_counter() - start)
+        return rank(results)
@@ -0,0 +1,123 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.models.exceptions import NotFoundError, ValidationError
+
+Fetch = Callable[[int], List[Dict[str, Any]]]
+
+
+class SearchSession:
+    """The ranked candidates of one query, grown on demand.
+
+    `fetch(n)` re-runs the query for its top n results from an already
+    computed query vector, so deeper pages only cost a vector query.
+    """
+
+    def __init__(self, fetch: Fetch, max_results: int | None = None):
+        self.fetch = fetch
+        self.max_results = max_results
+        self.results: List[Dict[str, Any]] = []
+        self.exhausted = False
+        self.touched_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def page(self, offset: int, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        with self.lock:
+            self.touched_at = time.monotonic()
+            end = offset + limit
+            if len(self.results) < end and not self.exhausted:
+                # grow geometrically so paging through n results costs
+                # O(log n) queries rather than one per page
+                wanted = max(end, 2 * len(self.results))
+                if self.max_results is not None:
+                    wanted = min(wanted, max(end, self.max_results))
+                self.results = self.fetch(wanted)
+                self.exhausted = len(self.results) < wanted
+            has_more = len(self.results) > end or not self.exhausted
+            return self.results[offset:end], has_more
+
+
+class ResultPager:
+    """Short-lived server-side sessions behind opaque pagination cursors.
+
+    Pages end at `max_results`, so no cursor or offset makes a session
+    fetch more candidates than that.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 300,
+        max_sessions: int = 1000,
+        max_results: int = 1000,
+    ):
+        self._ttl = ttl_seconds
+        self._max_sessions = max_sessions
+        self.max_results = max_results
+        self._sessions: OrderedDict[str, SearchSession] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.touched_at <= self._ttl and (
+                len(self._sessions) <= self._max_sessions
+            ):
+                break
+            del self._sessions[session_id]
+
+    def check_page(self, offset: int, limit: int):
+        if offset + limit > self.max_results:
+            raise ValidationError(
+                message=f"offset + top_k must not exceed {self.max_results}"
+            )
+
+    def create(self, fetch: Fetch) -> str:
+        session_id = secrets.token_urlsafe(12)
+        with self._lock:
+            self._sessions[session_id] = SearchSession(fetch, self.max_results)
+            self._expire()
+        return session_id
+
+    def _session(self, session_id: str) -> SearchSession:
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise NotFoundError(message="cursor expired, run the search again")
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def page(
+        self, session_id: str, offset: int, limit: int
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return one page of results and the cursor for the next one, if any.
+
+        A page reaching past `max_results` is cut short there.
+        """
+        if offset >= self.max_results:
+            raise ValidationError(
+                message=f"results past {self.max_results} are not available"
+            )
+        limit = min(limit, self.max_results - offset)
+        results, has_more = self._session(session_id).page(offset, limit)
+        end = offset + limit
+        next_cursor = None
+        if has_more and end < self.max_results:
+            next_cursor = encode_cursor(session_id, end)
+        return results, next_cursor
+
+
+def encode_cursor(session_id: str, offset: int) -> str:
+    return f"{session_id}.{offset}"
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        session_id, offset = cursor.rsplit(".", 1)
+        return session_id, int(offset)
+    except ValueError:
+        raise ValidationError(message="invalid cursor")
@@ -0,0 +1,146 @@
+import hashlib
+import os
+
+import numpy as np
+
+from app.config import get_config
+from app.core.logger import get_logger
+
+logger = get_logger("projection")
+
+
+class Projection:
+    """PCA projection of model vectors to fewer dimensions.
+
+    Fitted on vectors of the indexed corpus and applied to every vector on
+    its way into the index and to every query vector, so both live in the
+    same reduced space. Projected vectors are re-normalized, since the
+    collections compare them by cosine distance.
+    """
+
+    def __init__(self, model: str, mean: np.ndarray, components: np.ndarray):
+        self.model = model
+        self.mean = mean.astype(np.float32)
+        # (dim, model dim), rows ordered by explained variance
+        self.components = components.astype(np.float32)
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def fingerprint(self) -> str:
+        digest = hashlib.sha1(self.model.encode())
+        digest.update(self.mean.tobytes())
+        digest.update(self.components.tobytes())
+        return digest.hexdigest()[:16]
+
+    @classmethod
+    def fit(cls, model: str, vectors: np.ndarray, dim: int) -> "Projection":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        mean = vectors.mean(axis=0)
+        _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+        return cls(model, mean, vt[:dim])
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+        projected = (vectors - self.mean) @ self.components.T
+        return projected / np.linalg.norm(projected, axis=-1, keepdims=True)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, model=self.model, mean=self.mean, components=self.components)
+
+    @classmethod
+    def load(cls, path: str) -> "Projection":
+        with np.load(path) as data:
+            return cls(str(data["model"]), data["mean"], data["components"])
+
+
+def vector_space(model: str, projection: Projection | None) -> str:
+    """Name of the space `model` vectors are indexed in with `projection`.
+
+    Recorded with the index, so a server or a resumed indexer configured
+    with another model or projection refuses to mix vectors of two spaces.
+    """
+    if projection is None:
+        return model
+    return f"{model}+pca{projection.dim}-{projection.fingerprint}"
+
+
+def load_projection(model: str) -> Projection | None:
+    """The configured projection for `model`, or None when it is disabled."""
+    config = get_config()
+    if not config.get("projection.enabled", False):
+        return None
+    path = config.get("projection.path", ".cache/projection.npz")
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"projection is enabled but {path} does not exist; "
+            "fit it with `python -m app.services.projection`"
+        )
+    projection = Projection.load(path)
+    if projection.model != model:
+        raise ValueError(
+            f"projection in {path} was fitted for {projection.model}, not {model}"
+        )
+    logger.info("projecting %s vectors to %d dimensions", model, projection.dim)
+    return projection
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.services.embedding_store import EmbeddingStore
+
+    config = get_config()
+    parser = argparse.ArgumentParser(
+        description="Fit the PCA projection on vectors in the embedding store"
+    )
+    parser.add_argument(
+        "--dim", type=int, default=int(config.get("projection.dim", 128))
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=50000,
+        help="Most stored vectors to fit on",
+    )
+    parser.add_argument(
+        "--model",
+        default=config.get("embedder.model", "ViT-B/32"),
+    )
+    parser.add_argument(
+        "--output",
+        help="File to write; defaults to a new file next to projection.path",
+    )
+    args = parser.parse_args()
+
+    store = EmbeddingStore(
+        config.get("embedding_store.path", ".cache/embeddings"),
+        args.model,
+        dtype=config.get("embedding_store.dtype", "float16"),
+    )
+    vectors = store.sample(args.samples)
+    if len(vectors) <= args.dim:
+        raise SystemExit(
+            f"only {len(vectors)} stored vectors; index more images before fitting"
+        )
+    projection = Projection.fit(args.model, vectors, args.dim)
+    # the live projection keeps serving the current index until it is
+    # switched over together with a full reindex
+    live_path = config.get("projection.path", ".cache/projection.npz")
+    root, ext = os.path.splitext(live_path)
+    path = args.output or f"{root}-{args.dim}-{projection.fingerprint}{ext}"
+    if os.path.exists(path) and os.path.samefile(path, live_path):
+        raise SystemExit(f"{path} is the live projection; choose another --output")
+    projection.save(path)
+    logger.info(
+        "fitted %d-dimensional projection on %d vectors to %s; set "
+        "projection.path to it and reindex with --full",
+        args.dim,
+        len(vectors),
+        path,
+    )
@@ -0,0 +1,68 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Collections use cosine distance, which Weaviate reports in [0, 2] with 0 for
+# identical vectors. Results are exposed as similarities instead so that
+# every search mode ranks higher-is-better.
+
+
+def distance_to_similarity(distance: Optional[float]) -> Optional[float]:
+    return None if distance is None else 1 - distance
+
+
+def max_distance(min_similarity: Optional[float]) -> Optional[float]:
+    """Translate a minimum similarity into the distance threshold Weaviate takes."""
+    return None if min_similarity is None else 1 - min_similarity
+
+
+def cosine_similarities(vectors: Sequence[Sequence[float]], query: Sequence[float]):
+    """Exact cosine similarity of every vector to `query`, in one matmul."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    query = np.asarray(query, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    return vectors @ query / np.maximum(norms, 1e-12)
+
+
+def rescale(values: np.ndarray, low: float, high: float) -> np.ndarray:
+    """Min-max map `values` onto [low, high]; equal values land mid-range."""
+    values = np.asarray(values, dtype=np.float32)
+    spread = values.max() - values.min() if len(values) else 0
+    if spread == 0:
+        return np.full(len(values), (low + high) / 2, dtype=np.float32)
+    return low + (values - values.min()) * (high - low) / spread
+
+
+def rank(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Order results best first, keeping results without a score last."""
+    return sorted(
+        results,
+        key=lambda result: (result["score"] is not None, result["score"] or 0),
+        reverse=True,
+    )
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[List[str]], weights: Sequence[float], k: int = 60
+) -> Dict[str, float]:
+    """Score ids by the weighted sum of 1 / (k + rank) over every ranking.
+
+    Only ranks are used, so rankings whose scores live on different scales,
+    like text-to-image and text-to-text similarities, fuse fairly.
+    """
+    scores: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for position, id in enumerate(ranking, start=1):
+            scores[id] = scores.get(id, 0.0) + weight / (k + position)
+    return scores
+
+
+def weighted_score_fusion(
+    scores: Sequence[Dict[str, float]], weights: Sequence[float]
+) -> Dict[str, float]:
+    """Score ids by the weighted sum of their scores, 0 where an id is missing."""
+    fused: Dict[str, float] = {}
+    for by_id, weight in zip(scores, weights):
+        for id, score in by_id.items():
+            fused[id] = fused.get(id, 0.0) + weight * score
+    return fused
@@ -1,20 +1,43 @@
+import concurrent.futures
+import contextvars
 import json
+import re
+import time
 from abc import ABC, abstractmethod
-from typing import Any, List, Tuple
-from uuid import UUID
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Tuple
 
+import numpy as np
 import weaviate.classes as wvc
 from PIL import Image
-from weaviate import WeaviateClient
 from weaviate.classes.query import Filter
-from weaviate.collections.classes.data import DataReference
+from weaviate.util import generate_uuid5
 
 import app.utils as utils
+from app.config import get_config
+from app.core import metrics
 from app.core.logger import get_logger
 from app.data.collection import Caption as CaptionCollection
 from app.data.collection import Image as ImageCollection
+from app.data.collection import collection_schema
 from app.models.search import AdditionalWeaviateParams
-from app.services.embedder import Embedder
+from app.services.cache import EmbeddingCache
+from app.services.derivatives import derivative_urls
+from app.services.embedding_store import EmbeddingStore, image_key, text_key
+from app.services.executor import InferenceExecutor
+from app.services.projection import Projection, vector_space
+from app.services.ranking import (
+    cosine_similarities,
+    distance_to_similarity,
+    max_distance,
+    rank,
+    reciprocal_rank_fusion,
+    rescale,
+    weighted_score_fusion,
+)
+from app.services.weaviate_pool import WeaviateClientPool
+
+if TYPE_CHECKING:
+    from app.services.embedder import Embedder
 
 
 class IndexableDoc:
@@ -25,12 +48,14 @@ class IndexableDoc:
         captions: List[str],
         image_url: str,
         tags: List[str],
+        image_bytes: bytes | None = None,
     ):
         self._id = id
         self._image = image
         self._captions = captions
         self._image_url = image_url
         self._tags = tags
+        self._image_bytes = image_bytes
 
     @property
     def id(self) -> str:
@@ -52,6 +77,11 @@ class IndexableDoc:
     def tags(self) -> List[str]:
         return self._tags
 
+    @property
+    def image_bytes(self) -> bytes | None:
+        """The encoded source file `image` was decoded from, if known."""
+        return self._image_bytes
+
     def __str__(self) -> str:
         return self.id
 
@@ -59,22 +89,588 @@ class IndexableDoc:
 Document = dict[str, Any]
 
 
+# caption properties searched by bm25 in keyword and hybrid mode
+KEYWORD_PROPERTIES = ["captionText", "tags"]
+
+# ways to combine the similarities of an image's matching captions
+FUSIONS: Dict[str, Callable[[List[float]], float]] = {
+    "max": max,
+    "mean": lambda scores: sum(scores) / len(scores),
+    "sum": sum,
+}
+
+
+# how WeaviateSearch records the vector space in the collection descriptions
+VECTOR_SPACE_DESCRIPTION = re.compile(r" Vectors: (\S+)\.$")
+
+
+def image_uuid(doc_id: str) -> str:
+    return generate_uuid5(doc_id, "Image")
+
+
+def caption_uuid(doc_id: str, index: int) -> str:
+    return generate_uuid5(f"{doc_id}:{index}", "Caption")
+
+
 class Search(ABC):
+    """A vector search backend over the Image and Caption collections.
+
+    Embedding, caption grouping and cross-modal fusion live here; backends
+    implement storage and the two primitive queries, `_query_captions` and
+    `image_search_by_vector`.
+    """
+
+    def __init__(
+        self,
+        embedder: "Embedder",
+        executor: InferenceExecutor | None = None,
+        embedding_cache: EmbeddingCache | None = None,
+        embedding_store: EmbeddingStore | None = None,
+        projection: Projection | None = None,
+    ):
+        self.embedder = embedder
+        self.executor = executor
+        self.embedding_cache = embedding_cache
+        self.embedding_store = embedding_store
+        self.projection = projection
+        self.logger = get_logger("search")
+        # runs the second query of a cross-modal search next to the first
+        self._fanout = concurrent.futures.ThreadPoolExecutor(
+            max_workers=int(get_config().get("search.cross_modal.fanout_workers", 4)),
+            thread_name_prefix="cross-modal",
+        )
+
+    def close(self):
+        self._fanout.shutdown()
+
+    @property
+    def vector_space(self) -> str:
+        return vector_space(self.embedder.model_name, self.projection)
+
+    def check_vector_space(self):
+        """Refuse an index built from another model or projection."""
+        stored = self.stored_vector_space()
+        if stored is None:
+            self.logger.warning(
+                "the index does not record its vector space; assuming %s",
+                self.vector_space,
+            )
+        elif stored != self.vector_space:
+            raise ValueError(
+                f"the index holds {stored} vectors but {self.vector_space} "
+                "are configured; restore the projection it was built with or "
+                "reindex with --full"
+            )
+
     @abstractmethod
-    def index(self, data: IndexableDoc):
+    def create_collections_if_not_exists(self, force_recreate: bool = False):
+        """Create the collections, recording the vector space in new ones,
+        and check the vector space of existing ones."""
+
+    @abstractmethod
+    def stored_vector_space(self) -> str | None:
+        """The vector space recorded with the index, if any."""
+
+    @abstractmethod
+    def delete_collections(self):
         pass
 
     @abstractmethod
-    def search(self, query: str) -> List[Document]:
+    def iter_tags(self) -> Iterator[str]:
+        pass
+
+    @abstractmethod
+    def write_many(
+        self,
+        documents: List[IndexableDoc],
+        image_embeddings: List[List[float]],
+        text_embeddings: List[List[List[float]]],
+        batch_size: int | None = None,
+        concurrent_requests: int | None = None,
+    ) -> List[Dict[str, str]]:
+        pass
+
+    @abstractmethod
+    def _query_captions(
+        self,
+        query: str,
+        limit: int,
+        additional_params: AdditionalWeaviateParams,
+        group_by: Any = None,
+        query_vector: List[float] | None = None,
+    ) -> List[Document]:
+        """One result per matching caption, best first."""
+
+    @abstractmethod
+    def image_search_by_vector(
+        self,
+        query_vector: List[float],
+        top_k: int = 10,
+        min_similarity: float | None = None,
+    ) -> List[Document]:
         pass
 
+    @abstractmethod
+    def image_vectors(self, image_ids: List[str]) -> Dict[str, List[float]]:
+        """Stored vectors of the given images, fetched in one request."""
+
+    def _caption_group_by(self, top_k: int, captions_per_image: int) -> Any:
+        """Backend-side grouping of caption hits by image, if supported."""
+        return None
+
+    def index(self, document: IndexableDoc):
+        self.index_many([document])
+
+    def generate_embeddings(self, document: IndexableDoc):
+        self.logger.debug(f"generating embeddings for document: {document}")
+        image_embeddings, text_embeddings = self.generate_embeddings_many([document])
+        return image_embeddings[0], text_embeddings[0]
+
+    def _project(self, vectors: Any) -> List[List[float]]:
+        """Raw model vectors as indexed: projected when a projection is set."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.projection is not None and len(vectors):
+            vectors = self.projection.apply(vectors)
+        return vectors.tolist()
+
+    def _embed_with_store(
+        self,
+        items: List[Any],
+        embed: Callable[[List[Any]], Any],
+        key: Callable[[Any], str | None],
+    ) -> np.ndarray:
+        # the store keeps raw model vectors, so refitting the projection
+        # never invalidates it. Items without a key are always embedded
+        if not items:
+            return np.empty((0, 0), dtype=np.float32)
+        if self.embedding_store is None:
+            return embed(items).float().cpu().numpy()
+        keys = [key(item) for item in items]
+        stored = iter(self.embedding_store.get_many([k for k in keys if k is not None]))
+        vectors = [None if k is None else next(stored) for k in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = embed([items[i] for i in missing]).float().cpu().numpy()
+            keyed = [j for j, i in enumerate(missing) if keys[i] is not None]
+            self.embedding_store.put_many(
+                [keys[missing[j]] for j in keyed], computed[keyed]
+            )
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return np.stack(vectors)
+
+    def generate_embeddings_many(
+        self, documents: List[IndexableDoc]
+    ) -> Tuple[List[List[float]], List[List[List[float]]]]:
+        """Embed all images and captions of `documents` in batched passes.
+
+        Vectors already in the embedding store are read from it; only the
+        rest go through the model. Images are looked up by their encoded
+        source bytes, so documents without `image_bytes` bypass the store.
+        """
+        captions = [caption for document in documents for caption in document.captions]
+        image_embeddings = self._project(
+            self._embed_with_store(
+                documents,
+                lambda docs: self.embedder.embed_images([doc.image for doc in docs]),
+                lambda doc: (
+                    None if doc.image_bytes is None else image_key(doc.image_bytes)
+                ),
+            )
+        )
+        flat_embeddings = self._project(
+            self._embed_with_store(captions, self.embedder.embed_texts, text_key)
+        )
+        text_embeddings: List[List[List[float]]] = []
+        offset = 0
+        for document in documents:
+            count = len(document.captions)
+            text_embeddings.append(flat_embeddings[offset : offset + count])
+            offset += count
+        return image_embeddings, text_embeddings
+
+    def index_many(
+        self,
+        documents: List[IndexableDoc],
+        batch_size: int | None = None,
+        concurrent_requests: int | None = None,
+    ) -> List[Dict[str, str]]:
+        """Embed and bulk import documents; see `write_many`."""
+        if not documents:
+            return []
+        image_embeddings, text_embeddings = self.generate_embeddings_many(documents)
+        return self.write_many(
+            documents,
+            image_embeddings,
+            text_embeddings,
+            batch_size=batch_size,
+            concurrent_requests=concurrent_requests,
+        )
+
+    def embed_query(self, query: str) -> List[float]:
+        model = self.embedder.model_name
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(model, query)
+            if cached is not None:
+                return self._project([cached])[0]
+        with metrics.stage("embed"):
+            query_embedding = self.embedder.embed_text(query).tolist()[0]
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(model, query, query_embedding)
+        return self._project([query_embedding])[0]
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed many queries in one batched pass, reading through the cache."""
+        model = self.embedder.model_name
+        vectors: List[List[float] | None] = [None] * len(queries)
+        if self.embedding_cache is not None:
+            vectors = [self.embedding_cache.get(model, query) for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            with metrics.stage("embed"):
+                computed = self.embedder.embed_texts([queries[i] for i in missing])
+            for i, vector in zip(missing, computed.tolist()):
+                vectors[i] = vector
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put(model, queries[i], vector)
+        return self._project(vectors)
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        additional_params: AdditionalWeaviateParams = None,
+        query_vector: List[float] | None = None,
+    ) -> List[Document]:
+        additional_params = additional_params or AdditionalWeaviateParams()
+        try:
+            if additional_params.mode == "cross_modal":
+                if query_vector is None:
+                    query_vector = self.embed_query(query)
+                return self.cross_modal_search(query_vector, top_k, additional_params)
+            config = get_config()
+            rerank = additional_params.rerank
+            if rerank is None:
+                rerank = config.get("search.rerank.enabled", False)
+            # only vector scores are cosine similarities that blend with
+            # the image similarity
+            rerank = rerank and additional_params.mode == "vector"
+            limit = top_k
+            if rerank:
+                limit = top_k * int(config.get("search.rerank.oversample", 4))
+                if query_vector is None:
+                    query_vector = self.embed_query(query)
+            if additional_params.group_by_image:
+                results = self.grouped_search(
+                    query, limit, additional_params, query_vector=query_vector
+                )
+            else:
+                results = rank(
+                    self._query_captions(
+                        query, limit, additional_params, query_vector=query_vector
+                    )
+                )
+            if rerank:
+                with metrics.stage("rerank"):
+                    results = self.rerank(
+                        results,
+                        query_vector,
+                        top_k,
+                        float(config.get("search.rerank.image_weight", 0.5)),
+                        additional_params.min_similarity,
+                    )
+            return results
+        except Exception as e:
+            self.logger.error(f"Error searching: {e}")
+            raise e
+
+    def grouped_search(
+        self,
+        query: str,
+        top_k: int,
+        additional_params: AdditionalWeaviateParams,
+        query_vector: List[float] | None = None,
+    ) -> List[Document]:
+        """Return the top_k distinct images, scored by fusing their caption hits.
+
+        An over-sampled set of caption candidates is fetched, either as a flat
+        list or grouped by image in the backend, and the similarities of each
+        image's captions are combined with max, mean or sum.
+        """
+        config = get_config()
+        oversample = int(config.get("search.group.oversample", 5))
+        captions_per_image = int(config.get("search.group.captions_per_image", 3))
+        group_by = self._caption_group_by(top_k, captions_per_image)
+        candidates = self._query_captions(
+            query,
+            top_k * oversample,
+            additional_params,
+            group_by=group_by,
+            query_vector=query_vector,
+        )
+
+        start = time.perf_counter()
+        groups: Dict[str, List[Tuple[float, Document]]] = {}
+        for candidate in candidates:
+            similarity = candidate["score"]
+            if similarity is None:
+                continue
+            image_id = candidate["metadata"]["image_id"]
+            groups.setdefault(image_id, []).append((similarity, candidate))
+
+        fuse = FUSIONS[additional_params.fusion]
+        results: List[Document] = []
+        for image_id, hits in groups.items():
+            hits.sort(key=lambda hit: hit[0], reverse=True)
+            best = hits[:captions_per_image]
+            results.append(
+                {
+                    "image_url": best[0][1]["image_url"],
+                    "image_urls": best[0][1]["image_urls"],
+                    "caption": best[0][1]["caption"],
+                    "captions": [hit[1]["caption"] for hit in best],
+                    "score": fuse([similarity for similarity, _ in hits]),
+                    "metadata": {
+                        "image_id": image_id,
+                        "caption_ids": [
+                            hit[1]["metadata"]["caption_id"] for hit in best
+                        ],
+                        "matches": len(hits),
+                    },
+                }
+            )
+        results = rank(results)[:top_k]
+        metrics.record_stage("result_mapping", time.perf_counter() - start)
+        return results
+
+    def rerank(
+        self,
+        results: List[Document],
+        query_vector: List[float],
+        top_k: int,
+        image_weight: float,
+        min_similarity: float | None = None,
+    ) -> List[Document]:
+        """Re-score approximate caption hits exactly and keep the best top_k.
+
+        The stored vectors of every candidate's image are fetched in one
+        request and compared with the query in a single matmul. Text-to-image
+        similarities sit far below text-to-text ones, so they are min-max
+        mapped onto the range of the candidates' caption similarities before
+        the two are blended by `image_weight`. The blend stays on the caption
+        scale, where `min_similarity` applies; a candidate without an image
+        vector scores its caption similarity for both signals.
+        """
+        image_ids = list(
+            dict.fromkeys(
+                result["metadata"]["image_id"]
+                for result in results
+                if result["metadata"].get("image_id")
+            )
+        )
+        vectors = self.image_vectors(image_ids)
+        similarities: Dict[str, float] = {}
+        if vectors:
+            similarities = dict(
+                zip(
+                    vectors,
+                    cosine_similarities(list(vectors.values()), query_vector).tolist(),
+                )
+            )
+        caption_scores = [r["score"] for r in results if r["score"] is not None]
+        image_signals: Dict[str, float] = {}
+        if similarities and caption_scores:
+            image_signals = dict(
+                zip(
+                    similarities,
+                    rescale(
+                        list(similarities.values()),
+                        min(caption_scores),
+                        max(caption_scores),
+                    ).tolist(),
+                )
+            )
+
+        reranked: List[Document] = []
+        for result in results:
+            image_similarity = similarities.get(result["metadata"]["image_id"])
+            caption_similarity = result["score"]
+            image_signal = image_signals.get(
+                result["metadata"]["image_id"], caption_similarity
+            )
+            score = caption_similarity
+            if caption_similarity is not None:
+                score = (
+                    image_weight * image_signal
+                    + (1 - image_weight) * caption_similarity
+                )
+            if (
+                min_similarity is not None
+                and score is not None
+                and score < min_similarity
+            ):
+                continue
+            reranked.append(
+                {
+                    **result,
+                    "score": score,
+                    "metadata": {
+                        **result["metadata"],
+                        "image_similarity": image_similarity,
+                        "caption_similarity": caption_similarity,
+                    },
+                }
+            )
+        return rank(reranked)[:top_k]
+
+    def cross_modal_search(
+        self,
+        query_vector: List[float],
+        top_k: int = 10,
+        additional_params: AdditionalWeaviateParams = None,
+    ) -> List[Document]:
+        """Rank images by a CLIP vector's matches among both images and captions.
+
+        Text and image vectors share CLIP's space, so one query vector runs
+        against the Image collection and, grouped per image, the Caption
+        collection at the same time. The two rankings are fused per image
+        with reciprocal rank fusion or a weighted sum of similarities. Each
+        collection has its own threshold, `image_min_similarity` and
+        `min_similarity`, as text-to-image similarities run far lower than
+        text-to-text or image-to-image ones.
+        """
+        additional_params = additional_params or AdditionalWeaviateParams()
+        config = get_config()
+        limit = top_k * int(config.get("search.cross_modal.oversample", 2))
+        caption_params = AdditionalWeaviateParams(
+            mode="vector",
+            fusion=additional_params.fusion,
+            min_similarity=additional_params.min_similarity,
+            tags=additional_params.tags,
+        )
+        image_future = self._fanout.submit(
+            contextvars.copy_context().run,
+            self.image_search_by_vector,
+            query_vector,
+            limit,
+            additional_params.image_min_similarity,
+        )
+        try:
+            caption_hits = self.grouped_search(
+                "", limit, caption_params, query_vector=query_vector
+            )
+        finally:
+            image_hits = image_future.result()
+
+        # both come back best first, so the dicts keep each ranking's order
+        image_scores = {
+            hit["metadata"]["image_id"]: hit["score"]
+            for hit in image_hits
+            if hit["score"] is not None
+        }
+        caption_scores = {
+            hit["metadata"]["image_id"]: hit["score"]
+            for hit in caption_hits
+            if hit["score"] is not None
+        }
+        weights = [additional_params.image_weight, 1 - additional_params.image_weight]
+        if additional_params.cross_modal_fusion == "weighted":
+            fused = weighted_score_fusion([image_scores, caption_scores], weights)
+        else:
+            fused = reciprocal_rank_fusion(
+                [list(image_scores), list(caption_scores)],
+                weights,
+                k=int(config.get("search.cross_modal.rrf_k", 60)),
+            )
+
+        hits_by_image = {hit["metadata"]["image_id"]: hit for hit in image_hits}
+        hits_by_image.update((hit["metadata"]["image_id"], hit) for hit in caption_hits)
+        results: List[Document] = []
+        for image_id, score in fused.items():
+            hit = hits_by_image[image_id]
+            results.append(
+                {
+                    "image_url": hit["image_url"],
+                    "image_urls": hit["image_urls"],
+                    "caption": hit.get("caption"),
+                    "captions": hit.get("captions", []),
+                    "score": score,
+                    "metadata": {
+                        "image_id": image_id,
+                        "image_similarity": image_scores.get(image_id),
+                        "caption_similarity": caption_scores.get(image_id),
+                        "caption_ids": hit["metadata"].get("caption_ids", []),
+                    },
+                }
+            )
+        return rank(results)[:top_k]
+
+    async def search_async(
+        self,
+        query: str,
+        top_k: int = 10,
+        additional_params: AdditionalWeaviateParams = None,
+    ) -> List[Document]:
+        """Run `search` on the inference executor instead of the event loop."""
+        return await self.executor.run(self.search, query, top_k, additional_params)
+
+    async def image_search_async(
+        self,
+        query: Image.Image,
+        top_k: int = 10,
+        min_similarity: float | None = None,
+    ) -> List[Document]:
+        """Run `image_search` on the inference executor instead of the event loop."""
+        return await self.executor.run(self.image_search, query, top_k, min_similarity)
+
+    def image_search(
+        self,
+        query: Image.Image,
+        top_k: int = 10,
+        min_similarity: float | None = None,
+    ) -> List[Document]:
+        return self.image_search_by_vector(
+            self.embed_image_query(query), top_k, min_similarity
+        )
+
+    def embed_image_query(self, query: Image.Image) -> List[float]:
+        with metrics.stage("embed"):
+            vector = self.embedder.embed_image(query).float().cpu().numpy()
+        return self._project(vector)[0]
+
+    def embed_image_queries(self, queries: List[Image.Image]) -> List[List[float]]:
+        if not queries:
+            return []
+        with metrics.stage("embed"):
+            vectors = self.embedder.embed_images(queries).float().cpu().numpy()
+        return self._project(vectors)
+
 
 class WeaviateSearch(Search):
-    def __init__(self, client: WeaviateClient, embedder: Embedder):
-        self.client = client
-        self.embedder = embedder
+    def __init__(
+        self,
+        clients: WeaviateClientPool,
+        embedder: "Embedder",
+        executor: InferenceExecutor | None = None,
+        embedding_cache: EmbeddingCache | None = None,
+        embedding_store: EmbeddingStore | None = None,
+        projection: Projection | None = None,
+    ):
+        super().__init__(
+            embedder, executor, embedding_cache, embedding_store, projection
+        )
+        self.clients = clients
         self.logger = get_logger("weaviate_search")
 
+    def _caption_group_by(self, top_k: int, captions_per_image: int) -> Any:
+        if not get_config().get("search.group.native", False):
+            return None
+        return wvc.query.GroupBy(
+            prop="forImage",
+            objects_per_group=captions_per_image,
+            number_of_groups=top_k,
+        )
+
     def create_collections_if_not_exists(self, force_recreate: bool = False):
         """Create collections if they don't exist or force recreate them.
 
@@ -84,142 +680,283 @@ class WeaviateSearch(Search):
         if force_recreate:
             self.delete_collections()
 
-        if not self.client.collections.exists("Image"):
-            self.client.collections.create_from_dict(ImageCollection)
-        if not self.client.collections.exists("Caption"):
-            self.client.collections.create_from_dict(CaptionCollection)
+        with self.clients.acquire() as client:
+            for collection in (ImageCollection, CaptionCollection):
+                if not client.collections.exists(collection["class"]):
+                    schema = collection_schema(collection)
+                    schema["description"] += f" Vectors: {self.vector_space}."
+                    client.collections.create_from_dict(schema)
+        self.check_vector_space()
+
+    def stored_vector_space(self) -> str | None:
+        with self.clients.acquire() as client:
+            config = client.collections.get("Image").config.get()
+        match = VECTOR_SPACE_DESCRIPTION.search(config.description or "")
+        return match.group(1) if match else None
 
     def delete_collections(self):
         """Delete Image and Caption collections if they exist."""
-        if self.client.collections.exists("Image"):
-            self.client.collections.delete("Image")
-        if self.client.collections.exists("Caption"):
-            self.client.collections.delete("Caption")
+        with self.clients.acquire() as client:
+            if client.collections.exists("Image"):
+                client.collections.delete("Image")
+            if client.collections.exists("Caption"):
+                client.collections.delete("Caption")
 
-    def generate_embeddings(self, document: IndexableDoc):
-        self.logger.debug(f"generating embeddings for document: {document}")
-        image_embedding = self.embedder.embed_image(document.image)
-        text_embeddings = [
-            self.embedder.embed_text(caption) for caption in document.captions
-        ]
-        return image_embedding, text_embeddings
+    def iter_tags(self) -> Iterator[str]:
+        """Yield every tag stored on the Image collection."""
+        with self.clients.acquire() as client:
+            image_collection = client.collections.get("Image")
+            for obj in image_collection.iterator(return_properties=["tags"]):
+                tags = obj.properties.get("tags") or []
+                if isinstance(tags, str):
+                    tags = [tags]
+                yield from tags
 
-    def index(self, document: IndexableDoc):
-        self.logger.debug(f"indexing document: {document}")
-        image_embedding, text_embeddings = self.generate_embeddings(document)
-        image_collection = self.client.collections.get("Image")
-        img_uuid = image_collection.data.insert(
-            properties={
-                "imageUrl": document.image_url,
-                "tags": document.tags,
-            },
-            vector=image_embedding,
+    def write_many(
+        self,
+        documents: List[IndexableDoc],
+        image_embeddings: List[List[float]],
+        text_embeddings: List[List[List[float]]],
+        batch_size: int | None = None,
+        concurrent_requests: int | None = None,
+    ) -> List[Dict[str, str]]:
+        """Bulk import already embedded documents through the client-side batcher.
+
+        Objects get deterministic UUIDs derived from the document id, so
+        captions reference their image inline and re-importing a document
+        overwrites it instead of duplicating it.
+
+        Returns:
+            One entry per object or reference that failed to import.
+        """
+        if not documents:
+            return []
+        config = get_config()
+        batch_size = batch_size or int(config.get("weaviate.batch.size", 200))
+        concurrent_requests = concurrent_requests or int(
+            config.get("weaviate.batch.concurrent_requests", 2)
         )
-        caption_collection = self.client.collections.get("Caption")
-        caption_uuids: List[UUID] = []
-        for i, caption in enumerate(document.captions):
-            caption_uuid = caption_collection.data.insert(
-                properties={
-                    "captionText": caption,
-                },
-                vector=text_embeddings[i],
-            )
-            caption_uuids.append(caption_uuid)
-        caption_collection.data.reference_add_many(
-            [
-                DataReference(
-                    from_property="forImage",
-                    from_uuid=caption_uuid,
-                    to_uuid=img_uuid,
+
+        with self.clients.acquire() as client:
+            with client.batch.fixed_size(
+                batch_size=batch_size, concurrent_requests=concurrent_requests
+            ) as batch:
+                for document, image_embedding, caption_embeddings in zip(
+                    documents, image_embeddings, text_embeddings
+                ):
+                    img_uuid = image_uuid(document.id)
+                    batch.add_object(
+                        collection="Image",
+                        properties={
+                            "imageUrl": document.image_url,
+                            "tags": document.tags,
+                        },
+                        vector=image_embedding,
+                        uuid=img_uuid,
+                    )
+                    for i, caption in enumerate(document.captions):
+                        batch.add_object(
+                            collection="Caption",
+                            properties={
+                                "captionText": caption,
+                                "tags": document.tags,
+                            },
+                            vector=caption_embeddings[i],
+                            uuid=caption_uuid(document.id, i),
+                            references={"forImage": img_uuid},
+                        )
+            failed_objects = client.batch.failed_objects
+            failed_references = client.batch.failed_references
+            # an image re-imported with fewer captions would keep matching
+            # queries through the captions it no longer has
+            client.collections.get("Caption").data.delete_many(
+                where=Filter.by_ref("forImage")
+                .by_id()
+                .contains_any([image_uuid(document.id) for document in documents])
+                & Filter.by_id().contains_none(
+                    [
+                        caption_uuid(document.id, i)
+                        for document in documents
+                        for i in range(len(document.captions))
+                    ]
                 )
-                for caption_uuid in caption_uuids
-            ]
+            )
+
+        errors: List[Dict[str, str]] = []
+        for failed in failed_objects:
+            errors.append(
+                {
+                    "collection": failed.object_.collection,
+                    "uuid": str(failed.object_.uuid),
+                    "message": failed.message,
+                }
+            )
+        for failed in failed_references:
+            errors.append(
+                {
+                    "collection": failed.reference.from_object_collection,
+                    "uuid": str(failed.reference.from_object_uuid),
+                    "message": failed.message,
+                }
+            )
+        for error in errors:
+            self.logger.error(
+                "failed to import %s %s: %s",
+                error["collection"],
+                error["uuid"],
+                error["message"],
+            )
+        self.logger.info(
+            "imported %d documents with %d errors", len(documents), len(errors)
         )
+        return errors
 
-    def search(
+    def _query_captions(
         self,
         query: str,
-        top_k: int = 10,
-        additional_params: AdditionalWeaviateParams = None,
+        limit: int,
+        additional_params: AdditionalWeaviateParams,
+        group_by: wvc.query.GroupBy | None = None,
+        query_vector: List[float] | None = None,
     ) -> List[Document]:
         filters = None
         if additional_params.tags:
             filters = Filter.by_property("tags").contains_any(additional_params.tags)
 
-        try:
-            query_embedding = self.embedder.embed_text(query)
-            caption_collection = self.client.collections.get("Caption")
-            resp = caption_collection.query.near_vector(
-                near_vector=query_embedding.tolist()[0],
-                limit=top_k,
-                return_properties=["captionText"],
-                return_metadata=wvc.query.MetadataQuery(distance=True),
-                return_references=[
-                    wvc.query.QueryReference(
-                        link_on="forImage",
-                        return_properties=["imageUrl"],
-                    )
-                ],
-                filters=filters,
+        mode = additional_params.mode
+        # keyword scores are unbounded bm25 scores, so the cutoff only
+        # applies where there is a vector distance to push it down to
+        distance = max_distance(additional_params.min_similarity)
+        return_references = [
+            wvc.query.QueryReference(
+                link_on="forImage",
+                return_properties=["imageUrl"],
             )
+        ]
+        # keyword search never touches CLIP, so embed only when needed
+        query_embedding = query_vector
+        if query_embedding is None and mode != "keyword":
+            query_embedding = self.embed_query(query)
+        with metrics.stage("vector_query"), self.clients.acquire() as client:
+            caption_collection = client.collections.get("Caption")
+            if mode == "keyword":
+                resp = caption_collection.query.bm25(
+                    query=query,
+                    query_properties=KEYWORD_PROPERTIES,
+                    limit=limit,
+                    return_properties=["captionText"],
+                    return_metadata=wvc.query.MetadataQuery(score=True),
+                    return_references=return_references,
+                    filters=filters,
+                    group_by=group_by,
+                )
+            elif mode == "hybrid":
+                resp = caption_collection.query.hybrid(
+                    query=query,
+                    vector=query_embedding,
+                    alpha=additional_params.alpha,
+                    query_properties=KEYWORD_PROPERTIES,
+                    max_vector_distance=distance,
+                    limit=limit,
+                    return_properties=["captionText"],
+                    return_metadata=wvc.query.MetadataQuery(score=True),
+                    return_references=return_references,
+                    filters=filters,
+                    group_by=group_by,
+                )
+            else:
+                resp = caption_collection.query.near_vector(
+                    near_vector=query_embedding,
+                    distance=distance,
+                    limit=limit,
+                    return_properties=["captionText"],
+                    return_metadata=wvc.query.MetadataQuery(distance=True),
+                    return_references=return_references,
+                    filters=filters,
+                    group_by=group_by,
+                )
 
-            results: List[Document] = []
-            for obj in resp.objects:
-                caption_text = obj.properties.get("captionText", "")
-                caption_id = obj.uuid
-                distance_score = obj.metadata.distance if obj.metadata else None
-                linked_img_ref = obj.references.get("forImage")
-                image_url = ""
-                image_id = ""
-                if linked_img_ref and linked_img_ref.objects:
-                    image_url = linked_img_ref.objects[0].properties.get("imageUrl", "")
-                    image_id = linked_img_ref.objects[0].uuid
+        start = time.perf_counter()
+        results: List[Document] = []
+        for obj in resp.objects:
+            caption_text = obj.properties.get("captionText", "")
+            caption_id = obj.uuid
+            if mode == "vector":
+                score = distance_to_similarity(
+                    obj.metadata.distance if obj.metadata else None
+                )
+            else:
+                score = obj.metadata.score if obj.metadata else None
+            linked_img_ref = obj.references.get("forImage") if obj.references else None
+            image_url = ""
+            image_id = ""
+            if linked_img_ref and linked_img_ref.objects:
+                image_url = linked_img_ref.objects[0].properties.get("imageUrl", "")
+                image_id = linked_img_ref.objects[0].uuid
 
-                result_item = {
-                    "image_url": image_url,
-                    "caption": caption_text,
-                    "score": distance_score,
-                    "metadata": {
-                        "caption_id": str(caption_id),
-                        "image_id": str(image_id),
-                    },
-                }
-                results.append(result_item)
-            return sorted(results, key=lambda x: x["score"], reverse=True)
-        except Exception as e:
-            self.logger.error(f"Error searching: {e}")
-            raise e
+            result_item = {
+                "image_url": image_url,
+                "image_urls": derivative_urls(image_url),
+                "caption": caption_text,
+                "score": score,
+                "metadata": {
+                    "caption_id": str(caption_id),
+                    "image_id": str(image_id),
+                },
+            }
+            results.append(result_item)
+        metrics.record_stage("result_mapping", time.perf_counter() - start)
+        return results
 
-    def image_search(
+    def image_vectors(self, image_ids: List[str]) -> Dict[str, List[float]]:
+        if not image_ids:
+            return {}
+        with metrics.stage("vector_fetch"), self.clients.acquire() as client:
+            resp = client.collections.get("Image").query.fetch_objects(
+                filters=Filter.by_id().contains_any(image_ids),
+                limit=len(image_ids),
+                include_vector=True,
+                return_properties=[],
+            )
+        return {str(obj.uuid): obj.vector["default"] for obj in resp.objects}
+
+    def image_search_by_vector(
         self,
-        query: Image.Image,
+        query_vector: List[float],
         top_k: int = 10,
+        min_similarity: float | None = None,
     ) -> List[Document]:
         try:
-            image_embedding = self.embedder.embed_image(query)
-            image_collection = self.client.collections.get("Image")
-            resp = image_collection.query.near_vector(
-                near_vector=image_embedding.tolist()[0],
-                limit=top_k,
-                return_properties=["imageUrl"],
-                return_metadata=wvc.query.MetadataQuery(distance=True),
-            )
+            with metrics.stage("vector_query"), self.clients.acquire() as client:
+                image_collection = client.collections.get("Image")
+                resp = image_collection.query.near_vector(
+                    near_vector=query_vector,
+                    distance=max_distance(min_similarity),
+                    limit=top_k,
+                    return_properties=["imageUrl"],
+                    return_metadata=wvc.query.MetadataQuery(distance=True),
+                )
 
             if not resp.objects:
                 return []
 
+            start = time.perf_counter()
             results: List[Document] = []
             for obj in resp.objects:
                 image_url = obj.properties.get("imageUrl", "")
                 image_id = obj.uuid
-                distance_score = obj.metadata.distance if obj.metadata else None
+                similarity = distance_to_similarity(
+                    obj.metadata.distance if obj.metadata else None
+                )
                 result_item = {
                     "image_url": image_url,
-                    "score": distance_score,
+                    "image_urls": derivative_urls(image_url),
+                    "score": similarity,
                     "metadata": {"image_id": str(image_id)},
                 }
                 results.append(result_item)
-            return sorted(results, key=lambda x: x["score"], reverse=True)
+            metrics.record_stage("result_mapping", time.perf_counter() - start)
+            return rank(results)
         except Exception as e:
             self.logger.error(f"Error searching image: {e}")
             raise e
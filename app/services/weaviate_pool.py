@@ -0,0 +1,153 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import weaviate
+from weaviate import WeaviateClient
+from weaviate.classes.init import AdditionalConfig, Timeout
+
+from app.config import get_config
+from app.core.logger import get_logger
+
+
+def connect_to_weaviate(default_host: str = "localhost") -> WeaviateClient:
+    config = get_config()
+    return weaviate.connect_to_local(
+        host=config.get("weaviate.host", default_host),
+        port=config.get("weaviate.port", 8080),
+        grpc_port=config.get("weaviate.grpc_port", 50051),
+        additional_config=AdditionalConfig(
+            timeout=Timeout(
+                init=config.get("weaviate.timeout.init", 2),
+                query=config.get("weaviate.timeout.query", 30),
+                insert=config.get("weaviate.timeout.insert", 90),
+            )
+        ),
+    )
+
+
+class WeaviateClientPool:
+    """A fixed set of sync Weaviate clients shared by worker threads.
+
+    Each worker checks a client out for the duration of one call, so
+    queries from different threads never share a connection. Clients are
+    health checked at most every `health_check_interval` seconds, and right
+    away after a call that raised, and replaced when they stop responding.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], WeaviateClient],
+        size: int = 4,
+        health_check_interval: float = 30.0,
+    ):
+        self._connect = connect
+        self._size = max(1, size)
+        self._health_check_interval = health_check_interval
+        self._idle: queue.Queue[Optional[WeaviateClient]] = queue.Queue()
+        self._checked_at: Dict[int, float] = {}
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._logger = get_logger("weaviate_pool")
+        for _ in range(self._size):
+            client = self._connect()
+            self._checked_at[id(client)] = time.monotonic()
+            self._idle.put(client)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    def _reconnect(self, client: Optional[WeaviateClient]) -> WeaviateClient:
+        if client is not None:
+            self._checked_at.pop(id(client), None)
+            try:
+                client.close()
+            except Exception as e:
+                self._logger.warning("error closing weaviate client: %s", e)
+        client = self._connect()
+        self._checked_at[id(client)] = time.monotonic()
+        self._logger.info("reconnected weaviate client")
+        return client
+
+    def _ensure_healthy(self, client: Optional[WeaviateClient]) -> WeaviateClient:
+        if client is None:
+            return self._reconnect(None)
+        checked_at = self._checked_at.get(id(client), 0.0)
+        if time.monotonic() - checked_at < self._health_check_interval:
+            return client
+        try:
+            ready = client.is_ready()
+        except Exception:
+            ready = False
+        if not ready:
+            self._logger.warning("weaviate client failed health check")
+            return self._reconnect(client)
+        self._checked_at[id(client)] = time.monotonic()
+        return client
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> Iterator[WeaviateClient]:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("weaviate client pool is closed")
+            self._in_use += 1
+        client: Optional[WeaviateClient] = None
+        try:
+            try:
+                idle = self._idle.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError("timed out waiting for a weaviate client")
+            try:
+                client = self._ensure_healthy(idle)
+            except Exception:
+                # keep the slot; the next caller retries the connection
+                self._idle.put(None)
+                raise
+            try:
+                yield client
+            except Exception:
+                # force a health check before this client is used again
+                self._checked_at[id(client)] = 0.0
+                raise
+        finally:
+            if client is not None:
+                self._idle.put(client)
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify_all()
+
+    def is_ready(self) -> bool:
+        try:
+            with self.acquire(timeout=1) as client:
+                return client.is_ready()
+        except Exception:
+            return False
+
+    def close(self, drain_timeout: float = 10.0):
+        """Stop handing out clients, wait for in-flight calls, then disconnect."""
+        with self._cond:
+            self._closed = True
+            drained = self._cond.wait_for(lambda: self._in_use == 0, drain_timeout)
+        if not drained:
+            self._logger.warning(
+                "closing weaviate pool with %d calls still in flight", self._in_use
+            )
+        clients: List[WeaviateClient] = []
+        while True:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if client is not None:
+                clients.append(client)
+        for client in clients:
+            client.close()
+        self._logger.info("closed %d weaviate clients", len(clients))
@@ -9,3 +9,39 @@ def img_to_base64(image: Image.Image, format="JPEG") -> str:
     image.save(buffered, format=format)
     img_str = base64.b64encode(buffered.getvalue()).decode()
     return img_str
+
+
+class ImageDecodeError(ValueError):
+    """The data is not an image, or is larger than the decode limits allow."""
+
+
+def decode_image(
+    data: bytes,
+    max_bytes: int | None = None,
+    max_pixels: int | None = None,
+    draft_size: int | None = None,
+) -> Image.Image:
+    """Decode image bytes to RGB, checking limits before touching any pixels.
+
+    With `draft_size`, JPEGs are decoded at 1/2, 1/4 or 1/8 scale while
+    keeping both sides at least `draft_size` pixels, which is much cheaper
+    than decoding at full size and resizing afterwards.
+    """
+    if max_bytes is not None and len(data) > max_bytes:
+        raise ImageDecodeError(f"image is {len(data)} bytes, the limit is {max_bytes}")
+    try:
+        image = Image.open(io.BytesIO(data))
+        width, height = image.size
+        if max_pixels is not None and width * height > max_pixels:
+            raise ImageDecodeError(
+                f"image is {width}x{height} pixels, the limit is {max_pixels}"
+            )
+        if draft_size is not None:
+            image.draft("RGB", (draft_size, draft_size))
+        image.load()
+        return image if image.mode == "RGB" else image.convert("RGB")
+    except ImageDecodeError:
+        raise
+    except Exception as e:
+        # PIL raises anything from OSError to SyntaxError on corrupt input
+        raise ImageDecodeError(f"invalid image: {e}") from e
@@ -28,7 +28,7 @@ function App() {
         headers: {
           "Content-Type": "application/json",
         },
-        body: JSON.stringify({ query, top_k: 10 }),
+        body: JSON.stringify({ query, top_k: 10, group_by_image: true }),
       });
 
       if (!response.ok) {
@@ -214,7 +214,17 @@ function App() {
                   <div key={index} className="border-b pb-2">
                     {result.image_url && (
                       <img
-                        src={`${API_BASE_URL}/${result.image_url}`}
+                        src={`${API_BASE_URL}/${
+                          result.image_urls?.thumbnail || result.image_url
+                        }`}
+                        onError={(e) => {
+                          // images indexed before derivatives existed
+                          const img = e.currentTarget;
+                          if (!img.dataset.fallback) {
+                            img.dataset.fallback = "true";
+                            img.src = `${API_BASE_URL}/${result.image_url}`;
+                          }
+                        }}
                         alt={result.caption || `Result ${index}`}
                         className="h-32 object-contain mb-2"
                       />
@@ -0,0 +1,193 @@
+"""Compare Weaviate vector index settings on the indexed caption vectors.
+
+Each setting under `vector_index.benchmark` in the config is built as a
+scratch collection from the first --count caption vectors, and --queries
+further caption vectors are searched against it. Recall@k is measured
+against exact cosine top-k computed in NumPy, which is what an
+uncompressed flat index returns. Index at least --count + --queries
+captions first, e.g. `make run-indexer count=5000`.
+"""
+
+import argparse
+import re
+import statistics
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from weaviate import WeaviateClient
+from weaviate.util import generate_uuid5
+
+from app.config import get_config
+from app.data.collection import collection_schema
+from app.services.weaviate_pool import connect_to_weaviate
+
+
+def load_vectors(client: WeaviateClient, count: int) -> np.ndarray:
+    vectors: List[List[float]] = []
+    captions = client.collections.get("Caption")
+    for obj in captions.iterator(include_vector=True, return_properties=[]):
+        vectors.append(obj.vector["default"])
+        if len(vectors) == count:
+            break
+    if len(vectors) < count:
+        raise SystemExit(f"need {count} indexed captions, found {len(vectors)}")
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def exact_top_k(base: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    base = base / np.linalg.norm(base, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ base.T
+    return [set(np.argpartition(-row, k - 1)[:k].tolist()) for row in scores]
+
+
+def estimated_bytes_per_vector(settings: Dict[str, Any], dim: int) -> int:
+    """Rough in-memory size of one vector plus its share of the graph."""
+    compression = settings.get("compression", "none")
+    if compression == "pq":
+        # one byte per segment with 256 centroids; auto segments ~ dim / 4
+        vector = int(settings.get("pq", {}).get("segments", 0)) or dim // 4
+    elif compression == "sq":
+        vector = dim
+    elif compression == "bq":
+        vector = dim // 8
+    else:
+        vector = 4 * dim
+    graph = 0
+    if settings.get("type", "hnsw") != "flat":
+        # layer 0 keeps up to 2 * maxConnections 8-byte neighbour ids
+        graph = 2 * int(settings.get("max_connections", 32)) * 8
+    return vector + graph
+
+
+def bench(
+    client: WeaviateClient,
+    name: str,
+    settings: Dict[str, Any],
+    base: np.ndarray,
+    queries: np.ndarray,
+    truth: List[set],
+    k: int,
+    keep: bool,
+) -> Dict[str, float]:
+    collection_name = "Bench" + re.sub(r"\W", "", name.title())
+    if client.collections.exists(collection_name):
+        client.collections.delete(collection_name)
+    client.collections.create_from_dict(
+        collection_schema(
+            {"class": collection_name, "vectorizer": "none", "properties": []},
+            settings,
+        )
+    )
+    collection = client.collections.get(collection_name)
+    uuids = [generate_uuid5(i, collection_name) for i in range(len(base))]
+    rows = {uuid: i for i, uuid in enumerate(uuids)}
+    try:
+        start = time.perf_counter()
+        with client.batch.fixed_size(batch_size=500) as batch:
+            for uuid, vector in zip(uuids, base):
+                batch.add_object(
+                    collection=collection_name,
+                    properties={},
+                    vector=vector.tolist(),
+                    uuid=uuid,
+                )
+        build_time = time.perf_counter() - start
+        if client.batch.failed_objects:
+            raise RuntimeError(client.batch.failed_objects[0].message)
+
+        # warm up, so connection setup doesn't count against the first query
+        collection.query.near_vector(queries[0].tolist(), limit=k, return_properties=[])
+        latencies: List[float] = []
+        hits = 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            resp = collection.query.near_vector(
+                query.tolist(), limit=k, return_properties=[]
+            )
+            latencies.append(time.perf_counter() - start)
+            hits += len({rows[str(obj.uuid)] for obj in resp.objects} & expected)
+    finally:
+        if not keep:
+            client.collections.delete(collection_name)
+
+    return {
+        "memory": estimated_bytes_per_vector(settings, base.shape[1])
+        * len(base)
+        / 2**20,
+        "build": build_time,
+        "qps": len(latencies) / sum(latencies),
+        "p50": statistics.median(latencies) * 1000,
+        "recall": hits / (k * len(queries)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument(
+        "--only", nargs="*", help="Benchmark only these settings by name"
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the scratch collections"
+    )
+    args = parser.parse_args()
+
+    config = get_config()
+    default = dict(config.get("vector_index.default", {}) or {})
+    presets: Dict[str, Dict[str, Any]] = config.get(
+        "vector_index.benchmark", {"hnsw": {}}
+    )
+    if args.only:
+        presets = {name: presets[name] for name in args.only}
+
+    client = connect_to_weaviate()
+    try:
+        vectors = load_vectors(client, args.count + args.queries)
+        base, queries = vectors[: args.count], vectors[args.count :]
+        truth = exact_top_k(base, queries, args.top_k)
+        print(
+            f"{args.count} vectors, {args.queries} queries, recall@{args.top_k} "
+            "vs exact search; memory is an estimate of vectors plus graph"
+        )
+        print(
+            f"{'setting':<12} {'memory MiB':>10} {'build s':>8} {'qps':>8} "
+            f"{'p50 ms':>7} {'recall':>7}"
+        )
+        for name, overrides in presets.items():
+            settings = {**default, **(overrides or {})}
+            # compression only starts once training_limit objects exist, so
+            # train on what the benchmark has
+            for key in ("pq", "sq"):
+                limit = int(settings.get(key, {}).get("training_limit", 100000))
+                settings[key] = {
+                    **settings.get(key, {}),
+                    "training_limit": min(limit, args.count),
+                }
+            try:
+                stats = bench(
+                    client,
+                    name,
+                    settings,
+                    base,
+                    queries,
+                    truth,
+                    args.top_k,
+                    args.keep,
+                )
+            except Exception as e:
+                print(f"{name:<12} failed: {e}")
+                continue
+            print(
+                f"{name:<12} {stats['memory']:>10.1f} {stats['build']:>8.1f} "
+                f"{stats['qps']:>8.0f} {stats['p50']:>7.2f} {stats['recall']:>7.3f}"
+            )
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Compare recall@k and index size of projection dimensions.
+
+Vectors are sampled from the embedding store: --queries of them are held
+out as queries and the rest form the base. For each dimension a PCA
+projection is fitted on the base, and top-k search over the projected
+vectors (float32 and float16) is scored against exact top-k at the full
+model dimension. Index some images first, e.g. `make run-indexer
+count=5000`, then run `make eval-projection`.
+"""
+
+import argparse
+from typing import List
+
+import numpy as np
+
+from app.config import get_config
+from app.services.embedding_store import EmbeddingStore
+from app.services.numpy_search import dot, normalize
+from app.services.projection import Projection
+
+
+def top_k(base: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    return [
+        set(np.argpartition(-dot(base, query), k - 1)[:k].tolist()) for query in queries
+    ]
+
+
+def main():
+    config = get_config()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--dims", type=int, nargs="*", default=[32, 64, 128, 256])
+    parser.add_argument("--model", default=config.get("embedder.model", "ViT-B/32"))
+    args = parser.parse_args()
+
+    store = EmbeddingStore(
+        config.get("embedding_store.path", ".cache/embeddings"),
+        args.model,
+        dtype=config.get("embedding_store.dtype", "float16"),
+    )
+    vectors = normalize(store.sample(args.samples + args.queries))
+    if len(vectors) <= args.queries + max(args.dims):
+        raise SystemExit(f"only {len(vectors)} stored vectors; index more images")
+    queries, base = vectors[: args.queries], vectors[args.queries :]
+    truth = top_k(base, queries, args.top_k)
+
+    print(
+        f"{len(base)} vectors, {len(queries)} queries, recall@{args.top_k} "
+        f"vs exact search at {base.shape[1]} dimensions"
+    )
+    print(f"{'dim':>5} {'dtype':>8} {'bytes/vector':>12} {'recall':>7}")
+    for dim in sorted(args.dims) + [base.shape[1]]:
+        if dim < base.shape[1]:
+            projection = Projection.fit(args.model, base, dim)
+            projected_base = projection.apply(base)
+            projected_queries = projection.apply(queries)
+        else:
+            projected_base, projected_queries = base, queries
+        for dtype in (np.float32, np.float16):
+            found = top_k(projected_base.astype(dtype), projected_queries, args.top_k)
+            hits = sum(len(a & b) for a, b in zip(found, truth))
+            print(
+                f"{dim:>5} {np.dtype(dtype).name:>8} "
+                f"{dim * np.dtype(dtype).itemsize:>12} "
+                f"{hits / (args.top_k * len(queries)):>7.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
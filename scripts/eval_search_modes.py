@@ -0,0 +1,99 @@
+"""Compare latency and recall@k of the text search modes.
+
+Each of the first --count images of the dataset is queried with its last
+caption, which the indexer held out; a query counts as a hit when any of the
+top k results belongs to that image. Index at least as many images with
+`indexer.held_out_captions` set first, e.g. `env indexer.held_out_captions=1 make
+run-indexer count=500`, then run `make eval-search count=500`.
+"""
+
+import argparse
+import statistics
+import time
+from typing import Dict, List, Tuple
+
+from app.config import get_config
+from app.data.images import get_data_source
+from app.models.search import AdditionalWeaviateParams
+from app.services.embedder import Embedder
+from app.services.search import WeaviateSearch, image_uuid
+from app.services.weaviate_pool import WeaviateClientPool, connect_to_weaviate
+
+MODES = ["vector", "keyword", "hybrid"]
+# label, mode and whether vector candidates are re-ranked by image vectors
+RUNS = [(mode, mode, False) for mode in MODES] + [("rerank", "vector", True)]
+
+
+def load_queries(count: int, held_out: int) -> List[Tuple[str, str]]:
+    queries: List[Tuple[str, str]] = []
+    for row in get_data_source().rows(limit=count):
+        captions = row["caption"]
+        # images with too few captions had all of them indexed
+        if len(captions) > held_out:
+            queries.append((captions[-1], str(image_uuid(row["img_id"]))))
+    return queries
+
+
+def evaluate(
+    search: WeaviateSearch,
+    queries: List[Tuple[str, str]],
+    mode: str,
+    alpha: float,
+    top_k: int,
+    rerank: bool = False,
+) -> Dict[str, float]:
+    params = AdditionalWeaviateParams(mode=mode, alpha=alpha, rerank=rerank)
+    # warm up connections and the model so the first query isn't an outlier
+    search.search(queries[0][0], top_k, additional_params=params)
+
+    latencies: List[float] = []
+    hits = 0
+    for query, expected_image_id in queries:
+        start = time.perf_counter()
+        results = search.search(query, top_k, additional_params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if any(r["metadata"]["image_id"] == expected_image_id for r in results):
+            hits += 1
+
+    latencies.sort()
+    return {
+        "recall": hits / len(queries),
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "mean": statistics.fmean(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--alpha", type=float, default=0.5)
+    args = parser.parse_args()
+    held_out = int(get_config().get("indexer.held_out_captions", 0))
+    if held_out < 1:
+        # querying with indexed captions finds them verbatim and overstates
+        # recall
+        parser.error("index with indexer.held_out_captions >= 1 first")
+
+    queries = load_queries(args.count, held_out)
+    if not queries:
+        parser.error("no images with held-out captions; raise --count")
+    clients = WeaviateClientPool(connect_to_weaviate, size=1)
+    # no embedding cache, so every vector query pays for CLIP like a cold one
+    search = WeaviateSearch(clients, Embedder())
+    try:
+        print(f"{len(queries)} queries, recall@{args.top_k}, latency in ms")
+        print(f"{'mode':<8} {'recall':>7} {'p50':>8} {'p95':>8} {'mean':>8}")
+        for label, mode, rerank in RUNS:
+            stats = evaluate(search, queries, mode, args.alpha, args.top_k, rerank)
+            print(
+                f"{label:<8} {stats['recall']:>7.3f} {stats['p50']:>8.1f} "
+                f"{stats['p95']:>8.1f} {stats['mean']:>8.1f}"
+            )
+    finally:
+        clients.close()
+
+
+if __name__ == "__main__":
+    main()
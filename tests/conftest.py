@@ -0,0 +1,56 @@
+import hashlib
+import os
+from typing import List
+
+# tag with the bundled fake LLM instead of calling Gemini
+os.environ.setdefault("llm.provider", "fake")
+
+import numpy as np
+import pytest
+from PIL import Image
+
+
+class FakeTensor(np.ndarray):
+    """An array with the bits of the torch.Tensor API the search code uses."""
+
+    def float(self) -> "FakeTensor":
+        return self
+
+    def cpu(self) -> "FakeTensor":
+        return self
+
+    def numpy(self) -> np.ndarray:
+        return np.asarray(self)
+
+
+class FakeEmbedder:
+    """Deterministic stand-in for the CLIP embedder, so tests need no torch."""
+
+    model_name = "fake"
+
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+
+    def _vector(self, data: bytes) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha1(data).digest()[:4], "big")
+        return np.random.default_rng(seed).standard_normal(self.dim)
+
+    def _tensor(self, vectors: List[np.ndarray]) -> FakeTensor:
+        return np.stack(vectors).astype(np.float32).view(FakeTensor)
+
+    def embed_texts(self, texts: List[str]) -> FakeTensor:
+        return self._tensor([self._vector(text.encode()) for text in texts])
+
+    def embed_text(self, text: str) -> FakeTensor:
+        return self.embed_texts([text])
+
+    def embed_images(self, images: List[Image.Image]) -> FakeTensor:
+        return self._tensor([self._vector(image.tobytes()) for image in images])
+
+    def embed_image(self, image: Image.Image) -> FakeTensor:
+        return self.embed_images([image])
+
+
+@pytest.fixture
+def embedder() -> FakeEmbedder:
+    return FakeEmbedder()
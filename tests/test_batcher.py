@@ -0,0 +1,39 @@
+import pytest
+
+from app.services.batcher import MicroBatcher
+
+
+def test_concurrent_calls_share_a_batch():
+    batches = []
+
+    def double(items):
+        batches.append(list(items))
+        return [2 * item for item in items]
+
+    # the window outlasts the test, so only a full batch triggers the flush
+    batcher = MicroBatcher(double, max_batch_size=4, max_wait_ms=5000)
+    futures = [batcher.submit_async(i) for i in range(4)]
+
+    assert [future.result(timeout=5) for future in futures] == [0, 2, 4, 6]
+    assert batches == [[0, 1, 2, 3]]
+    batcher.close()
+
+
+def test_short_result_fails_every_caller():
+    batcher = MicroBatcher(lambda items: items[:1], max_batch_size=3, max_wait_ms=5000)
+    futures = [batcher.submit_async(i) for i in range(3)]
+
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    batcher.close()
+
+
+def test_error_reaches_every_caller():
+    def fail(items):
+        raise ValueError("model crashed")
+
+    batcher = MicroBatcher(fail, max_wait_ms=50)
+    with pytest.raises(ValueError):
+        batcher.submit("item")
+    batcher.close()
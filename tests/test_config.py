@@ -0,0 +1,21 @@
+import yaml
+
+from app.config import AppConfig
+
+
+def test_reads_the_repo_config_by_default(monkeypatch):
+    monkeypatch.delenv("APP_CONFIG_PATH", raising=False)
+    with open("configs/config.yml") as f:
+        expected = yaml.safe_load(f)
+
+    config = AppConfig()
+
+    assert config.config == expected
+    assert config.get("search.numpy.ann.n_probe") == 16
+    assert config.get("vector_index.benchmark.flat-bq.type") == "flat"
+    assert config.get("missing.key", "default") == "default"
+
+
+def test_environment_overrides_the_file(monkeypatch):
+    monkeypatch.setenv("search.backend", "numpy")
+    assert AppConfig().get("search.backend") == "numpy"
@@ -0,0 +1,52 @@
+import numpy as np
+
+from app.models.search import AdditionalWeaviateParams
+from app.services.numpy_search import NumpySearch
+from app.services.search import IndexableDoc, image_uuid
+
+
+def unit(angle: float) -> list:
+    vector = np.zeros(32)
+    vector[0], vector[1] = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    return vector.tolist()
+
+
+def test_each_collection_has_its_own_threshold(tmp_path, embedder):
+    search = NumpySearch(str(tmp_path), embedder)
+    docs = [
+        IndexableDoc(str(i), None, [f"c{i}"], f"static/{i}.jpg", []) for i in (1, 2)
+    ]
+    # image matches are weak (cos 75 degrees), caption matches strong
+    search.write_many(docs, [unit(75), unit(80)], [[unit(10)], [unit(40)]])
+
+    def matches(**thresholds):
+        params = AdditionalWeaviateParams(mode="cross_modal", **thresholds)
+        results = search.cross_modal_search(unit(0), 2, params)
+        return [r["metadata"] for r in results]
+
+    # a caption-scale threshold no longer empties the image ranking
+    results = matches(min_similarity=0.9)
+    assert [r["image_id"] for r in results] == [image_uuid("1"), image_uuid("2")]
+    assert results[1]["caption_similarity"] is None
+    assert results[1]["image_similarity"] is not None
+
+    results = matches(min_similarity=0.9, image_min_similarity=0.2)
+    assert [r["image_id"] for r in results] == [image_uuid("1")]
+
+
+def test_tags_filter_the_caption_ranking(tmp_path, embedder):
+    search = NumpySearch(str(tmp_path), embedder)
+    docs = [
+        IndexableDoc("1", None, ["c1"], "static/1.jpg", ["red"]),
+        IndexableDoc("2", None, ["c2"], "static/2.jpg", ["blue"]),
+    ]
+    search.write_many(docs, [unit(75), unit(80)], [[unit(40)], [unit(10)]])
+
+    params = AdditionalWeaviateParams(mode="cross_modal", tags=["red"])
+    results = search.cross_modal_search(unit(0), 2, params)
+    caption_matches = {
+        r["metadata"]["image_id"]: r["metadata"]["caption_similarity"] for r in results
+    }
+
+    assert caption_matches[image_uuid("1")] is not None
+    assert caption_matches.get(image_uuid("2")) is None
@@ -0,0 +1,82 @@
+import glob
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from app.services.embedding_store import EmbeddingStore, image_key
+from app.services.numpy_search import NumpySearch
+from app.services.search import IndexableDoc
+
+
+def vectors(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, 8)).astype(np.float32)
+
+
+def test_flush_and_reopen(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "model", dtype="float32")
+    store.put_many(["a", "b"], vectors(2))
+    store.flush()
+    store.put_many(["c"], vectors(1, seed=1))
+    store.flush()
+
+    reopened = EmbeddingStore(str(tmp_path), "model", dtype="float32")
+    assert len(reopened) == 3
+    np.testing.assert_array_equal(reopened.get_many(["b"])[0], vectors(2)[1])
+    np.testing.assert_array_equal(reopened.get_many(["c"])[0], vectors(1, seed=1)[0])
+    assert reopened.get_many(["missing"]) == [None]
+
+
+def test_flush_after_crash_keeps_complete_segments(tmp_path):
+    directory = tmp_path / "model"
+    directory.mkdir()
+    # a segment a crash left without its keys file, then a complete one
+    np.save(directory / "segment-000000.npy", vectors(3, seed=1))
+    np.save(directory / "segment-000001.npy", vectors(2))
+    (directory / "segment-000001.json").write_text(json.dumps(["a", "b"]))
+
+    store = EmbeddingStore(str(tmp_path), "model", dtype="float32")
+    assert len(store) == 2
+    store.put_many(["c"], vectors(1, seed=2))
+    store.flush()
+
+    reopened = EmbeddingStore(str(tmp_path), "model", dtype="float32")
+    assert len(reopened) == 3
+    np.testing.assert_array_equal(reopened.get_many(["a"])[0], vectors(2)[0])
+    np.testing.assert_array_equal(reopened.get_many(["c"])[0], vectors(1, seed=2)[0])
+
+
+def test_stores_sharing_a_directory_never_overwrite_each_other(tmp_path):
+    first = EmbeddingStore(str(tmp_path), "model", dtype="float32")
+    second = EmbeddingStore(str(tmp_path), "model", dtype="float32")
+    first.put_many(["a"], vectors(1))
+    second.put_many(["b"], vectors(1, seed=1))
+    first.flush()
+    second.flush()
+
+    assert len(glob.glob(os.path.join(tmp_path, "model", "segment-*.json"))) == 2
+    reopened = EmbeddingStore(str(tmp_path), "model", dtype="float32")
+    np.testing.assert_array_equal(reopened.get_many(["a"])[0], vectors(1)[0])
+    np.testing.assert_array_equal(reopened.get_many(["b"])[0], vectors(1, seed=1)[0])
+
+
+def test_images_are_keyed_on_their_source_bytes(tmp_path, embedder):
+    store = EmbeddingStore(str(tmp_path / "store"), "fake", dtype="float32")
+    search = NumpySearch(str(tmp_path / "index"), embedder, embedding_store=store)
+    full = Image.new("RGB", (64, 64), "red")
+    draft = full.resize((8, 8))
+
+    def doc(image, image_bytes=None):
+        return IndexableDoc("1", image, [], "static/1.jpg", [], image_bytes)
+
+    (first,), _ = search.generate_embeddings_many([doc(full, b"jpeg bytes")])
+    # the same file decoded at another draft size reuses the stored vector
+    (again,), _ = search.generate_embeddings_many([doc(draft, b"jpeg bytes")])
+    assert again == first
+    assert store.get_many([image_key(b"jpeg bytes")])[0] is not None
+
+    # without the source bytes the image is embedded but not stored
+    (fresh,), _ = search.generate_embeddings_many([doc(draft)])
+    assert fresh != first
+    assert len(store) == 1
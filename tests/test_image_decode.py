@@ -0,0 +1,35 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app.utils import ImageDecodeError, decode_image
+
+
+def png(size=(64, 48)) -> bytes:
+    buffer = io.BytesIO()
+    Image.effect_noise(size, 64).convert("RGBA").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_decodes_to_rgb():
+    image = decode_image(png())
+    assert image.mode == "RGB"
+    assert image.size == (64, 48)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"not an image", png()[:16], png()[: len(png()) // 2], png()[:8] + b"\0" * 100],
+    ids=["garbage", "truncated header", "truncated data", "corrupt"],
+)
+def test_invalid_data_raises_decode_error(data):
+    with pytest.raises(ImageDecodeError):
+        decode_image(data)
+
+
+def test_limits():
+    with pytest.raises(ImageDecodeError):
+        decode_image(png(), max_bytes=10)
+    with pytest.raises(ImageDecodeError):
+        decode_image(png(), max_pixels=100)
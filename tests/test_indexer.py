@@ -0,0 +1,86 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from app.config import get_config
+from app.core.logger import get_logger
+from app.indexer.__main__ import IndexBatch, Indexer, read_batches
+from app.indexer.checkpoint import Checkpoint
+from app.services.image_decoder import create_image_decoder
+from app.services.numpy_search import NumpySearch
+
+
+def jpeg(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def indexer(tmp_path, monkeypatch, embedder):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("static")
+    search = NumpySearch(str(tmp_path / "index"), embedder)
+    decoder = create_image_decoder(workers=1, processes=False)
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.jsonl"))
+    yield Indexer(search, decoder, checkpoint, get_logger("indexer"))
+    decoder.close()
+    checkpoint.close()
+    search.close()
+
+
+def run_stages(indexer: Indexer, batch: IndexBatch) -> IndexBatch:
+    for stage in indexer.stages(lambda name, default: 1):
+        batch = stage.fn(batch)
+        assert batch is not None, f"{stage.name} dropped the batch"
+    return batch
+
+
+def test_stages_index_save_and_derive(indexer):
+    batch = IndexBatch(
+        0,
+        {
+            "image": [{"bytes": jpeg("red")}, {"bytes": jpeg("blue")}],
+            "caption": [["a red square"], ["a blue square", "blue"]],
+            "img_id": ["1", "2"],
+            "filename": ["1.jpg", "2.jpg"],
+        },
+    )
+
+    run_stages(indexer, batch)
+
+    assert len(indexer.search.images) == 2
+    assert len(indexer.search.captions) == 3
+    for name in ("1", "2"):
+        assert os.path.exists(f"static/{name}.jpg")
+        for size in indexer.derivative_sizes:
+            path = f"static/derived/{size.name}/{name}.{size.format}"
+            with Image.open(path) as image:
+                assert max(image.size) <= size.max_side
+    assert indexer.checkpoint.is_current("1", batch.hashes[0])
+
+
+class ListSource:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def batches(self, size, limit=None, shard=(0, 1)):
+        yield {key: list(values) for key, values in self._rows.items()}
+
+
+def test_read_batches_holds_out_trailing_captions(monkeypatch):
+    monkeypatch.setitem(get_config().env, "indexer.held_out_captions", "1")
+    source = ListSource(
+        {
+            "image": [{}, {}],
+            "caption": [["a", "b", "c"], ["only"]],
+            "img_id": ["1", "2"],
+            "filename": ["1.jpg", "2.jpg"],
+        }
+    )
+
+    (batch,) = read_batches(source, None, (0, 1), get_logger("indexer"))
+
+    assert batch.captions == [["a", "b"], ["only"]]
@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+
+import pytest
+
+from app.config import get_config
+from app.core.fake_llm import FakeLLMClient, FakeResponse
+from app.core.llm import LLMAdapter
+from app.core.tag_cache import TagCache
+
+
+class BlockingModels:
+    """Answers like the fake client, but only once `release` is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+        self._fake = FakeLLMClient().models
+
+    def generate_content(self, model, contents, config):
+        self.calls += 1
+        self.release.wait(timeout=10)
+        return self._fake.generate_content(model, contents, config)
+
+
+class ScriptedModels:
+    """Returns, or raises, the next of `responses` on every call."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def generate_content(self, model, contents, config):
+        self.requests.append(json.loads(contents))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return FakeResponse(json.dumps(response))
+
+
+class Client:
+    def __init__(self, models):
+        self.models = models
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    def apply(**values):
+        for key, value in values.items():
+            monkeypatch.setitem(get_config().env, key, value)
+
+    apply(**{"llm.cache.enabled": False, "llm.batch.backoff_seconds": 0})
+    return apply
+
+
+def test_identical_concurrent_queries_share_one_request(settings):
+    settings(**{"llm.timeout_seconds": 10})
+    models = BlockingModels()
+    adapter = LLMAdapter(client=Client(models))
+    barrier = threading.Barrier(8)
+    results = []
+
+    def search():
+        barrier.wait()
+        results.append(adapter.generate_tags("A red Sports car"))
+
+    threads = [threading.Thread(target=search) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while models.calls == 0:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    models.release.set()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert models.calls == 1
+    assert results == [["red", "sports", "car"]] * 8
+
+
+def test_cached_tags_survive_reopening_the_database(settings, tmp_path):
+    path = str(tmp_path / "tags.sqlite")
+    first = FakeLLMClient()
+    LLMAdapter(client=first, cache=TagCache(path=path)).generate_tags("red car")
+    assert first.models.calls == 1
+
+    second = FakeLLMClient()
+    cache = TagCache(path=path)
+    adapter = LLMAdapter(client=second, cache=cache)
+
+    # normalized like the first query, so it maps to the same entry
+    assert adapter.generate_tags("  Red   CAR ") == ["red", "car"]
+    assert second.models.calls == 0
+    assert cache.hits == 1
+
+
+def test_timeout_searches_without_tags(settings):
+    settings(**{"llm.timeout_seconds": 0.1})
+    models = BlockingModels()
+    adapter = LLMAdapter(client=Client(models))
+
+    start = time.perf_counter()
+    assert adapter.generate_tags("red car") == []
+    assert time.perf_counter() - start < 2
+    models.release.set()
+
+
+def test_batch_is_chunked_by_items_and_characters(settings):
+    settings(**{"llm.batch.max_items": 2, "llm.batch.max_chars": 30})
+    client = FakeLLMClient()
+    adapter = LLMAdapter(client=client)
+    items = {
+        "1": ["red car"],
+        "2": ["blue car"],
+        "3": ["green car"],
+        "4": ["a very long caption of a yellow car"],
+        "5": ["white car"],
+    }
+
+    chunks = adapter._chunk(items)
+    assert [list(chunk) for chunk in chunks] == [["1", "2"], ["3"], ["4"], ["5"]]
+
+    tags = adapter.generate_tags_batch(items)
+    assert client.models.calls == 4
+    assert tags["4"] == ["very", "long", "caption", "yellow", "car"]
+
+
+def test_batch_retries_failed_requests(settings):
+    settings(**{"llm.batch.max_retries": 2})
+    models = ScriptedModels(
+        [RuntimeError("503"), RuntimeError("503"), [{"id": "1", "tags": ["car"]}]]
+    )
+    adapter = LLMAdapter(client=Client(models))
+
+    assert adapter.generate_tags_batch({"1": ["red car"]}) == {"1": ["car"]}
+    assert len(models.requests) == 3
+
+
+def test_batch_gives_up_after_the_last_retry(settings):
+    settings(**{"llm.batch.max_retries": 1})
+    models = ScriptedModels([RuntimeError("503")] * 2)
+    adapter = LLMAdapter(client=Client(models))
+
+    assert adapter.generate_tags_batch({"1": ["red car"]}) == {"1": []}
+    assert len(models.requests) == 2
+
+
+def test_batch_maps_missing_ids_to_empty_and_drops_unknown_ones(settings):
+    models = ScriptedModels(
+        [[{"id": "1", "tags": ["car"]}, {"id": "not sent", "tags": ["boat"]}]]
+    )
+    adapter = LLMAdapter(client=Client(models))
+
+    tags = adapter.generate_tags_batch({"1": ["red car"], "2": ["blue boat"]})
+
+    assert tags == {"1": ["car"], "2": []}
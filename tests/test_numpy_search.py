@@ -0,0 +1,234 @@
+import glob
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from app.models.exceptions import ValidationError
+from app.models.search import AdditionalWeaviateParams
+from app.services.numpy_search import NumpySearch, VectorTable, normalize
+from app.services.search import IndexableDoc, image_uuid
+
+
+def random_vectors(count: int, dim: int = 32, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, dim))
+
+
+def brute_force(vectors: np.ndarray, query: np.ndarray, k: int):
+    scores = normalize(vectors) @ normalize(query)
+    top = np.argsort(-scores)[:k]
+    return top.tolist(), scores[top]
+
+
+def documents(vectors: np.ndarray, start: int = 0):
+    docs = [
+        IndexableDoc(
+            str(start + i),
+            None,
+            [f"caption {start + i}"],
+            f"static/{start + i}.jpg",
+            ["even" if (start + i) % 2 == 0 else "odd"],
+        )
+        for i in range(len(vectors))
+    ]
+    captions = [[vector.tolist()] for vector in vectors]
+    return docs, vectors.tolist(), captions
+
+
+def image_ids(results):
+    return [result["metadata"]["image_id"] for result in results]
+
+
+def test_top_k_matches_brute_force():
+    vectors = random_vectors(500)
+    table = VectorTable("images")
+    table.upsert([str(i) for i in range(500)], vectors, [{}] * 500)
+    query = random_vectors(1, seed=1)[0]
+
+    ids, _, scores = zip(*table.top_k(query, 10))
+    expected_rows, expected_scores = brute_force(vectors, query, 10)
+
+    assert list(ids) == [str(row) for row in expected_rows]
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+
+def test_top_k_min_similarity():
+    vectors = random_vectors(200)
+    table = VectorTable("images")
+    table.upsert([str(i) for i in range(200)], vectors, [{}] * 200)
+
+    hits = table.top_k(vectors[0], 200, min_similarity=0.3)
+
+    assert hits[0][0] == "0"
+    assert all(similarity >= 0.3 for _, _, similarity in hits)
+
+
+def test_tag_filter():
+    vectors = random_vectors(100)
+    table = VectorTable("images")
+    tags = [{"tags": ["even" if i % 2 == 0 else "odd"]} for i in range(100)]
+    table.upsert([str(i) for i in range(100)], vectors, tags)
+
+    hits = table.top_k(vectors[0], 100, tags=["even"])
+    assert sorted(int(id) for id, _, _ in hits) == list(range(0, 100, 2))
+
+    # re-tagging a row clears its old bit
+    table.upsert(["0"], vectors[:1], [{"tags": ["odd"]}])
+    hits = table.top_k(vectors[0], 100, tags=["even"])
+    assert "0" not in [id for id, _, _ in hits]
+    assert sorted(table.tags()) == ["even", "odd"]
+
+
+def test_upsert_without_rows_is_a_no_op(tmp_path, embedder):
+    table = VectorTable("captions")
+    table.upsert([], np.asarray([]), [])
+    assert len(table) == 0
+
+    search = NumpySearch(str(tmp_path), embedder)
+    doc = IndexableDoc("1", None, [], "static/1.jpg", [])
+    assert search.write_many([doc], random_vectors(1).tolist(), [[]]) == []
+    assert len(search.images) == 1
+    assert len(search.captions) == 0
+
+
+def test_reopen_after_write_and_compaction(tmp_path, embedder):
+    vectors = random_vectors(300)
+    query = random_vectors(1, seed=1)[0].tolist()
+    search = NumpySearch(str(tmp_path), embedder)
+    search.write_many(*documents(vectors[:150]))
+    search.write_many(*documents(vectors[150:], start=150))
+    expected = image_ids(search.image_search_by_vector(query, 10))
+    assert expected == [image_uuid(str(i)) for i in brute_force(vectors, query, 10)[0]]
+
+    # uncompacted segments are replayed on open
+    reopened = NumpySearch(str(tmp_path), embedder)
+    assert len(reopened.images) == 300
+    assert image_ids(reopened.image_search_by_vector(query, 10)) == expected
+
+    search.close()
+    assert len(glob.glob(os.path.join(tmp_path, "segment-*.json"))) == 1
+    compacted = NumpySearch(str(tmp_path), embedder)
+    assert len(compacted.captions) == 300
+    assert image_ids(compacted.image_search_by_vector(query, 10)) == expected
+    assert sorted(compacted.iter_tags()) == ["even", "odd"]
+
+
+def test_search_with_tags(tmp_path, embedder):
+    vectors = random_vectors(50)
+    search = NumpySearch(str(tmp_path), embedder)
+    search.write_many(*documents(vectors))
+
+    results = search.search(
+        "caption 3",
+        5,
+        AdditionalWeaviateParams(tags=["odd"]),
+        query_vector=vectors[3].tolist(),
+    )
+
+    assert results[0]["caption"] == "caption 3"
+    assert all(int(result["image_url"][7:-4]) % 2 == 1 for result in results)
+    with pytest.raises(ValidationError):
+        search.search("caption 3", 5, AdditionalWeaviateParams(mode="keyword"))
+
+
+def test_ivf_recall(tmp_path, embedder):
+    # clustered data, like real embeddings, so the buckets mean something
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((40, 32))
+    vectors = centers[rng.integers(0, 40, 4000)] + 0.3 * rng.standard_normal((4000, 32))
+    queries = centers[rng.integers(0, 40, 50)] + 0.3 * rng.standard_normal((50, 32))
+    search = NumpySearch(str(tmp_path), embedder, ann_min_rows=1000, ann_n_probe=8)
+    search.write_many(*documents(vectors))
+    search.close()
+
+    reopened = NumpySearch(str(tmp_path), embedder, ann_min_rows=1000, ann_n_probe=8)
+    assert reopened.images.ann is not None
+    hits = 0
+    for query in queries:
+        expected = {image_uuid(str(i)) for i in brute_force(vectors, query, 10)[0]}
+        found = image_ids(reopened.image_search_by_vector(query.tolist(), 10))
+        hits += len(expected & set(found))
+    assert hits / (10 * len(queries)) >= 0.9
+
+
+def test_float16(tmp_path, embedder):
+    vectors = random_vectors(300)
+    query = random_vectors(1, seed=1)[0].tolist()
+    search = NumpySearch(str(tmp_path), embedder, dtype="float16")
+    search.write_many(*documents(vectors))
+    search.close()
+
+    reopened = NumpySearch(str(tmp_path), embedder, dtype="float16")
+    assert reopened.images.matrix.dtype == np.float16
+    (segment,) = glob.glob(os.path.join(tmp_path, "segment-*-images.npy"))
+    assert np.load(segment).dtype == np.float16
+    results = reopened.image_search_by_vector(query, 10)
+    expected_rows, expected_scores = brute_force(vectors, np.asarray(query), 10)
+    assert image_ids(results)[:5] == [image_uuid(str(i)) for i in expected_rows[:5]]
+    np.testing.assert_allclose(
+        [result["score"] for result in results], expected_scores, atol=1e-2
+    )
+
+
+def test_rewrite_with_fewer_captions_drops_the_rest(tmp_path, embedder):
+    vectors = random_vectors(4)
+    search = NumpySearch(str(tmp_path), embedder)
+    doc = IndexableDoc("1", None, ["a", "b", "c"], "static/1.jpg", [])
+    other = IndexableDoc("2", None, ["d"], "static/2.jpg", [])
+    search.write_many([doc, other], vectors[:2].tolist(), [vectors[:3], vectors[3:]])
+    doc = IndexableDoc("1", None, ["a"], "static/1.jpg", [])
+    search.write_many([doc], vectors[:1].tolist(), [vectors[:1]])
+
+    def captions(search):
+        hits = search.captions.top_k(vectors[2], 10)
+        return sorted(caption["captionText"] for _, caption, _ in hits)
+
+    assert captions(search) == ["a", "d"]
+    # replayed from the segments, then compacted
+    assert captions(NumpySearch(str(tmp_path), embedder)) == ["a", "d"]
+    search.close()
+    assert captions(NumpySearch(str(tmp_path), embedder)) == ["a", "d"]
+
+
+def test_delete_moves_the_last_row():
+    vectors = random_vectors(10)
+    table = VectorTable("captions")
+    tags = [{"tags": ["even" if i % 2 == 0 else "odd"]} for i in range(10)]
+    table.upsert([str(i) for i in range(10)], vectors, tags)
+
+    table.delete(["2", "missing"])
+
+    assert len(table) == 9 and "2" not in table.rows
+    assert table.ids[table.rows["9"]] == "9"
+    hits = table.top_k(vectors[9], 10, tags=["odd"])
+    assert sorted(id for id, _, _ in hits) == ["1", "3", "5", "7", "9"]
+    assert hits[0][0] == "9"
+
+
+def test_hits_stay_consistent_under_concurrent_deletes():
+    vectors = random_vectors(2000)
+    table = VectorTable("captions")
+    ids = [str(i) for i in range(2000)]
+    table.upsert(ids, vectors, [{"captionText": id} for id in ids])
+    done = threading.Event()
+
+    def churn():
+        for start in range(0, 2000, 20):
+            batch = ids[start : start + 20]
+            table.delete(batch)
+            table.upsert(
+                batch,
+                vectors[start : start + 20],
+                [{"captionText": id} for id in batch],
+            )
+        done.set()
+
+    writer = threading.Thread(target=churn)
+    writer.start()
+    while not done.is_set():
+        for id, props, similarity in table.top_k(vectors[7], 5):
+            assert props["captionText"] == id
+            if id == "7":
+                assert similarity == pytest.approx(1.0, abs=1e-5)
+    writer.join()
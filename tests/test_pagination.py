@@ -0,0 +1,73 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.middleware import GlobalExceptionMiddleware
+from app.api.routes.search import search_router
+from app.models.exceptions import ValidationError
+from app.services import (
+    get_executor,
+    get_image_decoder,
+    get_pager,
+    get_tag_extractor,
+    get_weaviate,
+)
+from app.services.pagination import ResultPager, decode_cursor
+
+
+def ranked(fetched):
+    def fetch(n):
+        fetched.append(n)
+        return [{"rank": i} for i in range(min(n, 10000))]
+
+    return fetch
+
+
+def test_pages_follow_cursors():
+    fetched = []
+    pager = ResultPager(max_results=100)
+    session_id = pager.create(ranked(fetched))
+
+    results, cursor = pager.page(session_id, 0, 10)
+    assert [r["rank"] for r in results] == list(range(10))
+    results, cursor = pager.page(*decode_cursor(cursor), 10)
+    assert [r["rank"] for r in results] == list(range(10, 20))
+    assert fetched == [10, 20]
+
+
+def test_pages_stop_at_max_results():
+    fetched = []
+    pager = ResultPager(max_results=100)
+    session_id = pager.create(ranked(fetched))
+
+    results, cursor = pager.page(session_id, 90, 30)
+    assert len(results) == 10
+    assert cursor is None
+    assert max(fetched) == 100
+    with pytest.raises(ValidationError):
+        pager.page(session_id, 100, 10)
+    with pytest.raises(ValidationError):
+        pager.check_page(95, 10)
+    pager.check_page(90, 10)
+
+
+def test_batch_top_k_is_capped_at_max_results():
+    api = FastAPI()
+    api.include_router(search_router)
+    api.add_middleware(GlobalExceptionMiddleware)
+    for dependency in (
+        get_weaviate,
+        get_executor,
+        get_image_decoder,
+        get_tag_extractor,
+    ):
+        api.dependency_overrides[dependency] = lambda: None
+    api.dependency_overrides[get_pager] = lambda: ResultPager(max_results=100)
+    client = TestClient(api)
+
+    response = client.post(
+        "/search-batch", json={"queries": [{"query": "car", "top_k": 101}]}
+    )
+
+    assert response.status_code == 400
+    assert "100" in response.text
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from app.services.numpy_search import NumpySearch
+from app.services.projection import Projection, vector_space
+from app.services.search import IndexableDoc
+
+
+def fit(dim: int, seed: int = 0) -> Projection:
+    vectors = np.random.default_rng(seed).standard_normal((200, 32))
+    return Projection.fit("fake", vectors, dim)
+
+
+def index(search: NumpySearch):
+    documents = [
+        IndexableDoc(str(i), None, [], f"static/{i}.jpg", []) for i in range(3)
+    ]
+    search.create_collections_if_not_exists()
+    vectors = np.random.default_rng(1).standard_normal((3, 32))
+    search.write_many(documents, search._project(vectors), [[]] * 3)
+    search.close()
+
+
+def test_vector_space_names_model_and_projection():
+    assert vector_space("fake", None) == "fake"
+    assert vector_space("fake", fit(8)) != vector_space("fake", fit(8, seed=1))
+    assert vector_space("fake", fit(8)) == vector_space("fake", fit(8))
+
+
+def test_refuses_index_of_another_projection(tmp_path, embedder):
+    index(NumpySearch(str(tmp_path), embedder, projection=fit(8)))
+
+    NumpySearch(
+        str(tmp_path), embedder, projection=fit(8)
+    ).create_collections_if_not_exists()
+    for projection in (None, fit(8, seed=1), fit(16)):
+        search = NumpySearch(str(tmp_path), embedder, projection=projection)
+        with pytest.raises(ValueError):
+            search.create_collections_if_not_exists()
+
+    # a full reindex records the new space
+    search = NumpySearch(str(tmp_path), embedder)
+    search.create_collections_if_not_exists(force_recreate=True)
+    assert search.stored_vector_space() == "fake"
+
+
+def test_upsert_of_other_dimension_fails(tmp_path, embedder):
+    search = NumpySearch(str(tmp_path), embedder, projection=fit(8))
+    index(search)
+    reopened = NumpySearch(str(tmp_path), embedder)
+    doc = IndexableDoc("9", None, [], "static/9.jpg", [])
+    with pytest.raises(ValueError):
+        reopened.write_many([doc], np.ones((1, 32)).tolist(), [[]])
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from app.services.numpy_search import NumpySearch
+from app.services.ranking import rescale
+from app.services.search import IndexableDoc, image_uuid
+
+
+def candidate(id: str, score: float):
+    return {
+        "image_url": f"static/{id}.jpg",
+        "image_urls": {},
+        "caption": id,
+        "score": score,
+        "metadata": {"caption_id": id, "image_id": image_uuid(id)},
+    }
+
+
+@pytest.fixture
+def search(tmp_path, embedder):
+    search = NumpySearch(str(tmp_path), embedder)
+    # images 1 to 3 point ever further away from the query, image 4 is missing
+    angles = np.radians([60, 70, 80])
+    vectors = np.zeros((3, 32))
+    vectors[:, 0], vectors[:, 1] = np.cos(angles), np.sin(angles)
+    docs = [IndexableDoc(str(i), None, [], f"static/{i}.jpg", []) for i in (1, 2, 3)]
+    search.write_many(docs, vectors.tolist(), [[], [], []])
+    return search
+
+
+def test_rescale():
+    np.testing.assert_allclose(rescale([0.2, 0.25, 0.3], 0.8, 0.9), [0.8, 0.85, 0.9])
+    np.testing.assert_allclose(rescale([0.2, 0.2], 0.8, 0.9), [0.85, 0.85])
+
+
+def test_image_similarity_is_rescaled_before_blending(search):
+    query = np.zeros(32)
+    query[0] = 1
+    results = [candidate("3", 0.9), candidate("2", 0.85), candidate("1", 0.8)]
+
+    reranked = search.rerank(results, query.tolist(), 3, image_weight=0.75)
+
+    # raw image similarities (0.5 to 0.17) would have been swamped by the
+    # caption scale; rescaled they reverse the caption order
+    assert [r["caption"] for r in reranked] == ["1", "2", "3"]
+    assert all(0.8 <= r["score"] <= 0.9 for r in reranked)
+    assert reranked[0]["metadata"]["image_similarity"] == pytest.approx(0.5)
+
+
+def test_missing_image_vector_and_min_similarity(search):
+    query = np.zeros(32)
+    query[0] = 1
+    results = [candidate("4", 0.88), candidate("1", 0.9), candidate("3", 0.8)]
+
+    reranked = search.rerank(results, query.tolist(), 3, 0.5, min_similarity=0.85)
+
+    # 4 has no image vector and keeps its caption score; 3 blends to 0.8
+    assert [(r["caption"], r["score"]) for r in reranked] == [
+        ("1", pytest.approx(0.9)),
+        ("4", pytest.approx(0.88)),
+    ]
@@ -0,0 +1,35 @@
+import hashlib
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.api.middleware as middleware
+from app.api.middleware import StaticFilesHandler, content_etag
+
+
+def test_etag_is_hashed_off_the_event_loop(tmp_path, monkeypatch):
+    data = b"\xff\xd8 not really a jpeg"
+    (tmp_path / "1.jpg").write_bytes(data)
+    threads = []
+    original_sha1 = hashlib.sha1
+
+    def sha1(*args):
+        threads.append(threading.current_thread().name)
+        return original_sha1(*args)
+
+    monkeypatch.setattr(middleware.hashlib, "sha1", sha1)
+    content_etag.cache_clear()
+    api = FastAPI()
+    api.mount("/static", StaticFilesHandler(directory=str(tmp_path)))
+    client = TestClient(api)
+
+    response = client.get("/static/1.jpg")
+    etag = response.headers["ETag"]
+    assert etag == f'"{original_sha1(data).hexdigest()}"'
+    assert response.headers["Content-Type"] == "image/jpeg"
+    assert len(threads) == 1 and threads[0].startswith("AnyIO worker thread")
+
+    response = client.get("/static/1.jpg", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.config import get_config
+from app.core.tags import VocabularyTagExtractor
+from app.services import build_tag_extractor
+from app.services.numpy_search import NumpySearch
+from app.services.search import IndexableDoc
+
+
+@pytest.fixture
+def search(tmp_path, monkeypatch, embedder):
+    env = get_config().env
+    monkeypatch.setitem(env, "tags.extractor", "local")
+    monkeypatch.setitem(env, "tags.vocabulary_path", str(tmp_path / "tags.json"))
+    monkeypatch.setitem(
+        env, "indexer.checkpoint_path", str(tmp_path / "checkpoint.jsonl")
+    )
+    return NumpySearch(str(tmp_path / "index"), embedder)
+
+
+def write(search: NumpySearch, id: str, tags):
+    doc = IndexableDoc(id, None, [], f"static/{id}.jpg", tags)
+    search.write_many([doc], np.ones((1, 32)).tolist(), [[]])
+
+
+def test_vocabulary_is_built_and_reused(tmp_path, search):
+    write(search, "1", ["sports car"])
+    assert build_tag_extractor(search).extract("a red sports car") == ["sports car"]
+    assert VocabularyTagExtractor.load(str(tmp_path / "tags.json")).tags() == [
+        "sports car"
+    ]
+
+    # unchanged index: the saved vocabulary is used as is
+    write(search, "2", ["beach"])
+    assert build_tag_extractor(search).extract("beach") == []
+
+
+def test_vocabulary_older_than_the_index_is_rebuilt(tmp_path, search):
+    write(search, "1", ["sports car"])
+    build_tag_extractor(search)
+    write(search, "2", ["beach"])
+    checkpoint = tmp_path / "checkpoint-0-of-2.jsonl"
+    checkpoint.write_text("")
+    later = os.path.getmtime(tmp_path / "tags.json") + 10
+    os.utime(checkpoint, (later, later))
+
+    assert build_tag_extractor(search).extract("beach") == ["beach"]
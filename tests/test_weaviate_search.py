@@ -0,0 +1,139 @@
+import contextlib
+import uuid
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import numpy as np
+from PIL import Image
+from weaviate.collections.classes.batch import (
+    BatchObject,
+    BatchReference,
+    ErrorObject,
+    ErrorReference,
+)
+
+from app.services.search import IndexableDoc, WeaviateSearch, caption_uuid, image_uuid
+
+
+class FakeBatch:
+    def __init__(self):
+        self.objects: List[Dict[str, Any]] = []
+        self.failed_objects: List[ErrorObject] = []
+        self.failed_references: List[ErrorReference] = []
+
+    @contextlib.contextmanager
+    def fixed_size(self, batch_size: int, concurrent_requests: int):
+        yield self
+
+    def add_object(self, **kwargs: Any):
+        self.objects.append(kwargs)
+
+
+class FakeData:
+    def __init__(self):
+        self.deleted: List[Any] = []
+
+    def delete_many(self, where: Any):
+        self.deleted.append(where)
+
+
+class FakeCollections:
+    def __init__(self):
+        self.data = {"Image": FakeData(), "Caption": FakeData()}
+
+    def get(self, name: str) -> Any:
+        return SimpleNamespace(data=self.data[name])
+
+
+class FakeClient:
+    def __init__(self):
+        self.batch = FakeBatch()
+        self.collections = FakeCollections()
+
+
+class FakePool:
+    def __init__(self, client: FakeClient):
+        self.client = client
+
+    @contextlib.contextmanager
+    def acquire(self):
+        yield self.client
+
+
+def documents(count: int):
+    docs = [
+        IndexableDoc(str(i), None, [f"caption {i}", "shared"], f"static/{i}.jpg", [])
+        for i in range(count)
+    ]
+    vectors = np.random.default_rng(0).standard_normal((count, 8)).tolist()
+    return docs, vectors, [[vector, vector] for vector in vectors]
+
+
+def test_write_many_adds_objects_with_deterministic_uuids(embedder):
+    client = FakeClient()
+    search = WeaviateSearch(FakePool(client), embedder)
+
+    assert search.write_many(*documents(2)) == []
+
+    objects = client.batch.objects
+    assert [obj["collection"] for obj in objects] == ["Image", "Caption", "Caption"] * 2
+    assert objects[0]["uuid"] == image_uuid("0")
+    assert objects[2]["uuid"] == caption_uuid("0", 1)
+    assert objects[2]["references"] == {"forImage": image_uuid("0")}
+    # captions the images no longer have are deleted in one request
+    (where,) = client.collections.data["Caption"].deleted
+    by_image, by_id = where.filters
+    assert by_image.value == [image_uuid("0"), image_uuid("1")]
+    assert len(by_id.value) == 4
+
+
+def test_index_reuses_the_batched_deterministic_path(embedder):
+    client = FakeClient()
+    search = WeaviateSearch(FakePool(client), embedder)
+    doc = IndexableDoc("7", Image.new("RGB", (8, 8)), ["a", "b"], "static/7.jpg", [])
+
+    search.index(doc)
+    search.index(doc)
+
+    uuids = [obj["uuid"] for obj in client.batch.objects]
+    expected = [image_uuid("7"), caption_uuid("7", 0), caption_uuid("7", 1)]
+    assert uuids == expected * 2
+
+
+def test_write_many_reports_failed_objects_and_references(embedder):
+    client = FakeClient()
+    failed_uuid = uuid.UUID(image_uuid("1"))
+    client.batch.failed_objects.append(
+        ErrorObject(
+            "vector too long",
+            BatchObject(collection="Image", uuid=failed_uuid, index=0),
+        )
+    )
+    client.batch.failed_references.append(
+        ErrorReference(
+            "target not found",
+            BatchReference(
+                from_object_collection="Caption",
+                from_object_uuid=caption_uuid("0", 0),
+                from_property_name="forImage",
+                to_object_uuid=image_uuid("0"),
+                index=0,
+            ),
+        )
+    )
+    search = WeaviateSearch(FakePool(client), embedder)
+
+    errors = search.write_many(*documents(2))
+
+    assert errors == [
+        {
+            "collection": "Image",
+            "uuid": str(failed_uuid),
+            "message": "vector too long",
+        },
+        {
+            "collection": "Caption",
+            "uuid": caption_uuid("0", 0),
+            "message": "target not found",
+        },
+    ]